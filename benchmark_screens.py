@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+銘柄ごとのスクリーニング判定のマイクロベンチマーク
+
+合成した株価（APIもキャッシュも使わない）で指標を一括計算したあと、
+ハンマー・ボリンジャー・200日新高値押し目・スクイーズの判定を全銘柄に行い、
+1銘柄あたりの所要時間（マイクロ秒）と検出数を表示する。
+株価の取得・指標の計算は含めず、判定部分だけを測る。
+
+指標は本番と同じ設定（指標の増分状態・遅延計算の既定値）で用意する。増分状態は
+一時ディレクトリに作り、実行環境の状態ファイルは読み書きしない。最後にスクイーズの
+検出数を、増分状態を使わずに全期間を計算した指標での判定と突き合わせる。
+
+使い方:
+    python benchmark_screens.py [--stocks 3800] [--bars 260] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 判定だけを測るため、プロセスプールは使わない（指標の増分状態は本番と同じ既定値）
+os.environ.setdefault('JQUANTS_REFRESH_TOKEN', 'benchmark')
+os.environ['INDICATOR_WORKERS'] = '1'
+
+from daily_data_collection import StockScreener, SCREENING_LAZY_INDICATORS
+from indicator_engine import compute_indicators
+from indicator_state import IndicatorStateStore
+from price_cache import PriceView
+from squeeze_detection import detect_squeeze_panel
+
+SCREENS = [
+    ("screen_stock_breakout", "ハンマー"),
+    ("screen_stock_bollinger_band", "ボリンジャー"),
+    ("screen_stock_200day_pullback", "200日押し目"),
+    ("screen_stock_squeeze", "スクイーズ"),
+]
+
+
+def make_prices(bars: int, seed: int, end_date: datetime) -> PriceView:
+    """乱数で1銘柄分の四本値を作る（一部の銘柄は最新の足で急騰させる）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end_date, periods=bars)
+    close = np.cumprod(1 + rng.normal(0, 0.02, bars)) * 1000
+    open_ = close * (1 + rng.normal(0, 0.01, bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.03, bars)))
+    if seed % 4 == 0:
+        close[-1] *= 1.25
+        high[-1] = max(high[-1], close[-1])
+    frame = pd.DataFrame({
+        'Date': dates,
+        'Open': open_.astype(np.float32),
+        'High': high.astype(np.float32),
+        'Low': low.astype(np.float32),
+        'Close': close.astype(np.float32),
+        'Volume': rng.integers(1000, 10 ** 6, bars),
+    })
+    return PriceView.from_frame(frame)
+
+
+async def run(args) -> int:
+    end_date = datetime(2025, 6, 2)
+    views = {str(1000 + i): make_prices(args.bars, i, end_date) for i in range(args.stocks)}
+    stocks = [{"Code": code, "CoName": f"銘柄{code}", "Mkt": "0111"} for code in views]
+
+    screener = StockScreener()
+    screener.latest_trading_date = end_date
+
+    async def get_price_view(code, start_str, end_str, session, max_age_days=60):
+        return views[code]
+
+    screener.get_price_view = get_price_view
+    if screener.indicator_state is not None:
+        screener.indicator_state = IndicatorStateStore(
+            tempfile.mkdtemp(prefix="benchmark_state_"), high_windows=screener.indicator_state.high_windows
+        )
+        for code, prices in views.items():
+            screener.indicator_state.update(code, prices)
+    # prepare_indicators()のプロセスプールを使わない場合と同じ計算
+    indicators = compute_indicators(views, [] if SCREENING_LAZY_INDICATORS else None,
+                                    state_store=screener.indicator_state, memo=screener.indicator_memo)
+    for bars in (20, 100, 200, 245):
+        screener.indicators[bars] = indicators
+
+    print(f"銘柄数: {args.stocks}  本数: {args.bars}  繰り返し: {args.repeat}  "
+          f"増分状態: {'有効' if screener.indicator_state is not None else '無効'}")
+    detections = {}
+    for method, label in SCREENS:
+        screen = getattr(screener, method)
+        best = None
+        detected = 0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            detected = 0
+            for stock in stocks:
+                if await screen(stock, None):
+                    detected += 1
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        detections[method] = detected
+        print(f"  {label:<8} {best / len(stocks) * 1e6:7.1f} us/銘柄  検出 {detected}")
+
+    expected = int(detect_squeeze_panel(compute_indicators(views))['detected'].sum())
+    if detections["screen_stock_squeeze"] != expected:
+        print(f"NG: スクイーズの検出数が全期間計算での判定と一致しません "
+              f"（{detections['screen_stock_squeeze']} != {expected}）")
+        return 1
+    print(f"OK: スクイーズの検出数が全期間計算での判定と一致（{expected}）")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="銘柄ごとのスクリーニング判定のマイクロベンチマーク")
+    parser.add_argument("--stocks", type=int, default=3800)
+    parser.add_argument("--bars", type=int, default=260)
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（最速の回を表示）")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
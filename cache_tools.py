@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+永続キャッシュのメンテナンス用コマンド
+
+使い方:
+    python cache_tools.py migrate [--cache-dir DIR] [--archive-dir DIR] [--compression zlib|lz4|none] [--force]
+    python cache_tools.py merge SOURCE_DIR [SOURCE_DIR ...] [--cache-dir DIR] [--compression zlib|lz4|none]
+    python cache_tools.py import FILE_OR_DIR [FILE_OR_DIR ...] [--cache-dir DIR] [--retention-bars N]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+from persistent_cache import PersistentPriceCache, DEFAULT_RETENTION_BARS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _parse_compression(value: str):
+    """コマンドライン引数の圧縮方式をPersistentPriceCacheの形式に変換"""
+    return None if value == "none" else value
+
+
+def cmd_migrate(args) -> int:
+    """既存キャッシュを現行のスキーマバージョンに一括変換"""
+    cache = PersistentPriceCache(
+        args.cache_dir,
+        compression=_parse_compression(args.compression),
+        archive_dir=args.archive_dir
+    )
+    cache.migrate_cache_format(force=args.force)
+    # 読み込めないファイルは通常実行時に再取得されるため、失敗があっても終了コードは0
+    return 0
+
+
+def cmd_merge(args) -> int:
+    """複数のキャッシュディレクトリを --cache-dir に統合"""
+    cache = PersistentPriceCache(args.cache_dir, compression=_parse_compression(args.compression))
+    cache.merge_from(args.sources)
+    # 読み込めないファイルは統合対象から外すだけなので、失敗があっても終了コードは0
+    return 0
+
+
+def cmd_import(args) -> int:
+    """J-Quantsの一括ダウンロードファイルからキャッシュを作成"""
+    cache = PersistentPriceCache(
+        args.cache_dir,
+        compression=_parse_compression(args.compression),
+        retention_bars=args.retention_bars or None
+    )
+    stats = cache.import_bulk(args.paths)
+    return 0 if stats["written"] > 0 else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="永続キャッシュのメンテナンス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="既存キャッシュを現行のスキーマバージョンに変換")
+    migrate.add_argument("--cache-dir", default="~/.cache/stock_prices")
+    migrate.add_argument("--archive-dir", default=None, help="アーカイブ層のディレクトリ（指定時はあわせて変換）")
+    migrate.add_argument("--compression", choices=["zlib", "lz4", "none"], default="zlib")
+    migrate.add_argument("--force", action="store_true", help="移行済みマーカーを無視して再確認する")
+    migrate.set_defaults(func=cmd_migrate)
+
+    merge = subparsers.add_parser("merge", help="複数のキャッシュディレクトリを銘柄ごとに統合")
+    merge.add_argument("sources", nargs="+", help="統合元のキャッシュディレクトリ")
+    merge.add_argument("--cache-dir", default="~/.cache/stock_prices", help="統合先（既存の内容も統合対象）")
+    merge.add_argument("--compression", choices=["zlib", "lz4", "none"], default="zlib")
+    merge.set_defaults(func=cmd_merge)
+
+    bulk = subparsers.add_parser("import", help="J-Quantsの一括ダウンロード（CSV・圧縮CSV）からキャッシュを作成")
+    bulk.add_argument("paths", nargs="+", help="CSVファイル、またはCSVを含むディレクトリ")
+    bulk.add_argument("--cache-dir", default="~/.cache/stock_prices")
+    bulk.add_argument("--compression", choices=["zlib", "lz4", "none"], default="zlib")
+    bulk.add_argument("--retention-bars", type=int,
+                      default=int(os.getenv('PERSISTENT_CACHE_RETENTION_BARS', str(DEFAULT_RETENTION_BARS))),
+                      help="1銘柄あたりの保持本数（0なら無制限、既定はスクリーニング実行時と同じ）")
+    bulk.set_defaults(func=cmd_import)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,17 +9,24 @@ import os
 import json
 import logging
 import asyncio
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import aiohttp
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import pytz
 import math
 import psutil
 from price_cache import get_cache
-from persistent_cache import PersistentPriceCache
-from trading_day_helper import get_latest_trading_day, get_date_range_for_screening
+from persistent_cache import BULK_COLUMN_MAPPING, CACHE_PRICE_COLUMNS, PersistentPriceCache
+from indicator_engine import DEFAULT_INDICATORS, PANEL_COLUMNS, IndicatorMemo, IndicatorSet, PricePanel, compute_indicators
+from indicator_pool import IndicatorPool
+from indicator_state import IndicatorStateStore
+from screen_rules import HISTORY, Condition, Indicator, PassRateStore, RuleResult, ScreenRules, isnan, labels, minimum, where
+from squeeze_detection import detect_squeeze_panel, squeeze_values
+from trading_day_helper import get_latest_trading_day, get_date_range_for_trading_bars, load_trading_calendar
 
 # ============================================================
 # スクリーニングオプション設定
@@ -32,6 +39,200 @@ from trading_day_helper import get_latest_trading_day, get_date_range_for_screen
 PULLBACK_EMA_FILTER = "all"  # "10ema", "20ema", "50ema", "all" (いずれか)
 PULLBACK_STOCHASTIC_FILTER = False  # True: ストキャス売られすぎのみ, False: 全て
 
+# 各スクリーニングで必要な取引日の本数
+HAMMER_LOOKBACK_BARS = 245  # 52週高値（東証の年間営業日数）
+BOLLINGER_LOOKBACK_BARS = 20  # 20SMA・20本の標準偏差
+PULLBACK_LOOKBACK_BARS = 200  # 200日新高値
+SQUEEZE_LOOKBACK_BARS = 100  # 50EMA・60日間の最小値・継続日数
+
+# 指標を全銘柄まとめて計算するスクリーニング（関数名 → (取得本数, 永続キャッシュの有効日数)）
+# process_stocks_multi()は先に全銘柄の株価を揃えて指標を一括計算し、各銘柄の判定は値を引くだけにする
+# 複数の手法をまとめて実行する場合は最も長い本数で1度だけ取得し、指標を共有する
+SCREEN_PRICE_WINDOWS = {
+    "screen_stock_breakout": (HAMMER_LOOKBACK_BARS, 60),
+    "screen_stock_bollinger_band": (BOLLINGER_LOOKBACK_BARS, 60),
+    "screen_stock_200day_pullback": (PULLBACK_LOOKBACK_BARS, 220),
+    "screen_stock_squeeze": (SQUEEZE_LOOKBACK_BARS, 60),
+}
+
+# ------------------------------------------------------------
+# スクリーニング条件（screen_rules.ScreenRules）
+# 条件は全銘柄分まとめて評価し、銘柄ごとの判定は結果を引くだけにする。
+# 評価の順序は前回までの通過率とコストで決まる（並べた順は初回・同順位のときの順序）。
+# 条件名は各手法の統計dict（perfect_order_stats・pullback_stats）のキーと揃える。
+# 統計の通過数は「その条件を評価した銘柄のうち通過した数」になる（割合は
+# format_condition_count()で、評価した銘柄数に対して表示する）。
+# ------------------------------------------------------------
+OPEN = Indicator("open")
+HIGH = Indicator("high")
+LOW = Indicator("low")
+CLOSE = Indicator("close")
+
+# ハンマー（下髭）型
+HAMMER_MIN_BARS = 100  # 52週高値判定のために必要な最小データ数
+HAMMER_BOTTOM_ZONE_DROP_PCT = 20.0  # 「底値圏」とみなす52週高値からの下落率(%)
+HAMMER_STOCHASTIC_OVERSOLD_MAX = 20.0  # ストキャスティクス「売られすぎ」の閾値(%K)
+HAMMER_EMA50_DEVIATION_MIN_PCT = 5.0  # 50EMAからの下方乖離の最低ライン(%)
+HAMMER_SHADOW_RATIO_MIN = 45.0  # 下髭比率(%)の下限
+HAMMER_SHADOW_BODY_MIN = 1.0  # 下髭÷実体の下限
+HAMMER_CLOSE_POSITION_MIN = 0.7  # 終値の当日レンジ内位置の下限
+HAMMER_BEARISH_SHADOW_RATIO_MIN = 60.0  # 陰線でも通す下髭比率(%)
+
+_hammer_ema50 = Indicator("ema", 50)
+_hammer_year_high = Indicator("window_high", HISTORY)  # 取得した全期間（245営業日）の高値
+_hammer_drop_pct = (_hammer_year_high - CLOSE) / _hammer_year_high * 100
+_hammer_ema_deviation_pct = where(_hammer_ema50 > 0, (_hammer_ema50 - CLOSE) / _hammer_ema50 * 100, 0)
+_hammer_range = HIGH - LOW
+_hammer_body = abs(CLOSE - OPEN)
+_hammer_lower_shadow = minimum(OPEN, CLOSE) - LOW
+_hammer_shadow_ratio = _hammer_lower_shadow / _hammer_range * 100
+_hammer_shadow_to_body = where(_hammer_body > 0, _hammer_lower_shadow / _hammer_body, 999.9)
+_hammer_close_position = (CLOSE - LOW) / _hammer_range
+_hammer_stoch_k = Indicator("stoch_k", 14, 3)
+
+HAMMER_RULES = ScreenRules("hammer", [
+    # NaNが混じった銘柄は比較が常に偽になり条件を素通りするため、先に除外する
+    Condition("valid_prices", ~(isnan(OPEN) | isnan(HIGH) | isnan(LOW) | isnan(CLOSE) | isnan(_hammer_ema50)), counted=False),
+    Condition("positive_close", CLOSE > 0, counted=False),
+    Condition("valid_year_high", _hammer_year_high > 0, counted=False),
+    # 0a. 52週高値から20%以上下落（底値圏に限定）
+    Condition("passed_bottom_zone", _hammer_drop_pct >= HAMMER_BOTTOM_ZONE_DROP_PCT),
+    # 0b. ストキャスティクス%Kが売られすぎ水準
+    Condition("passed_stochastic", _hammer_stoch_k <= HAMMER_STOCHASTIC_OVERSOLD_MAX),
+    # 0c. 終値が50EMAから5%以上下方乖離（EMA付近のノイズ的な下髭を除外）
+    Condition("passed_ema_deviation", _hammer_ema_deviation_pct >= HAMMER_EMA50_DEVIATION_MIN_PCT),
+    # 四本値が全て同じ足は除外
+    Condition("has_range", _hammer_range > 0, counted=False),
+    # 1. 下髭比率 >= 45%
+    Condition("passed_shadow_ratio", _hammer_shadow_ratio >= HAMMER_SHADOW_RATIO_MIN),
+    # 2. 下髭 >= 実体 × 1.0倍（十字線は条件スキップ）
+    Condition("passed_shadow_body", ~((_hammer_body > 0) & (_hammer_shadow_to_body < HAMMER_SHADOW_BODY_MIN))),
+    # 3. 終値が当日レンジの上位30%以内
+    Condition("passed_close_position", _hammer_close_position >= HAMMER_CLOSE_POSITION_MIN),
+    # 4. 陽線 または 下髭比率60%以上の強い陰線
+    Condition("passed_bullish", ~((CLOSE < OPEN) & (_hammer_shadow_ratio < HAMMER_BEARISH_SHADOW_RATIO_MIN))),
+], outputs={
+    "price": CLOSE,
+    "pullback_pct": (_hammer_shadow_ratio, 1),  # 下髭比率(%) ← ソート①
+    "stochastic_k": (minimum(_hammer_shadow_to_body, 99.9), 2),  # 下髭÷実体 ← ソート②
+    "stochastic_d": (_hammer_ema_deviation_pct, 1),  # 50EMA下方乖離(%) ※旧: 上髭比率
+    "upper_3sigma": (_hammer_drop_pct, 1),  # 52週高値からの下落率(%) ※旧: 未使用列を流用
+    "week52_high": (_hammer_year_high, 2),  # 52週（245営業日）高値
+    "ema20": (_hammer_lower_shadow, 2),  # 下髭の長さ（円）
+    "ema50": (_hammer_body, 2),  # 実体の長さ（円）
+})
+
+# ボリンジャーバンド（±3σタッチ）
+_bb_sma20 = Indicator("sma", 20)
+_bb_std20 = Indicator("std", 20)
+_bb_upper3 = _bb_sma20 + (_bb_std20 * 3)
+_bb_lower3 = _bb_sma20 - (_bb_std20 * 3)
+
+BOLLINGER_RULES = ScreenRules("bollinger_band", [
+    Condition("touched", (CLOSE >= _bb_upper3) | (CLOSE <= _bb_lower3)),
+], outputs={
+    "price": CLOSE,
+    "sma20": _bb_sma20,
+    "upper_3sigma": _bb_upper3,
+    "lower_3sigma": _bb_lower3,
+    "touch_direction": where(CLOSE >= _bb_upper3, "upper", "lower"),
+})
+
+# 200日新高値押し目
+PULLBACK_MIN_BARS = 100  # 200日最高値の判定に必要な最小データ数
+PULLBACK_HIGH_WITHIN_BARS = 60  # 200日新高値を更新してからの本数の上限
+PULLBACK_MIN_PCT = 5.0  # 新高値からの下落率(%)の下限（未満は高値圏そのもの）
+PULLBACK_MAX_PCT = 30.0  # 新高値からの下落率(%)の上限（超えるとトレンド崩壊の可能性）
+PULLBACK_STOCHASTIC_OVERSOLD_MAX = 20.0  # ストキャスティクスフィルターの閾値(%K)
+PULLBACK_EMA50_RISING_MIN_PCT = 3.0  # EMA50の20日騰落率(%)の下限（横ばいを除外）
+
+_pb_high = Indicator("window_high", PULLBACK_LOOKBACK_BARS)
+_pb_pct = ((_pb_high - CLOSE) / _pb_high) * 100
+_pb_emas = {span: Indicator("ema", span) for span in (10, 20, 50)}
+# 4本値のいずれかがEMAにタッチ（安値≦EMA≦高値）し、かつ終値がEMA以上（下抜けを除外）
+_pb_touch = {span: (LOW <= ema) & (ema <= HIGH) & (CLOSE >= ema) for span, ema in _pb_emas.items()}
+_pb_ema50_ago = Indicator("ema", 50, ago=19)
+_pb_ema50_rise_pct = where(_pb_ema50_ago > 0, (_pb_emas[50] - _pb_ema50_ago) / _pb_ema50_ago * 100, 0)
+_pb_stoch_k = Indicator("stoch_k", 14, 3)
+
+PULLBACK_RULES = ScreenRules("200day_pullback", [
+    # 1. 過去60日以内に200日新高値を更新
+    Condition("recent_high", Indicator("bars_since_high", PULLBACK_LOOKBACK_BARS) <= PULLBACK_HIGH_WITHIN_BARS),
+    # 2. 200日新高値から 5%〜30% の押し目
+    Condition("within_30pct", (_pb_pct >= PULLBACK_MIN_PCT) & (_pb_pct <= PULLBACK_MAX_PCT)),
+    # EMAごとのタッチ数（絞り込みはany_ema_touchで行う）
+    Condition("ema10_touch", _pb_touch[10], required=False),
+    Condition("ema20_touch", _pb_touch[20], required=False),
+    Condition("ema50_touch", _pb_touch[50], required=False),
+    Condition("any_ema_touch", _pb_touch[10] | _pb_touch[20] | _pb_touch[50]),
+] + ([
+    # EMAフィルター（指定したEMAにタッチした銘柄のみ）
+    Condition("ema_filter", _pb_touch[int(PULLBACK_EMA_FILTER[:-3])], counted=False),
+] if PULLBACK_EMA_FILTER != "all" else []) + ([
+    # ストキャスティクスフィルター（売られすぎのみ。%Kが無い銘柄は通す）
+    Condition("stochastic_filter", ~(_pb_stoch_k > PULLBACK_STOCHASTIC_OVERSOLD_MAX), counted=False),
+] if PULLBACK_STOCHASTIC_FILTER else []) + [
+    # 3. EMA50が20日前より3%以上上昇（実質横ばいの銘柄を除外）
+    Condition("ema50_rising", _pb_ema50_rise_pct >= PULLBACK_EMA50_RISING_MIN_PCT),
+], outputs={
+    "price": CLOSE,
+    "high_200day": _pb_high,
+    "pullback_pct": (_pb_pct, 2),
+    "touched_emas": labels([(f"{span}EMA", touch) for span, touch in _pb_touch.items()]),
+    "ema_10": _pb_emas[10],
+    "ema_20": _pb_emas[20],
+    "ema_50": _pb_emas[50],
+    "stochastic_k": (_pb_stoch_k, 2),
+    "stochastic_d": (Indicator("stoch_d", 14, 3), 2),
+})
+
+# 関数名 → 手法の条件。最新の足だけで決まる必須の条件（ScreenRules.latest_bar_rules()）は、
+# process_stocks_multi()で株価の履歴を取得する前の絞り込みに使う
+SCREEN_RULES = {
+    "screen_stock_breakout": HAMMER_RULES,
+    "screen_stock_bollinger_band": BOLLINGER_RULES,
+    "screen_stock_200day_pullback": PULLBACK_RULES,
+}
+
+# 関数名 → 手法の統計dictの属性名（事前の絞り込みで除外した銘柄もこの統計に数える）
+SCREEN_STATS = {
+    "screen_stock_breakout": "perfect_order_stats",
+    "screen_stock_200day_pullback": "pullback_stats",
+}
+
+# 永続キャッシュのプリロード（スクリーニング開始前に対象銘柄のキャッシュを一括読み込み）
+PERSISTENT_CACHE_PRELOAD = os.getenv('PERSISTENT_CACHE_PRELOAD', 'true').lower() == 'true'
+PERSISTENT_CACHE_PRELOAD_WORKERS = int(os.getenv('PERSISTENT_CACHE_PRELOAD_WORKERS', '8'))
+# 取引カレンダーの取得期間（暦日）。最長の245営業日を数えられるよう余裕を持たせる
+TRADING_CALENDAR_LOOKBACK_DAYS = 400
+# 永続キャッシュの圧縮方式（"zlib" / "lz4" / "none"）
+PERSISTENT_CACHE_COMPRESSION = os.getenv('PERSISTENT_CACHE_COMPRESSION', 'zlib')
+# 永続キャッシュの保持本数（各スクリーニングで必要な本数の最大）。0なら無制限
+PERSISTENT_CACHE_RETENTION_BARS = int(os.getenv(
+    'PERSISTENT_CACHE_RETENTION_BARS',
+    str(max(HAMMER_LOOKBACK_BARS, BOLLINGER_LOOKBACK_BARS, PULLBACK_LOOKBACK_BARS))
+))
+# 保持本数を超えた古いデータの退避先（空なら破棄）
+PERSISTENT_CACHE_ARCHIVE_DIR = os.getenv('PERSISTENT_CACHE_ARCHIVE_DIR', '')
+# 差分に株式分割等を検出したときの対応（"rescale": キャッシュを調整 / "refetch": その銘柄を再取得）
+PERSISTENT_CACHE_ADJUSTMENT_POLICY = os.getenv('PERSISTENT_CACHE_ADJUSTMENT_POLICY', 'rescale')
+# 指標の増分状態を永続キャッシュの隣に保存し、新しい足の分だけ更新する
+INDICATOR_STATE = os.getenv('INDICATOR_STATE', 'true').lower() == 'true'
+# 指標のメモの件数上限（銘柄 × 指標 × 本数ごとに1件、足方向の指標は1件で最大2KB程度）。0なら無制限
+INDICATOR_MEMO_MAX_ENTRIES = int(os.getenv('INDICATOR_MEMO_MAX_ENTRIES', '100000'))
+# 指標計算のワーカープロセス数（0なら実行環境のCPU数、1ならイベントループのスレッドで計算）
+INDICATOR_WORKERS = int(os.getenv('INDICATOR_WORKERS', '0')) or (os.cpu_count() or 1)
+# ワーカーに渡す1回分の銘柄数（取得済みの銘柄がこの数に達するごとに計算を投げる）
+INDICATOR_CHUNK_SIZE = int(os.getenv('INDICATOR_CHUNK_SIZE', '500'))
+# run_screening()で全手法を1回の走査で判定する（falseなら手法ごとに全銘柄を走査）
+SCREENING_SINGLE_PASS = os.getenv('SCREENING_SINGLE_PASS', 'true').lower() == 'true'
+# スクリーニング条件を前回までの通過率とコストで並べ替え、安く絞り込めるものから評価する
+SCREENING_ADAPTIVE_ORDER = os.getenv('SCREENING_ADAPTIVE_ORDER', 'true').lower() == 'true'
+# 指標を事前に全銘柄分計算せず、条件の評価で残った銘柄の分だけ計算する（プロセスプール使用時は事前計算）
+SCREENING_LAZY_INDICATORS = os.getenv('SCREENING_LAZY_INDICATORS', 'true').lower() == 'true'
+# 最新取引日の全銘柄の足を1度に取得し、最新の足だけで決まる条件を満たす銘柄だけ履歴を取得する
+SCREENING_SNAPSHOT_PREFILTER = os.getenv('SCREENING_SNAPSHOT_PREFILTER', 'true').lower() == 'true'
+
 # ============================================================
 
 # スクリプトのディレクトリを基準とした相対パス
@@ -83,6 +284,19 @@ def safe_int(value, default=None):
     except (ValueError, TypeError):
         return default
 
+def format_condition_count(stats, name):
+    """
+    統計dictの条件の通過数を「N銘柄 (評価M銘柄中 x%)」の形で返す
+    
+    条件は通過率とコストの順に評価するため、割合は並べた順の前の条件の通過数
+    ではなく、その条件を評価した銘柄数（stats['evaluated']）に対するもの。
+    """
+    passed = stats.get(name, 0)
+    evaluated = stats.get('evaluated', {}).get(name, 0)
+    if evaluated == 0:
+        return f"{passed:,}銘柄 (評価した銘柄なし)"
+    return f"{passed:,}銘柄 (評価{evaluated:,}銘柄中 {passed / evaluated * 100:.2f}%)"
+
 
 class SupabaseClient:
     """Supabase クライアント"""
@@ -454,7 +668,9 @@ class AsyncJQuantsClient:
                             "H": "High",
                             "L": "Low",
                             "C": "Close",
-                            "V": "Volume"
+                            "V": "Volume",
+                            "Vo": "Volume",
+                            "AdjFactor": "AdjustmentFactor"
                         }
                         df = df.rename(columns=column_mapping)
                         return df
@@ -472,6 +688,63 @@ class AsyncJQuantsClient:
                 return await self.get_prices_daily_quotes(session, code, from_date, to_date, retry + 1)
             logger.warning(f"株価データ取得失敗 [{code}]: {e}")
             return None
+    
+    async def get_prices_daily_quotes_by_date(self, session: aiohttp.ClientSession, date: str, retry: int = 0):
+        """
+        指定日の全銘柄の日次株価データを取得（V1/V2対応、ページング・リトライ機能付き）
+        
+        Args:
+            session: aiohttp セッション
+            date: 対象日（YYYYMMDD形式）
+        
+        Returns:
+            Code列を含むV1形式の列名のDataFrame（取得できなければNone）
+        """
+        if self.api_version == "v1" and not self.id_token:
+            await self.authenticate(session)
+        
+        try:
+            # V2 API: /equities/bars/daily
+            if self.api_version == "v2":
+                url = f"{self.base_url}/equities/bars/daily"
+                key = "data"
+            # V1 API: /prices/daily_quotes
+            else:
+                url = f"{self.base_url}/prices/daily_quotes"
+                key = "daily_quotes"
+            
+            headers = self._get_headers()
+            params = {"date": date}
+            rows = []
+            while True:
+                async with session.get(url, headers=headers, params=params) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+                
+                # レート制限対応: APIコール後に待機
+                await asyncio.sleep(API_CALL_DELAY)
+                
+                rows.extend(data.get(key) or [])
+                # 件数が多い場合は続きのページをpagination_keyで取得する
+                pagination_key = data.get("pagination_key")
+                if not pagination_key:
+                    break
+                params = {"date": date, "pagination_key": pagination_key}
+            
+            if not rows:
+                return None
+            df = pd.DataFrame(rows)
+            # V2 APIのカラム名をV1形式に変換
+            if self.api_version == "v2":
+                df = df.rename(columns=BULK_COLUMN_MAPPING)
+            return df
+        
+        except Exception as e:
+            if retry < RETRY_COUNT:
+                await asyncio.sleep(RETRY_DELAY)
+                return await self.get_prices_daily_quotes_by_date(session, date, retry + 1)
+            logger.warning(f"全銘柄の株価データ取得失敗 [{date}]: {e}")
+            return None
 
 
 def sample_stocks_balanced(stocks, max_per_range=10):
@@ -582,8 +855,32 @@ class StockScreener:
         self.session = None
         self.progress = {"total": 0, "processed": 0, "detected": 0}
         self.cache = get_cache()  # メモリキャッシュインスタンス
-        self.persistent_cache = PersistentPriceCache()  # 永続キャッシュインスタンス
+        self.persistent_cache = PersistentPriceCache(  # 永続キャッシュインスタンス
+            compression=None if PERSISTENT_CACHE_COMPRESSION == "none" else PERSISTENT_CACHE_COMPRESSION,
+            retention_bars=PERSISTENT_CACHE_RETENTION_BARS or None,
+            archive_dir=PERSISTENT_CACHE_ARCHIVE_DIR or None,
+            adjustment_policy=PERSISTENT_CACHE_ADJUSTMENT_POLICY
+        )
         self.latest_trading_date = None  # 最新の取引日（キャッシュ）
+        self.trading_days: List[str] = []  # 取引カレンダー（load_trading_calendar()で設定）
+        self.indicators: Dict[int, IndicatorSet] = {}  # 取得本数 → 全銘柄の指標（prepare_indicators()で計算）
+        self.indicator_memo = IndicatorMemo(INDICATOR_MEMO_MAX_ENTRIES or None)  # 指標のメモ（手法をまたいで共有）
+        self.screen_elapsed_ms: Dict[str, int] = {}  # 手法名 → 直近のprocess_stocks_multi()での所要時間
+        self._date_ranges: Dict[Tuple, tuple] = {}  # (最新取引日, カレンダー本数, 本数) → 日付範囲
+        self._stale_cutoffs: Dict[str, np.datetime64] = {}  # 終了日 → これより前の最新足は古いとみなす日時
+        self._rule_results: Dict[str, Tuple[IndicatorSet, RuleResult]] = {}  # 条件名 → (評価したIndicatorSet, 結果)
+        self._squeeze_result: Optional[Tuple[IndicatorSet, Any]] = None  # (判定したIndicatorSet, 結果または例外)
+        self.prefilter_stats: Dict[str, Dict[str, Any]] = {}  # 関数名 → 事前の絞り込みで除外した銘柄の条件別の集計
+        self.rule_pass_rates = PassRateStore(  # 条件ごとの通過率（評価順の決定用、無効ならNone）
+            self.persistent_cache.cache_dir
+        ) if SCREENING_ADAPTIVE_ORDER else None
+        self.indicator_state = IndicatorStateStore(  # 指標の増分状態（無効ならNone）
+            self.persistent_cache.cache_dir,
+            high_windows=(PULLBACK_LOOKBACK_BARS, HAMMER_LOOKBACK_BARS)
+        ) if INDICATOR_STATE else None
+        self.indicator_pool = IndicatorPool(  # 指標計算のプロセスプール（ワーカー1つならNone）
+            INDICATOR_WORKERS, chunk_size=INDICATOR_CHUNK_SIZE
+        ) if INDICATOR_WORKERS > 1 else None
     
     async def get_latest_trading_date(self):
         """最新の取引日を取得（検出銘柄の有無に関わらず）"""
@@ -594,6 +891,273 @@ class StockScreener:
             latest_date = await get_latest_trading_day(self.jq_client, session)
             return latest_date  # datetimeオブジェクトのまま返す（各run_*.pyでstrftime変換）
     
+    async def load_trading_calendar(self, lookback_days: int = TRADING_CALENDAR_LOOKBACK_DAYS):
+        """永続キャッシュの欠損検出に使う取引カレンダーを取得して設定"""
+        end_date = self.latest_trading_date or datetime.now()
+        async with aiohttp.ClientSession() as session:
+            await self.jq_client.authenticate(session)
+            trading_days = await load_trading_calendar(
+                self.jq_client, session,
+                end_date - timedelta(days=lookback_days), end_date,
+                cache_dir=str(self.persistent_cache.cache_dir)
+            )
+        if trading_days:
+            self.trading_days = trading_days
+            self.persistent_cache.set_trading_calendar(trading_days)
+        return trading_days
+    
+    def get_date_range_for_bars(self, bars: int) -> tuple:
+        """最新取引日までの取引日bars本分の日付範囲（カレンダー未取得なら暦日で近似）"""
+        # 銘柄ごとに呼ばれるため、最新取引日・カレンダーが同じ間は計算結果を使い回す
+        key = (self.latest_trading_date, len(self.trading_days), bars)
+        date_range = self._date_ranges.get(key)
+        if date_range is None:
+            date_range = get_date_range_for_trading_bars(self.latest_trading_date, bars, self.trading_days)
+            self._date_ranges[key] = date_range
+        return date_range
+    
+    def is_stale(self, prices, end_str: str) -> bool:
+        """
+        最新の足が終了日（YYYYMMDD）から1日を超えて古いか
+        
+        (終了日 - 最新足の日付).days > 1 と同じ判定を、終了日ごとに求めた
+        境界の日時との比較1回で行う（銘柄ごとに日付へ変換しない）。
+        """
+        cutoff = self._stale_cutoffs.get(end_str)
+        if cutoff is None:
+            end_date = datetime.strptime(end_str, '%Y%m%d')
+            cutoff = np.datetime64(end_date - timedelta(days=1), 'ns')
+            self._stale_cutoffs[end_str] = cutoff
+        return bool(prices['Date'][-1] < cutoff)
+    
+    def preload_persistent_cache(self, stocks: List[Dict]):
+        """スクリーニング対象銘柄の永続キャッシュを事前に一括読み込み"""
+        if not PERSISTENT_CACHE_PRELOAD:
+            return None
+        codes = [stock["Code"] for stock in stocks]
+        return self.persistent_cache.preload(codes, max_workers=PERSISTENT_CACHE_PRELOAD_WORKERS)
+    
+    async def get_price_view(self, code: str, start_str: str, end_str: str,
+                             session: aiohttp.ClientSession, max_age_days: int = 60):
+        """株価履歴を メモリキャッシュ → 永続キャッシュ → API の順に取得
+        
+        メモリキャッシュは銘柄ごとに最も広い期間を保持するため、同じプロセスで
+        ハンマー（245本）の後にボリンジャー（20本）を実行した場合などは
+        切り出しだけで済む。戻り値は読み取り専用のPriceViewで、
+        指標は列を追加せず別の配列として計算すること。
+        """
+        def fetch_from_persistent(from_date, to_date):
+            return self.persistent_cache.get_or_fetch_incremental(
+                code, from_date, to_date,
+                lambda f, t: self.jq_client.get_prices_daily_quotes(session, code, f, t),
+                max_age_days=max_age_days
+            )
+        
+        # 永続キャッシュが過去の行を書き換えた銘柄（株式分割の調整など）はメモリキャッシュの期間を作り直す
+        return await self.cache.get_or_fetch_view(code, start_str, end_str, fetch_from_persistent,
+                                                  version_func=self.persistent_cache.rewritten_at)
+    
+    def write_cache_stats(self, method_name: str):
+        """メモリ・永続キャッシュの統計をログディレクトリにJSONで書き出す"""
+        path = LOG_DIR / f"cache_stats_{method_name}_{datetime.now().strftime('%Y%m%d')}.json"
+        try:
+            return self.persistent_cache.write_stats(path, extra={
+                "memory": self.cache.get_stats(),
+                "indicator_memo": self.indicator_memo.get_stats()
+            })
+        except Exception as e:
+            logger.warning(f"キャッシュ統計の書き出しエラー: {e}")
+            return None
+    
+    async def prepare_indicators(self, stocks: List[Dict], session: aiohttp.ClientSession,
+                                 bars: int, max_age_days: int, method_name: str) -> IndicatorSet:
+        """
+        全銘柄の株価（取引日bars本分）を取得し、指標をまとめて計算する
+        
+        取得した株価はメモリキャッシュに残るため、続く銘柄ごとの判定では
+        APIを呼ばずに同じビューが返り、指標はget_indicators()で引くだけになる。
+        プロセスプールが有効なら、取得済みの銘柄をINDICATOR_CHUNK_SIZE件ずつ
+        ワーカーに渡し、株価の取得と並行して計算する。
+        """
+        start_str, end_str = self.get_date_range_for_bars(bars)
+        pool = self.indicator_pool
+        pool_indicators = DEFAULT_INDICATORS + [("window_high", bars), ("bars_since_high", bars)]
+        views = {}
+        chunk = {}
+        tasks = []
+        for i, stock in enumerate(stocks, 1):
+            code = stock["Code"]
+            try:
+                views[code] = await self.get_price_view(code, start_str, end_str, session, max_age_days=max_age_days)
+                chunk[code] = views[code]
+            except Exception as e:
+                logger.debug(f"株価取得エラー [{code}]: {e}")
+            
+            if pool is not None and len(chunk) >= pool.chunk_size:
+                tasks.append(pool.submit(chunk, pool_indicators))
+                chunk = {}
+            
+            if i % 100 == 0:
+                logger.info(f"{method_name}: 株価取得 {i}/{len(stocks)}")
+            
+            # レート制限対応: APIコール後に待機
+            await asyncio.sleep(API_CALL_DELAY)
+        
+        self.update_indicator_state(views)
+        if pool is None:
+            # 遅延計算なら事前計算は増分状態の値の設定だけにし、残りは条件の評価で必要な銘柄の分だけ計算する
+            self.indicators[bars] = compute_indicators(views, [] if SCREENING_LAZY_INDICATORS else None,
+                                                       state_store=self.indicator_state,
+                                                       memo=self.indicator_memo)
+        else:
+            if chunk:
+                tasks.append(pool.submit(chunk, pool_indicators))
+            started = time.perf_counter()
+            indicators = await pool.gather(tasks)
+            waited = time.perf_counter() - started
+            indicators.memoize(self.indicator_memo)
+            applied = self.indicator_state.apply(indicators) if self.indicator_state is not None else 0
+            indicators.compute_all()
+            logger.info(f"指標一括計算（{pool.max_workers}プロセス）: {len(indicators.panel)}銘柄 × "
+                        f"{indicators.panel.bars}本 ({len(tasks)}回に分割, ワーカー計算{indicators.compute_seconds * 1000:.0f}ms, "
+                        f"取得完了後の待ち{waited * 1000:.0f}ms, 増分状態{applied}銘柄)")
+            self.indicators[bars] = indicators
+        if self.indicator_state is not None:
+            self.indicator_state.log_stats()
+        return self.indicators[bars]
+    
+    def update_indicator_state(self, views: Dict[str, object]) -> None:
+        """
+        取得した銘柄の指標の増分状態を更新・保存する
+        
+        前回から追加された足だけを反映し、永続キャッシュの履歴が書き換えられた銘柄
+        （欠損補完・調整イベントなど）や初回は、キャッシュの全期間から再計算する。
+        書き換えの記録は株価の取得時に読んだ値を使い、キャッシュのエントリは
+        再計算する銘柄の分だけ読み直す。
+        """
+        if self.indicator_state is None:
+            return
+        for code, prices in views.items():
+            if len(prices) == 0:
+                continue
+            
+            def history(code=code, prices=prices):
+                entry = self.persistent_cache.get_entry(code)
+                return prices if entry is None or entry['df'].empty else entry['df']
+            
+            try:
+                self.indicator_state.update(code, prices, self.persistent_cache.rewritten_at(code), history=history)
+            except Exception as e:
+                logger.debug(f"指標状態の更新エラー [{code}]: {e}")
+        self.indicator_state.save()
+    
+    def get_indicators(self, code: str, prices, bars: int) -> Tuple[IndicatorSet, int]:
+        """
+        銘柄の指標セットと列番号を返す
+        
+        prepare_indicators()で計算済みならその値を使う（取得本数が違っても、同じ
+        最終足までの履歴を含むパネルがあれば共有する）。未計算の銘柄や、計算後に
+        履歴が更新された銘柄は、その1銘柄分だけ同じ方法で計算する（指標メモに
+        ある値は計算し直さない）。
+        """
+        candidates = [self.indicators[bars]] if bars in self.indicators else []
+        candidates += [indicators for key, indicators in self.indicators.items() if key != bars]
+        for indicators in candidates:
+            col = indicators.panel.column(code, prices)
+            if col is not None:
+                return indicators, col
+        return IndicatorSet(PricePanel.from_views({code: prices}), memo=self.indicator_memo), 0
+    
+    def get_indicator_series(self, code: str, prices, name: str, *params) -> np.ndarray:
+        """
+        銘柄の指標の系列を返す（指標の値を返すAPI向け）
+        
+        スクリーニングで計算済みの値・指標メモを使い、無ければ計算してメモする。
+        
+        Args:
+            code: 銘柄コード
+            prices: 株価（PriceView・DataFrame）
+            name: 指標名（indicator_engine.INDICATORSのキー）
+            *params: 指標のパラメータ
+        
+        Returns:
+            pricesの各足に対応する配列（最高値などの窓の集計は1つの値）
+        """
+        indicators, col = self.get_indicators(code, prices, len(prices))
+        values = indicators.series(name, *params)
+        if values.ndim == 1:
+            return values[col]
+        return values[-min(len(prices), len(values)):, col]
+    
+    def evaluate_rules(self, rules: ScreenRules, indicators: IndicatorSet) -> RuleResult:
+        """
+        手法の条件を全銘柄分まとめて評価する（同じIndicatorSetに対しては1度だけ）
+        
+        1回の走査で全手法が指標を共有する場合、各手法の条件は最初の銘柄で
+        全銘柄分を評価し、以降の銘柄は結果を引くだけになる。条件は前回までの
+        通過率とコストから決めた順に評価し、今回の通過率を保存する。
+        """
+        cached = self._rule_results.get(rules.name)
+        if cached is not None and cached[0] is indicators:
+            return cached[1]
+        store = self.rule_pass_rates
+        result = rules.evaluate(indicators, store.rates(rules.name) if store is not None else None,
+                                ordered=store is not None)
+        # 1銘柄だけの評価（一括計算に無い銘柄）は通過率に反映しない
+        if len(indicators.panel) > 1:
+            result.log_counts()
+            if store is not None:
+                store.record(result)
+                store.save()
+        self._rule_results[rules.name] = (indicators, result)
+        return result
+    
+    def evaluate_squeeze(self, indicators: IndicatorSet) -> Dict[str, np.ndarray]:
+        """
+        全銘柄のスクイーズ判定（同じIndicatorSetに対しては1度だけ、detect_squeeze_panel()の結果）
+        
+        判定に失敗した場合もその例外を覚えておき、銘柄ごとに計算し直さず同じ例外を送出する。
+        """
+        cached = self._squeeze_result
+        if cached is not None and cached[0] is indicators:
+            if isinstance(cached[1], Exception):
+                raise cached[1]
+            return cached[1]
+        try:
+            squeeze = detect_squeeze_panel(indicators)
+        except Exception as e:
+            logger.error(f"スクイーズ判定エラー {len(indicators.panel)}銘柄: {e}", exc_info=True)
+            self._squeeze_result = (indicators, e)
+            raise
+        if len(indicators.panel) > 1:
+            logger.info(f"スクイーズ判定 {len(indicators.panel)}銘柄: 検出={int(squeeze['detected'].sum())}")
+        self._squeeze_result = (indicators, squeeze)
+        return squeeze
+    
+    def apply_rules(self, rules: ScreenRules, indicators: IndicatorSet, col: int,
+                    stats: Dict[str, int], code: str) -> Optional[RuleResult]:
+        """
+        1銘柄の判定結果を引き、通過した条件の数を統計dictに加える
+        
+        評価した条件の数はstats['evaluated']（条件名 → 銘柄数）に加える
+        （割合の表示はformat_condition_count()）。
+        
+        Returns:
+            全ての条件を満たせば評価結果（出力項目はresult.outputs(col)）、満たさなければNone
+        """
+        result = self.evaluate_rules(rules, indicators)
+        for name in result.passed_conditions(col):
+            if name in stats:
+                stats[name] += 1
+        evaluated = stats.setdefault('evaluated', {})
+        for name in result.evaluated_conditions(col):
+            if name in stats:
+                evaluated[name] = evaluated.get(name, 0) + 1
+        if not result.passed(col):
+            logger.debug(f"[{code}] {rules.name}: 条件不成立（{result.failed_condition(col)}）")
+            return None
+        return result
+    
     def calculate_ema(self, series, period):
         """EMAを計算"""
         return series.ewm(span=period, adjust=False).mean()
@@ -603,16 +1167,20 @@ class StockScreener:
         return series.rolling(window=period).mean()
     
     def calculate_stochastic(self, df, k_period=14, d_period=3):
-        """ストキャスティクスを計算"""
+        """ストキャスティクスを計算（DataFrame・PriceViewのどちらも可）"""
         if df is None or len(df) < k_period:
             return None, None
         
+        high = pd.Series(df['High'], copy=False)
+        low = pd.Series(df['Low'], copy=False)
+        close = pd.Series(df['Close'], copy=False)
+        
         # 過去N日間の最高値・最安値
-        highest_high = df['High'].rolling(window=k_period).max()
-        lowest_low = df['Low'].rolling(window=k_period).min()
+        highest_high = high.rolling(window=k_period).max()
+        lowest_low = low.rolling(window=k_period).min()
         
         # %K計算
-        stoch_k = ((df['Close'] - lowest_low) / (highest_high - lowest_low)) * 100
+        stoch_k = ((close - lowest_low) / (highest_high - lowest_low)) * 100
         
         # %D計算（%Kの移動平均）
         stoch_d = stoch_k.rolling(window=d_period).mean()
@@ -665,15 +1233,6 @@ class StockScreener:
         name = stock.get("CoName", stock.get("CompanyName", f"銘柄{code}"))
         market = stock.get("Mkt", stock.get("MarketCode", ""))
 
-        # 52週高値判定のために必要な最小データ数
-        MIN_BARS_FOR_YEAR_HIGH = 100
-        # 「底値圏」とみなす52週高値からの下落率(%)
-        BOTTOM_ZONE_DROP_PCT = 20.0
-        # ストキャスティクス「売られすぎ」の閾値(%K)
-        STOCHASTIC_OVERSOLD_MAX = 20.0
-        # 50EMAからの下方乖離の最低ライン(%)
-        EMA50_DEVIATION_MIN_PCT = 5.0
-
         if not hasattr(self, 'perfect_order_stats'):
             self.perfect_order_stats = {
                 "total": 0,
@@ -685,139 +1244,55 @@ class StockScreener:
                 "passed_shadow_body": 0,
                 "passed_close_position": 0,
                 "passed_bullish": 0,
-                "final_detected": 0
+                "final_detected": 0,
+                "evaluated": {}  # 条件名 → その条件を評価した銘柄数
             }
 
         self.perfect_order_stats["total"] += 1
 
         try:
-            end_date = self.latest_trading_date
-            # 52週高値判定＋出来高20日平均のために370日分取得
-            start_str, end_str = get_date_range_for_screening(end_date, 370)
+            # 52週高値判定のために245営業日分取得
+            start_str, end_str = self.get_date_range_for_bars(HAMMER_LOOKBACK_BARS)
 
-            df = await self.persistent_cache.get_or_fetch_incremental(
-                code, start_str, end_str,
-                lambda f, t: self.jq_client.get_prices_daily_quotes(session, code, f, t),
-                max_age_days=60
-            )
+            prices = await self.get_price_view(code, start_str, end_str, session, max_age_days=60)
 
-            if df is None or len(df) < MIN_BARS_FOR_YEAR_HIGH:
+            if prices is None or len(prices) < HAMMER_MIN_BARS:
                 return None
 
             # キャッシュの鮮度チェック（1日以内の許容 = J-Quantsの配信遅延を吸収しつつ、
             # 多日ズレたデータが「本日の結果」として誤表示されるのを防ぐ）
-            latest_check = df.iloc[-1]
-            latest_data_date = pd.to_datetime(latest_check['Date']).date()
-            end_date_obj = datetime.strptime(end_str, '%Y%m%d').date()
-            if (end_date_obj - latest_data_date).days > 1:
-                logger.debug(f"キャッシュデータが古すぎる [{code}]: 最新={latest_data_date}, 実行日={end_date_obj}")
+            if self.is_stale(prices, end_str):
+                logger.debug(f"キャッシュデータが古すぎる [{code}]: 最新={pd.Timestamp(prices['Date'][-1]).date()}, 実行日={end_str}")
                 return None
 
             self.perfect_order_stats["has_data"] += 1
 
-            # 50EMAを計算（乖離判定用）
-            df['EMA50'] = self.calculate_ema(df['Close'], 50)
-
-            latest = df.iloc[-1]
-            open_p   = float(latest['Open'])
-            high_p   = float(latest['High'])
-            low_p    = float(latest['Low'])
-            close_p  = float(latest['Close'])
-            volume   = float(latest.get('Volume', 0))
-            ema50    = float(latest['EMA50'])
-
-            # NaN/欠損データガード：Pythonの比較演算はNaNに対して常にFalseを返すため、
-            # NaNが混じった銘柄は "< 45.0" 等の条件チェックを素通りしてしまう。
-            # ここで明示的に弾かないと、価格や下髭比率がnullのまま検出扱いになる。
-            if any(pd.isna(v) for v in [open_p, high_p, low_p, close_p, ema50]):
-                logger.debug(f"[{code}] NaN/欠損データのため除外")
-                return None
-
-            if close_p <= 0:
-                return None
-
-            # 条件0a: 52週高値から20%以上下落しているか（底値圏に限定）
-            year_high = float(df['High'].max())
-            if pd.isna(year_high) or year_high <= 0:
-                return None
-            drop_from_high_pct = (year_high - close_p) / year_high * 100
-            if drop_from_high_pct < BOTTOM_ZONE_DROP_PCT:
-                return None
-            self.perfect_order_stats["passed_bottom_zone"] += 1
-
-            # 条件0b: ストキャスティクス%Kが売られすぎ水準か
-            stoch_k, stoch_d = self.calculate_stochastic(df)
-            if stoch_k is None or pd.isna(stoch_k) or stoch_k > STOCHASTIC_OVERSOLD_MAX:
-                return None
-            self.perfect_order_stats["passed_stochastic"] += 1
-
-            # 条件0c: 終値が50EMAから5%以上下方乖離しているか
-            # （EMA付近でのノイズ的な下髭を除外し、明確に売り込まれた場面に限定）
-            ema_deviation_pct = (ema50 - close_p) / ema50 * 100 if ema50 > 0 else 0
-            if ema_deviation_pct < EMA50_DEVIATION_MIN_PCT:
-                return None
-            self.perfect_order_stats["passed_ema_deviation"] += 1
-
-            # ローソク各部の長さを計算
-            total_range   = high_p - low_p
-            body          = abs(close_p - open_p)
-            lower_body    = min(open_p, close_p)
-            upper_body    = max(open_p, close_p)
-            lower_shadow  = lower_body - low_p
-            upper_shadow  = high_p - upper_body
-
-            # 全体が0（四本値が全て同じ）は除外
-            if total_range <= 0:
-                return None
-
-            lower_shadow_ratio = lower_shadow / total_range * 100   # 下髭比率(%)
-            shadow_to_body = lower_shadow / body if body > 0 else 999.9  # 下髭÷実体
-            close_position = (close_p - low_p) / total_range  # 終値の当日レンジ内位置(0=安値,1=高値)
-
-            # 条件1: 下髭比率 >= 45%
-            if lower_shadow_ratio < 45.0:
-                return None
-            self.perfect_order_stats["passed_shadow_ratio"] += 1
-
-            # 条件2: 下髭 >= 実体 × 1.0倍（十字線は条件スキップ）
-            if body > 0 and shadow_to_body < 1.0:
-                return None
-            self.perfect_order_stats["passed_shadow_body"] += 1
-
-            # 条件3: 終値が当日レンジの上位30%以内（高値圏で引けている）
-            if close_position < 0.7:
-                return None
-            self.perfect_order_stats["passed_close_position"] += 1
-
-            # 条件4: 陽線 または 下髭比率 >= 60%（強い下髭なら陰線も通過）
-            if close_p < open_p and lower_shadow_ratio < 60.0:
+            # 条件は全銘柄分まとめて評価済み（HAMMER_RULES）。この銘柄の結果を引く
+            indicators, col = self.get_indicators(code, prices, HAMMER_LOOKBACK_BARS)
+            result = self.apply_rules(HAMMER_RULES, indicators, col, self.perfect_order_stats, code)
+            if result is None:
                 return None
-            self.perfect_order_stats["passed_bullish"] += 1
-
             self.perfect_order_stats["final_detected"] += 1
 
-            logger.debug(f"[{code}] ✅ ハンマー: 52週高値比={-drop_from_high_pct:.1f}% "
-                        f"ストキャスK={stoch_k:.1f} 50EMA乖離={-ema_deviation_pct:.1f}% "
-                        f"下髭比率={lower_shadow_ratio:.1f}% "
-                        f"下髭÷実体={shadow_to_body:.1f}倍 終値位置={close_position*100:.1f}% close={close_p}")
+            values = result.outputs(col)
+            logger.debug(f"[{code}] ✅ ハンマー: 52週高値比={-values['upper_3sigma']:.1f}% "
+                        f"ストキャスK={result.value(_hammer_stoch_k, col):.1f} 50EMA乖離={-values['stochastic_d']:.1f}% "
+                        f"下髭比率={values['pullback_pct']:.1f}% "
+                        f"下髭÷実体={values['stochastic_k']:.1f}倍 "
+                        f"終値位置={result.value(_hammer_close_position, col)*100:.1f}% close={values['price']}")
 
+            volume = float(prices['Volume'][-1].item()) if 'Volume' in prices else 0.0
             return {
                 "code": code,
                 "name": name,
-                "price": close_p,
+                "price": values.pop("price"),
                 "market": self._market_code_to_name(market),
                 "volume": int(volume),
-                "pullback_pct": round(lower_shadow_ratio, 1),     # 下髭比率(%) ← ソート①
-                "stochastic_k": round(min(shadow_to_body, 99.9), 2),  # 下髭÷実体 ← ソート②
-                "stochastic_d": round(ema_deviation_pct, 1),      # 50EMA下方乖離(%) ※旧: 上髭比率
-                "upper_3sigma": round(drop_from_high_pct, 1),     # 52週高値からの下落率(%) ※旧: 未使用列を流用
-                "week52_high": round(year_high, 2),     # 52週（約370日）高値
-                "ema20": round(lower_shadow, 2),        # 下髭の長さ（円）
-                "ema50": round(body, 2),                # 実体の長さ（円）
+                **values,
             }
 
         except Exception as e:
-            logger.debug(f"スクリーニングエラー [{code}]: {e}")
+            logger.warning(f"スクリーニングエラー [{code}]: {e}")
             return None
 
 
@@ -830,72 +1305,54 @@ class StockScreener:
         market = stock.get("Mkt", stock.get("MarketCode", ""))
         
         try:
-            # キャッシュされた最新の取引日を使用
-            end_date = self.latest_trading_date
+            # 日付範囲を取得（キャッシュされた最新の取引日まで20営業日分、20SMAのみ必要）
+            start_str, end_str = self.get_date_range_for_bars(BOLLINGER_LOOKBACK_BARS)
             
-            # 日付範囲を取得（50日分、20SMAのみ必要）
-            start_str, end_str = get_date_range_for_screening(end_date, 50)
+            # メモリ・永続キャッシュから取得を試みる（不足分のみ差分取得）
+            prices = await self.get_price_view(code, start_str, end_str, session, max_age_days=60)
             
-            # 永続キャッシュから取得を試みる（不足分のみ差分取得）
-            df = await self.persistent_cache.get_or_fetch_incremental(
-                code, start_str, end_str,
-                lambda f, t: self.jq_client.get_prices_daily_quotes(session, code, f, t),
-                max_age_days=60
-            )
-            
-            if df is None or len(df) < 20:
+            if prices is None or len(prices) < 20:
                 return None
             
-            latest = df.iloc[-1]
-            latest_data_date = pd.to_datetime(latest['Date']).date()
-            end_date_obj = datetime.strptime(end_str, '%Y%m%d').date()
-            
             # キャッシュの最新データが実行日から1日を超えて古い場合は除外
             # 以前は「完全一致（0日）」だったが、J-Quantsのデータ配信が
             # 予定時刻より遅れた日に全銘柄が弾かれ0件になる事故が発生したため、
             # 1日分だけ許容するよう緩和（3日許容だと古いデータが紛れ込むため、
             # その中間を取る）。
-            if (end_date_obj - latest_data_date).days > 1:
-                logger.debug(f"当日データではない [{code}]: 最新={latest_data_date}, 実行日={end_date_obj}")
+            if self.is_stale(prices, end_str):
+                logger.debug(f"当日データではない [{code}]: 最新={pd.Timestamp(prices['Date'][-1]).date()}, 実行日={end_str}")
                 return None
             
-            # ボリンジャーバンド計算
-            df['SMA20'] = df['Close'].rolling(window=20).mean()
-            df['STD20'] = df['Close'].rolling(window=20).std()
-            df['Upper3'] = df['SMA20'] + (df['STD20'] * 3)
-            df['Lower3'] = df['SMA20'] - (df['STD20'] * 3)
-            
-            latest = df.iloc[-1]
+            # ボリンジャーバンド（判定に使うのは最新値のみ。条件は全銘柄分まとめて評価済み）
+            indicators, col = self.get_indicators(code, prices, BOLLINGER_LOOKBACK_BARS)
+            result = self.evaluate_rules(BOLLINGER_RULES, indicators)
             
             # デバッグ: キャッシュデータの最新日付と乖離率をサンプル出力
             if code in ["7203", "6758", "9984"]:  # トヨタ・ソニー・ソフトバンクでサンプル確認
-                latest_date = latest.get('Date', 'unknown')
-                upper_ratio = (float(latest['Close']) / float(latest['Upper3']) - 1) * 100
-                lower_ratio = (float(latest['Lower3']) / float(latest['Close']) - 1) * 100
-                logger.info(f"🔍 BB Debug [{code}]: 最新日={latest_date}, Close={latest['Close']:.0f}, "
-                           f"Upper3={latest['Upper3']:.0f}({upper_ratio:+.1f}%), "
-                           f"Lower3={latest['Lower3']:.0f}({lower_ratio:+.1f}%)")
+                close = result.value(CLOSE, col)
+                upper3 = result.value(_bb_upper3, col)
+                lower3 = result.value(_bb_lower3, col)
+                upper_ratio = (close / upper3 - 1) * 100
+                lower_ratio = (lower3 / close - 1) * 100
+                logger.info(f"🔍 BB Debug [{code}]: 最新日={pd.Timestamp(prices['Date'][-1])}, Close={close:.0f}, "
+                           f"Upper3={upper3:.0f}({upper_ratio:+.1f}%), "
+                           f"Lower3={lower3:.0f}({lower_ratio:+.1f}%)")
             
             # ±3σタッチ判定
-            if latest['Close'] >= latest['Upper3'] or latest['Close'] <= latest['Lower3']:
-                touch_direction = "upper" if latest['Close'] >= latest['Upper3'] else "lower"
-                
+            if result.passed(col):
+                values = result.outputs(col)
                 return {
                     "code": code,
                     "name": name,
-                    "price": float(latest['Close']),
-                    "sma20": float(latest['SMA20']),
-                    "upper_3sigma": float(latest['Upper3']),
-                    "lower_3sigma": float(latest['Lower3']),
-                    "touch_direction": touch_direction,
+                    **values,
                     "market": self._market_code_to_name(market),
-                    "volume": int(latest.get('Volume', 0))
+                    "volume": int(prices['Volume'][-1]) if 'Volume' in prices else 0
                 }
             
             return None
             
         except Exception as e:
-            logger.debug(f"スクリーニングエラー [{code}]: {e}")
+            logger.warning(f"スクリーニングエラー [{code}]: {e}")
             return None
     
     async def screen_stock_200day_pullback(self, stock: Dict, session: aiohttp.ClientSession) -> Optional[Dict]:
@@ -912,7 +1369,8 @@ class StockScreener:
                 'ema50_touch': 0,
                 'any_ema_touch': 0,
                 'ema50_rising': 0,  # EMA50上昇トレンド条件通過
-                'passed_all': 0
+                'passed_all': 0,
+                'evaluated': {}  # 条件名 → その条件を評価した銘柄数
             }
         
         self.pullback_stats['total'] += 1
@@ -934,20 +1392,13 @@ class StockScreener:
             logger.info(f"⚡ DEBUG: screen_stock_200day_pullback() 開始 - {name}({code})")
         
         try:
-            # キャッシュされた最新の取引日を使用
-            end_date = self.latest_trading_date
+            # 日付範囲を取得（キャッシュされた最新の取引日まで200営業日分）
+            start_str, end_str = self.get_date_range_for_bars(PULLBACK_LOOKBACK_BARS)
             
-            # 日付範囲を取得（200日分、キャッシュ範囲内に収める）
-            start_str, end_str = get_date_range_for_screening(end_date, 200)
+            # メモリ・永続キャッシュから取得を試みる（不足分のみ差分取得）
+            prices = await self.get_price_view(code, start_str, end_str, session, max_age_days=220)
             
-            # 永続キャッシュから取得を試みる（不足分のみ差分取得）
-            df = await self.persistent_cache.get_or_fetch_incremental(
-                code, start_str, end_str,
-                lambda f, t: self.jq_client.get_prices_daily_quotes(session, code, f, t),
-                max_age_days=220
-            )
-            
-            if df is None or len(df) < 20:  # 営業日20日分あればOK（最低限の判定可能）
+            if prices is None or len(prices) < 20:  # 営業日20日分あればOK（最低限の判定可能）
                 return None
             
             # キャッシュの鮮度チェック（1日以内の許容）
@@ -955,162 +1406,241 @@ class StockScreener:
             # 予定時刻より遅れた日に全銘柄が弾かれ0件になる事故が発生したため、
             # 1日分だけ許容するよう緩和（5日許容だと古いデータが紛れ込むため、
             # その中間を取る）。
-            latest = df.iloc[-1]
-            latest_data_date = pd.to_datetime(latest['Date']).date()
-            end_date_obj = datetime.strptime(end_str, '%Y%m%d').date()
-            if (end_date_obj - latest_data_date).days > 1:
-                logger.debug(f"当日データではない [{code}]: 最新={latest_data_date}, 実行日={end_date_obj}")
+            if self.is_stale(prices, end_str):
+                logger.debug(f"当日データではない [{code}]: 最新={pd.Timestamp(prices['Date'][-1]).date()}, 実行日={end_str}")
                 return None
             
             self.pullback_stats['has_data'] += 1
             
-            # EMA計算
-            df['EMA10'] = self.calculate_ema(df['Close'], 10)
-            df['EMA20'] = self.calculate_ema(df['Close'], 20)
-            df['EMA50'] = self.calculate_ema(df['Close'], 50)
-            
             # 200日最高値（最低100日分のデータが必要）
             # データ不足の場合は除外（30日データで200日高値を計算する誤りを防ぐ）
-            if len(df) < 100:
-                logger.debug(f"[{code}] データ不足: {len(df)}日分（100日以上必要）")
-                return None
-            lookback_days = min(200, len(df))
-            high_200d = df['High'].tail(lookback_days).max()
-            latest = df.iloc[-1]
-            current_price = latest['Close']
-            
-            # 200日新高値を記録した日を特定
-            high_200d_date_idx = df['High'].tail(lookback_days).idxmax()
-            days_since_high = len(df) - 1 - high_200d_date_idx
-            
-            # 条件1: 過去60日以内に200日新高値を更新していること
-            if days_since_high <= 60:
-                self.pullback_stats['recent_high'] += 1
-            else:
-                return None
-            
-            # 新高値からの下落率
-            pullback_pct = ((high_200d - current_price) / high_200d) * 100
-            
-            # 条件2: 200日新高値から 5%〜30% の押し目
-            # ・5%未満 → 高値圏そのもの（「まんま新高値」に見えてしまう押し目でない状態）
-            # ・30%超  → 下落しすぎ（トレンド崩壊の可能性）
-            if 5 <= pullback_pct <= 30:
-                self.pullback_stats['within_30pct'] += 1
-            else:
+            if len(prices) < PULLBACK_MIN_BARS:
+                logger.debug(f"[{code}] データ不足: {len(prices)}日分（{PULLBACK_MIN_BARS}日以上必要）")
                 return None
             
-            # EMAタッチ判定（4本値のいずれかがEMAにタッチ）
-            touched_emas = []
+            # 条件は全銘柄分まとめて評価済み（PULLBACK_RULES）。この銘柄の結果を引く
+            indicators, col = self.get_indicators(code, prices, PULLBACK_LOOKBACK_BARS)
             
-            # 当日の4本値を取得
-            open_price = latest['Open']
-            high_price = latest['High']
-            low_price = latest['Low']
-            close_price = latest['Close']
-            
-            # デバッグログ
             if is_debug_target:
-                logger.info(f"\n{'='*60}")
-                logger.info(f"🔍 デバッグ詳細: {name}({code})")
-                logger.info(f"日付: {latest['Date']}")
-                logger.info(f"4本値:")
-                logger.info(f"  始値: {open_price:,.0f}円")
-                logger.info(f"  高値: {high_price:,.0f}円")
-                logger.info(f"  安値: {low_price:,.0f}円")
-                logger.info(f"  終値: {close_price:,.0f}円")
-                logger.info(f"EMA:")
-                logger.info(f"  EMA10: {latest['EMA10']:,.2f}円")
-                logger.info(f"  EMA20: {latest['EMA20']:,.2f}円")
-                logger.info(f"  EMA50: {latest['EMA50']:,.2f}円")
-                logger.info(f"200日新高値: {high_200d:,.0f}円")
-                logger.info(f"200日新高値更新日: {df.iloc[high_200d_date_idx]['Date']} ({days_since_high}日前)")
-                logger.info(f"下落率: {pullback_pct:.2f}%")
-            
-            # EMA10タッチ判定：ローソク足の範囲内にEMAがあるか
-            # かつ終値がEMAより上（下落中にEMAを下抜けするケースを除外）
-            if low_price <= latest['EMA10'] <= high_price and close_price >= latest['EMA10']:
-                touched_emas.append("10EMA")
-                self.pullback_stats['ema10_touch'] += 1
-            
-            # EMA20タッチ判定
-            if low_price <= latest['EMA20'] <= high_price and close_price >= latest['EMA20']:
-                touched_emas.append("20EMA")
-                self.pullback_stats['ema20_touch'] += 1
-            
-            # EMA50タッチ判定
-            if low_price <= latest['EMA50'] <= high_price and close_price >= latest['EMA50']:
-                touched_emas.append("50EMA")
-                self.pullback_stats['ema50_touch'] += 1
+                self._log_pullback_debug(name, code, prices, indicators, col)
             
-            if is_debug_target:
-                logger.info(f"\nタッチ判定（安値≦EMA≦高値 かつ 終値≧EMA）:")
-                logger.info(f"  EMA10タッチ: {low_price} <= {latest['EMA10']:.2f} <= {high_price} & close{close_price}>={latest['EMA10']:.2f} → {'✅' if '10EMA' in touched_emas else '❌'}")
-                logger.info(f"  EMA20タッチ: {low_price} <= {latest['EMA20']:.2f} <= {high_price} & close{close_price}>={latest['EMA20']:.2f} → {'✅' if '20EMA' in touched_emas else '❌'}")
-                logger.info(f"  EMA50タッチ: {low_price} <= {latest['EMA50']:.2f} <= {high_price} & close{close_price}>={latest['EMA50']:.2f} → {'✅' if '50EMA' in touched_emas else '❌'}")
-                logger.info(f"タッチしたEMA: {touched_emas if touched_emas else 'なし'}")
-                logger.info(f"{'='*60}\n")
-            
-            if touched_emas:
-                self.pullback_stats['any_ema_touch'] += 1
-            else:
+            result = self.apply_rules(PULLBACK_RULES, indicators, col, self.pullback_stats, code)
+            if result is None:
                 return None
             
-            # EMAフィルター適用
-            if PULLBACK_EMA_FILTER != "all":
-                if PULLBACK_EMA_FILTER == "10ema" and "10EMA" not in touched_emas:
-                    return None
-                elif PULLBACK_EMA_FILTER == "20ema" and "20EMA" not in touched_emas:
-                    return None
-                elif PULLBACK_EMA_FILTER == "50ema" and "50EMA" not in touched_emas:
-                    return None
+            # 全条件通過！
+            self.pullback_stats['passed_all'] += 1
             
-            # ストキャスティクス計算
-            stoch_k, stoch_d = self.calculate_stochastic(df)
+            return {
+                "code": code,
+                "name": name,
+                **result.outputs(col),
+                "market": self._market_code_to_name(market),
+                "volume": int(prices['Volume'][-1]) if 'Volume' in prices else 0
+            }
             
-            # ストキャスティクスフィルター適用
-            if PULLBACK_STOCHASTIC_FILTER:
-                if stoch_k is None or stoch_k > 20:  # 売られすぎ閾値
-                    return None
+        except Exception as e:
+            logger.warning(f"スクリーニングエラー [{code}]: {e}")
+            return None
+    
+    def _log_pullback_debug(self, name: str, code: str, prices, indicators: IndicatorSet, col: int) -> None:
+        """200日新高値押し目の判定に使う値をデバッグ対象銘柄について詳しくログ出力"""
+        result = self.evaluate_rules(PULLBACK_RULES, indicators)
+        open_price, high_price, low_price, close_price = (
+            result.value(expr, col) for expr in (OPEN, HIGH, LOW, CLOSE)
+        )
+        emas = {span: result.value(ema, col) for span, ema in _pb_emas.items()}
+        days_since_high = int(result.value(Indicator("bars_since_high", PULLBACK_LOOKBACK_BARS), col))
+        logger.info(f"\n{'='*60}")
+        logger.info(f"🔍 デバッグ詳細: {name}({code})")
+        logger.info(f"日付: {pd.Timestamp(prices['Date'][-1])}")
+        logger.info(f"4本値:")
+        logger.info(f"  始値: {open_price:,.0f}円")
+        logger.info(f"  高値: {high_price:,.0f}円")
+        logger.info(f"  安値: {low_price:,.0f}円")
+        logger.info(f"  終値: {close_price:,.0f}円")
+        logger.info(f"EMA:")
+        for span, ema_now in emas.items():
+            logger.info(f"  EMA{span}: {ema_now:,.2f}円")
+        logger.info(f"200日新高値: {result.value(_pb_high, col):,.0f}円")
+        logger.info(f"200日新高値更新日: {pd.Timestamp(prices['Date'][len(prices) - 1 - days_since_high]).date()} ({days_since_high}日前)")
+        logger.info(f"下落率: {result.value(_pb_pct, col):.2f}%")
+        logger.info(f"\nタッチ判定（安値≦EMA≦高値 かつ 終値≧EMA）:")
+        for span, ema_now in emas.items():
+            touched = result.value(_pb_touch[span], col)
+            logger.info(f"  EMA{span}タッチ: {low_price} <= {ema_now:.2f} <= {high_price} & close{close_price}>={ema_now:.2f} → {'✅' if touched else '❌'}")
+        logger.info(f"タッチしたEMA: {result.value(PULLBACK_RULES.outputs['touched_emas'], col) or 'なし'}")
+        logger.info(f"満たさなかった条件: {result.failed_condition(col) or 'なし'}")
+        logger.info(f"{'='*60}\n")
+    
+    async def screen_stock_squeeze(self, stock: Dict, session: aiohttp.ClientSession) -> Optional[Dict]:
+        """単一銘柄のスクイーズ（価格収縮）スクリーニング"""
+        code = stock["Code"]
+        # V2 APIでは "CoName"、V1 APIでは "CompanyName"
+        name = stock.get("CoName", stock.get("CompanyName", f"銘柄{code}"))
+        # V2 APIでは "Mkt" フィールド、V1 APIでは "MarketCode" フィールド
+        market = stock.get("Mkt", stock.get("MarketCode", ""))
+        
+        try:
+            # 日付範囲を取得（キャッシュされた最新の取引日まで100営業日分）
+            start_str, end_str = self.get_date_range_for_bars(SQUEEZE_LOOKBACK_BARS)
             
-            # 条件: EMA50が20日前より明確に上昇している（横ばいを除外）
-            # 以前は「わずかでも上」なら通過していたため、実質横ばいの銘柄も
-            # 「上昇トレンド」として検出されてしまっていた。3%以上の上昇を必須にする。
-            EMA50_RISING_MIN_PCT = 3.0
-            if len(df) >= 20:
-                ema50_20days_ago = float(df['EMA50'].iloc[-20])
-                ema50_now = float(latest['EMA50'])
-                ema50_rise_pct = (ema50_now - ema50_20days_ago) / ema50_20days_ago * 100 if ema50_20days_ago > 0 else 0
-                if ema50_rise_pct < EMA50_RISING_MIN_PCT:
-                    logger.debug(f"[{code}] EMA50横ばい/下降: 20日騰落率={ema50_rise_pct:.1f}%（{EMA50_RISING_MIN_PCT}%未満）")
-                    return None
-            self.pullback_stats['ema50_rising'] += 1
+            # メモリ・永続キャッシュから取得を試みる（不足分のみ差分取得）
+            prices = await self.get_price_view(code, start_str, end_str, session, max_age_days=60)
             
-            # 全条件通過！
-            self.pullback_stats['passed_all'] += 1
+            if prices is None or len(prices) < SQUEEZE_LOOKBACK_BARS:
+                return None
+            
+            # キャッシュの最新データが実行日から1日を超えて古い場合は除外
+            if self.is_stale(prices, end_str):
+                logger.debug(f"当日データではない [{code}]: 最新={pd.Timestamp(prices['Date'][-1]).date()}, 実行日={end_str}")
+                return None
+            
+            # BBW・乖離率・ATRと継続日数は全銘柄分まとめて判定済み。この銘柄の結果を引く
+            indicators, col = self.get_indicators(code, prices, SQUEEZE_LOOKBACK_BARS)
+            squeeze = self.evaluate_squeeze(indicators)
+            if not squeeze['detected'][col]:
+                return None
             
+            values = squeeze_values(squeeze, col)
+            del values['detected']
             return {
                 "code": code,
                 "name": name,
-                "price": float(current_price),
-                "high_200day": float(high_200d),
-                "pullback_pct": round(pullback_pct, 2),
-                "touched_emas": ",".join(touched_emas),
-                "ema_10": float(latest['EMA10']),
-                "ema_20": float(latest['EMA20']),
-                "ema_50": float(latest['EMA50']),
-                "stochastic_k": round(stoch_k, 2) if stoch_k is not None else None,
-                "stochastic_d": round(stoch_d, 2) if stoch_d is not None else None,
+                "price": prices['Close'][-1].item(),
                 "market": self._market_code_to_name(market),
-                "volume": int(latest.get('Volume', 0))
+                **values,
+                "ema_50": float(squeeze['ema'][col]),
+                "volume": int(prices['Volume'][-1]) if 'Volume' in prices else 0
             }
             
         except Exception as e:
-            logger.debug(f"スクリーニングエラー [{code}]: {e}")
+            logger.warning(f"スクリーニングエラー [{code}]: {e}")
             return None
     
     async def process_stocks_batch(self, stocks: List[Dict], screening_func, method_name: str):
         """銘柄のバッチ処理"""
+        results = await self.process_stocks_multi(stocks, [(screening_func, method_name)])
+        return results[method_name]
+    
+    async def get_latest_bars(self, session: aiohttp.ClientSession) -> Optional[PricePanel]:
+        """
+        最新取引日の全銘柄の足を1行のパネルにする（取得できなければNone）
+        
+        四本値は永続キャッシュと同じくfloat32に丸めるため、履歴を取得した場合の
+        最新の足と同じ値で条件を判定できる。
+        """
+        if self.latest_trading_date is None:
+            return None
+        df = await self.jq_client.get_prices_daily_quotes_by_date(session, self.latest_trading_date.strftime('%Y%m%d'))
+        if df is None or 'Code' not in df.columns or not {'Date', *CACHE_PRICE_COLUMNS} <= set(df.columns):
+            return None
+        # 売買の無かった銘柄は四本値が空になるため含めない（絞り込まずに履歴で判定する）
+        df = df.drop_duplicates(subset='Code', keep='last').dropna(subset=CACHE_PRICE_COLUMNS)
+        columns = {}
+        for name in PANEL_COLUMNS:
+            values = pd.to_numeric(df[name], errors='coerce') if name in df.columns else pd.Series(np.nan, index=df.index)
+            if name in CACHE_PRICE_COLUMNS:
+                values = values.astype(np.float32)
+            columns[name] = values.to_numpy(dtype=np.float64).reshape(1, -1)
+        dates = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]').reshape(1, -1)
+        return PricePanel(df['Code'].astype(str).tolist(), dates, columns, np.ones(len(df), dtype=np.int64))
+    
+    async def prefilter_stocks(self, stocks: List[Dict], screens: List[Tuple[Any, str]],
+                               session: aiohttp.ClientSession) -> Dict[str, Optional[set]]:
+        """
+        最新の足だけで決まる条件で、手法ごとに判定する銘柄を絞り込む
+        
+        必須の条件のうち四本値・出来高の最新の値だけを使うもの（ハンマーの下髭比率・
+        終値の位置・陽線など）を、全銘柄の最新の足に対してまとめて評価する。
+        最新の足が取得できなかった銘柄は除外しない（履歴を取得して従来どおり判定する）。
+        除外した銘柄の条件別の評価・通過数はself.prefilter_statsに残し、判定後に
+        merge_prefilter_stats()で手法の統計に加える。
+        
+        Returns:
+            手法名 → 判定する銘柄コードの集合（絞り込まない手法はNone）
+        """
+        candidates: Dict[str, Optional[set]] = {name: None for _, name in screens}
+        targets = []
+        for func, name in screens:
+            rules = SCREEN_RULES.get(getattr(func, "__name__", ""))
+            latest_bar_rules = rules.latest_bar_rules() if rules is not None else None
+            if latest_bar_rules is not None:
+                targets.append((name, func.__name__, latest_bar_rules))
+        if not targets:
+            return candidates
+        
+        started = time.perf_counter()
+        panel = await self.get_latest_bars(session)
+        if panel is None:
+            logger.warning("最新の足を取得できないため、事前の絞り込みを行いません")
+            return candidates
+        snapshot = IndicatorSet(panel)
+        codes = [stock["Code"] for stock in stocks]
+        listed = set(codes)
+        for name, func_name, rules in targets:
+            result = rules.evaluate(snapshot, ordered=False)
+            rejected = {panel.codes[i] for i in np.flatnonzero(~result.mask)} & listed
+            candidates[name] = {code for code in codes if code not in rejected}
+            prefiltered = {"rejected": len(rejected), "passed": {}, "evaluated": {}}
+            for code in rejected:
+                col = panel.index[code]
+                for condition in result.passed_conditions(col):
+                    prefiltered["passed"][condition] = prefiltered["passed"].get(condition, 0) + 1
+                for condition in result.evaluated_conditions(col):
+                    prefiltered["evaluated"][condition] = prefiltered["evaluated"].get(condition, 0) + 1
+            self.prefilter_stats[func_name] = prefiltered
+            logger.info(f"{name}: 最新の足で事前絞り込み {len(codes)} → {len(candidates[name])}銘柄 "
+                        f"(条件: {', '.join(condition.name for condition in rules.conditions)}, "
+                        f"{(time.perf_counter() - started) * 1000:.0f}ms)")
+        return candidates
+    
+    def merge_prefilter_stats(self, func_name: str) -> None:
+        """
+        事前の絞り込みで除外した銘柄を手法の統計dict（SCREEN_STATS）に加える
+        
+        除外した銘柄は判定関数を呼ばないため、そのままでは統計の処理対象・条件別の
+        通過数に入らない。処理対象（total）に加えてprefilteredに件数を残し、最新の
+        足で評価した条件の評価・通過数を加える（履歴は取得しないのでhas_dataには
+        含めない）。
+        """
+        prefiltered = self.prefilter_stats.pop(func_name, None)
+        attr = SCREEN_STATS.get(func_name)
+        stats = getattr(self, attr, None) if attr is not None else None
+        if prefiltered is None or stats is None:
+            return
+        stats['total'] += prefiltered['rejected']
+        stats['prefiltered'] = stats.get('prefiltered', 0) + prefiltered['rejected']
+        evaluated = stats.setdefault('evaluated', {})
+        for name, count in prefiltered['passed'].items():
+            if name in stats:
+                stats[name] += count
+        for name, count in prefiltered['evaluated'].items():
+            if name in stats:
+                evaluated[name] = evaluated.get(name, 0) + count
+    
+    async def process_stocks_multi(self, stocks: List[Dict], screens: List[Tuple[Any, str]]) -> Dict[str, List[Dict]]:
+        """
+        複数のスクリーニングを1回の走査でまとめて実行
+        
+        登録済みのスクリーニング（SCREEN_PRICE_WINDOWS）は、必要な本数が最も多いものに
+        合わせて全銘柄の株価を1度だけ取得し、指標も1組だけ計算して共有する。
+        各銘柄は読み込んだ株価のまま全スクリーニングで判定するため、株価の取得・
+        待機はスクリーニングの数によらず1銘柄1回になる。
+        
+        SCREENING_SNAPSHOT_PREFILTERが有効なら、先に最新取引日の全銘柄の足を取得し、
+        最新の足だけで決まる条件（SCREEN_RULESのlatest_bar_rules()）を満たさない銘柄は
+        その手法で判定しない。どの手法でも判定しない銘柄は株価の履歴を取得しない。
+        除外した銘柄は判定後に手法の統計に加える（merge_prefilter_stats()）。
+        
+        Args:
+            stocks: 銘柄リスト
+            screens: (判定関数, 手法名) のリスト
+        
+        Returns:
+            手法名 → 検出結果のリスト（各手法の所要時間はself.screen_elapsed_msに記録）
+        """
+        method_names = "・".join(name for _, name in screens)
         self.progress["total"] = len(stocks)
         self.progress["processed"] = 0
         self.progress["detected"] = 0
@@ -1120,56 +1650,119 @@ class StockScreener:
         mem_info = process.memory_info()
         mem_mb = mem_info.rss / 1024 / 1024
         vm = psutil.virtual_memory()
-        logger.info(f"💾 {method_name} 開始時メモリ: プロセス {mem_mb:.2f}MB / システム {vm.used/1024/1024/1024:.2f}GB ({vm.percent}%)")
+        logger.info(f"💾 {method_names} 開始時メモリ: プロセス {mem_mb:.2f}MB / システム {vm.used/1024/1024/1024:.2f}GB ({vm.percent}%)")
         
         connector = aiohttp.TCPConnector(limit=CONCURRENT_REQUESTS)
         timeout = aiohttp.ClientTimeout(total=30)
         
+        # 登録済みのスクリーニングは、先に全銘柄の株価を取得して指標を一括計算する
+        windows = [SCREEN_PRICE_WINDOWS.get(getattr(func, "__name__", "")) for func, _ in screens]
+        registered = [window for window in windows if window is not None]
+        # 登録されていないスクリーニングは従来どおり判定の中で株価を取得する
+        fetches_per_stock = len(registered) < len(screens)
+        
+        results: Dict[str, List[Dict]] = {name: [] for _, name in screens}
+        funnel = {name: {"evaluated": 0, "detected": 0, "seconds": 0.0} for _, name in screens}
+        
         async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
             # 認証
             await self.jq_client.authenticate(session)
             
+            # 手法名 → 判定する銘柄コード（Noneなら全銘柄）
+            candidates: Dict[str, Optional[set]] = {name: None for _, name in screens}
+            if SCREENING_SNAPSHOT_PREFILTER:
+                candidates = await self.prefilter_stocks(stocks, screens, session)
+            if all(codes is not None for codes in candidates.values()):
+                wanted = set().union(*candidates.values())
+                stocks = [stock for stock in stocks if stock["Code"] in wanted]
+                self.progress["total"] = len(stocks)
+            
+            shared_seconds = 0.0
+            if registered:
+                # 最も長い本数・最も短い有効日数で1度だけ取得し、全ての本数で同じ指標を使う
+                started = time.perf_counter()
+                bars = max(window[0] for window in registered)
+                max_age_days = min(window[1] for window in registered)
+                indicators = await self.prepare_indicators(stocks, session, bars, max_age_days, method_names)
+                for window in registered:
+                    self.indicators[window[0]] = indicators
+                shared_seconds = time.perf_counter() - started
+            
             # セマフォで同時実行数を制限
             semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
             
             async def process_with_semaphore(stock):
                 async with semaphore:
-                    result = await screening_func(stock, session)
+                    detected = False
+                    # 判定中の銘柄はメモリキャッシュの破棄対象から外す
+                    with self.cache.pinned([stock["Code"]]):
+                        for screening_func, method_name in screens:
+                            codes = candidates[method_name]
+                            if codes is not None and stock["Code"] not in codes:
+                                continue
+                            started = time.perf_counter()
+                            result = await screening_func(stock, session)
+                            stats = funnel[method_name]
+                            stats["seconds"] += time.perf_counter() - started
+                            stats["evaluated"] += 1
+                            if result:
+                                stats["detected"] += 1
+                                results[method_name].append(result)
+                                detected = True
                     self.progress["processed"] += 1
                     
                     if self.progress["processed"] % 100 == 0:
                         # メモリ使用量をログ
                         mem_info = process.memory_info()
                         mem_mb = mem_info.rss / 1024 / 1024
-                        logger.info(f"{method_name}: {self.progress['processed']}/{self.progress['total']} 処理完了 "
+                        logger.info(f"{method_names}: {self.progress['processed']}/{self.progress['total']} 処理完了 "
                                   f"({self.progress['detected']}銘柄検出) - 💾 メモリ: {mem_mb:.2f}MB")
                     
-                    if result:
+                    if detected:
                         self.progress["detected"] += 1
                     
-                    # レート制限対応: APIコール後に待機
-                    await asyncio.sleep(API_CALL_DELAY)
-                    
-                    return result
+                    # レート制限対応: APIコール後に待機（株価取得済みならAPIは呼ばない）
+                    if fetches_per_stock:
+                        await asyncio.sleep(API_CALL_DELAY)
             
             # 順次実行（レート制限対応）
-            results = []
             for stock in stocks:
-                result = await process_with_semaphore(stock)
-                if result:
-                    results.append(result)
+                await process_with_semaphore(stock)
             
             # 終了時のメモリ使用量をログ
             mem_info = process.memory_info()
             mem_mb = mem_info.rss / 1024 / 1024
             vm = psutil.virtual_memory()
-            logger.info(f"💾 {method_name} 終了時メモリ: プロセス {mem_mb:.2f}MB / システム {vm.used/1024/1024/1024:.2f}GB ({vm.percent}%)")
-            
-            # Noneを除外
-            return [r for r in results if r is not None]
+            logger.info(f"💾 {method_names} 終了時メモリ: プロセス {mem_mb:.2f}MB / システム {vm.used/1024/1024/1024:.2f}GB ({vm.percent}%)")
+        
+        for func, _ in screens:
+            self.merge_prefilter_stats(getattr(func, "__name__", ""))
+        
+        # 株価取得・指標計算の時間は共有分として各手法の所要時間に含める
+        self.screen_elapsed_ms = {}
+        for (_, method_name), window in zip(screens, windows):
+            stats = funnel[method_name]
+            seconds = stats["seconds"] + (shared_seconds if window is not None else 0.0)
+            self.screen_elapsed_ms[method_name] = int(seconds * 1000)
+            if len(screens) > 1:
+                logger.info(f"{method_name}: 判定{stats['evaluated']}銘柄 → 検出{stats['detected']}銘柄 "
+                            f"(判定{stats['seconds']:.1f}秒, 株価取得・指標計算{shared_seconds:.1f}秒は共有)")
+        return results
+    
+    def shutdown(self) -> None:
+        """指標計算のプロセスプールを終了する（実行の最後に、例外で抜けた場合も呼ぶ）"""
+        if self.indicator_pool is not None:
+            self.indicator_pool.shutdown()
     
     async def run_screening(self, stocks: List[Dict]):
-        """全スクリーニング手法を並列実行"""
+        """全スクリーニング手法を並列実行（終了時・例外時にプロセスプールを終了する）"""
+        try:
+            return await self._run_screening(stocks)
+        finally:
+            self.shutdown()
+    
+    async def _run_screening(self, stocks: List[Dict]):
+        """run_screening()の本体"""
         logger.info(f"並列スクリーニング開始: {len(stocks)}銘柄")
         logger.info(f"同時実行数: {CONCURRENT_REQUESTS}")
         logger.info("=" * 60)
@@ -1180,13 +1773,34 @@ class StockScreener:
         
         start_time = datetime.now()
         
+        # 永続キャッシュのプリロード（ディスク読み込みを銘柄ごとの処理から外す）
+        self.preload_persistent_cache(stocks)
+        # 取引カレンダー（キャッシュ途中の欠損検出用）
+        await self.load_trading_calendar()
+        
+        screens = [
+            (self.screen_stock_breakout, "ブレイクアウト"),
+            (self.screen_stock_bollinger_band, "ボリンジャーバンド"),
+            (self.screen_stock_200day_pullback, "200日新高値押し目"),
+        ]
+        if SCREENING_SINGLE_PASS:
+            # 株価の取得・指標計算を1度で済ませ、各銘柄を全手法で続けて判定する
+            logger.info("全スクリーニングを1回の走査で実行")
+            outcomes = await self.process_stocks_multi(stocks, screens)
+            elapsed_ms = dict(self.screen_elapsed_ms)
+        else:
+            outcomes = {}
+            elapsed_ms = {}
+            for screening_func, method_name in screens:
+                logger.info("=" * 60)
+                logger.info(f"{method_name}スクリーニング開始")
+                screen_start = datetime.now()
+                outcomes[method_name] = await self.process_stocks_batch(stocks, screening_func, method_name)
+                elapsed_ms[method_name] = int((datetime.now() - screen_start).total_seconds() * 1000)
+        
         # ブレイクアウト（持ち合い上放れ）
-        logger.info("ブレイクアウト（持ち合い上放れ）スクリーニング開始")
-        po_start = datetime.now()
-        breakout = await self.process_stocks_batch(
-            stocks, self.screen_stock_breakout, "ブレイクアウト"
-        )
-        po_time = int((datetime.now() - po_start).total_seconds() * 1000)
+        breakout = outcomes["ブレイクアウト"]
+        po_time = elapsed_ms["ブレイクアウト"]
         logger.info(f"ブレイクアウト検出: {len(breakout)}銘柄 ({po_time}ms)")
         
         # 統計情報を表示
@@ -1196,17 +1810,25 @@ class StockScreener:
             logger.info("="*60)
             logger.info(f"📄 処理対象: {stats['total']:,}銘柄")
             
-            if stats['total'] > 0:
-                logger.info(f"✅ データ取得成功: {stats['has_data']:,}銘柄 ({stats['has_data']/stats['total']*100:.1f}%)")
-                logger.info(f"❌ データ不足: {stats['data_insufficient']:,}銘柄 ({stats['data_insufficient']/stats['total']*100:.1f}%)")
-            
-            logger.info(f"\n🔹 条件別通過状況:")
-            
-            if stats['has_data'] > 0:
-                logger.info(f"  1️⃣ ボックス幅15%以内: {stats.get('passed_box', 0):,}銘柄 ({stats.get('passed_box', 0)/stats['has_data']*100:.2f}%)")
-                logger.info(f"  2️⃣ 高値ブレイクアウト: {stats.get('passed_breakout', 0):,}銘柄")
-                logger.info(f"  3️⃣ 出来高急増1.5倍以上: {stats.get('passed_volume', 0):,}銘柄")
-                logger.info(f"  4️⃣ EMA50以上: {stats.get('passed_ema', 0):,}銘柄")
+            fetched = stats['total'] - stats.get('prefiltered', 0)
+            if stats.get('prefiltered'):
+                logger.info(f"⏭️ 最新の足で事前に除外: {stats['prefiltered']:,}銘柄 "
+                            f"({stats['prefiltered']/stats['total']*100:.1f}%、履歴は取得せず)")
+            if fetched > 0:
+                logger.info(f"✅ データ取得成功: {stats['has_data']:,}銘柄 ({stats['has_data']/fetched*100:.1f}% of 履歴を取得した{fetched:,}銘柄)")
+                insufficient = fetched - stats['has_data']
+                logger.info(f"❌ データ不足: {insufficient:,}銘柄 ({insufficient/fetched*100:.1f}%)")
+            
+            logger.info(f"\n🔹 条件別通過状況（割合は各条件を評価した銘柄に対するもの）:")
+            
+            if stats['has_data'] + stats.get('prefiltered', 0) > 0:
+                logger.info(f"  0a 52週高値から20%以上下落: {format_condition_count(stats, 'passed_bottom_zone')}")
+                logger.info(f"  0b ストキャスティクス売られすぎ: {format_condition_count(stats, 'passed_stochastic')}")
+                logger.info(f"  0c 50EMAから5%以上下方乖離: {format_condition_count(stats, 'passed_ema_deviation')}")
+                logger.info(f"  1️⃣ 下髭比率45%以上: {format_condition_count(stats, 'passed_shadow_ratio')}")
+                logger.info(f"  2️⃣ 下髭が実体以上: {format_condition_count(stats, 'passed_shadow_body')}")
+                logger.info(f"  3️⃣ 終値が当日レンジ上位30%: {format_condition_count(stats, 'passed_close_position')}")
+                logger.info(f"  4️⃣ 陽線または強い陰線: {format_condition_count(stats, 'passed_bullish')}")
             
             logger.info(f"\n⭐ 全条件通過: {stats['final_detected']:,}銘柄")
             logger.info("="*60 + "\n")
@@ -1224,12 +1846,8 @@ class StockScreener:
         
         # ボリンジャーバンド
         logger.info("=" * 60)
-        logger.info("ボリンジャーバンド±3σスクリーニング開始")
-        bb_start = datetime.now()
-        bollinger_band = await self.process_stocks_batch(
-            stocks, self.screen_stock_bollinger_band, "ボリンジャーバンド"
-        )
-        bb_time = int((datetime.now() - bb_start).total_seconds() * 1000)
+        bollinger_band = outcomes["ボリンジャーバンド"]
+        bb_time = elapsed_ms["ボリンジャーバンド"]
         logger.info(f"ボリンジャーバンド検出: {len(bollinger_band)}銘柄 ({bb_time}ms)")
         
         # 間引き処理
@@ -1244,12 +1862,8 @@ class StockScreener:
         
         # 200日新高値押し目
         logger.info("=" * 60)
-        logger.info("200日新高値押し目スクリーニング開始")
-        pb_start = datetime.now()
-        week52_pullback = await self.process_stocks_batch(
-            stocks, self.screen_stock_200day_pullback, "200日新高値押し目"
-        )
-        pb_time = int((datetime.now() - pb_start).total_seconds() * 1000)
+        week52_pullback = outcomes["200日新高値押し目"]
+        pb_time = elapsed_ms["200日新高値押し目"]
         logger.info(f"200日新高値押し目検出: {len(week52_pullback)}銘柄 ({pb_time}ms)")
         
         # 間引き処理
@@ -1268,27 +1882,15 @@ class StockScreener:
             else:
                 logger.info(f"✅ データ取得成功: {stats['has_data']:,}銘柄")
             
-            logger.info(f"\n🔹 条件別通過状況:")
-            
-            if stats['has_data'] > 0:
-                logger.info(f"  1️⃣ 60日以内に200日新高値更新: {stats['recent_high']:,}銘柄 ({stats['recent_high']/stats['has_data']*100:.2f}%)")
-            else:
-                logger.info(f"  1️⃣ 60日以内に200日新高値更新: {stats['recent_high']:,}銘柄")
-            
-            if stats['recent_high'] > 0:
-                logger.info(f"  2️⃣ 30%以内の押し目: {stats['within_30pct']:,}銘柄 ({stats['within_30pct']/stats['recent_high']*100:.2f}% of 条件1通過)")
-            else:
-                logger.info(f"  2️⃣ 30%以内の押し目: {stats['within_30pct']:,}銘柄 (条件1通過が0のため計算不可)")
+            logger.info(f"\n🔹 条件別通過状況（割合は各条件を評価した銘柄に対するもの）:")
+            logger.info(f"  1️⃣ 60日以内に200日新高値更新: {format_condition_count(stats, 'recent_high')}")
+            logger.info(f"  2️⃣ 30%以内の押し目: {format_condition_count(stats, 'within_30pct')}")
             
             logger.info(f"\n🔹 EMAタッチ別統計:")
-            logger.info(f"  🔸 10EMAタッチ: {stats['ema10_touch']:,}銘柄")
-            logger.info(f"  🔸 20EMAタッチ: {stats['ema20_touch']:,}銘柄")
-            logger.info(f"  🔸 50EMAタッチ: {stats['ema50_touch']:,}銘柄")
-            
-            if stats['within_30pct'] > 0:
-                logger.info(f"  ✅ いずれかのEMAタッチ: {stats['any_ema_touch']:,}銘柄 ({stats['any_ema_touch']/stats['within_30pct']*100:.2f}% of 条件2通過)")
-            else:
-                logger.info(f"  ✅ いずれかのEMAタッチ: {stats['any_ema_touch']:,}銘柄 (条件2通過が0のため計算不可)")
+            logger.info(f"  🔸 10EMAタッチ: {format_condition_count(stats, 'ema10_touch')}")
+            logger.info(f"  🔸 20EMAタッチ: {format_condition_count(stats, 'ema20_touch')}")
+            logger.info(f"  🔸 50EMAタッチ: {format_condition_count(stats, 'ema50_touch')}")
+            logger.info(f"  ✅ いずれかのEMAタッチ: {format_condition_count(stats, 'any_ema_touch')}")
             
             logger.info(f"\n⭐ 全条件通過: {stats['passed_all']:,}銘柄")
             logger.info("="*60 + "\n")
@@ -1307,13 +1909,9 @@ class StockScreener:
         self.cache.log_stats()
         
         # 永続キャッシュ統計を出力
-        persistent_stats = self.persistent_cache.get_stats()
-        logger.info("\n永続キャッシュ統計:")
-        logger.info(f"  ファイル数: {persistent_stats['files']}件")
-        logger.info(f"  合計サイズ: {persistent_stats['size_mb']}MB")
-        logger.info(f"  ヒット数: {persistent_stats['hits']}回")
-        logger.info(f"  ミス数: {persistent_stats['misses']}回")
-        logger.info(f"  ヒット率: {persistent_stats['hit_rate']}%")
+        self.persistent_cache.log_stats()
+        self.indicator_memo.log_stats()
+        self.write_cache_stats("all")
         logger.info("=" * 60)
         
         logger.info(f"全スクリーニング完了: {total_time:.1f}秒")
@@ -0,0 +1,611 @@
+"""
+テクニカル指標の一括計算モジュール
+スクリーニング対象の全銘柄の株価を1つのパネル（足 × 銘柄の2次元配列）に並べ、
+EMA・SMA・標準偏差・ストキャスティクス・高値・ATRを銘柄ごとではなく全銘柄まとめて計算する
+"""
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# パネルに並べる列（PriceView・DataFrameの列名）
+PANEL_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+class PricePanel:
+    """
+    全銘柄の株価を 足 × 銘柄 に並べた2次元配列
+    
+    各銘柄の最新足を最終行に揃え、それより古い足を上に詰めて並べる。
+    売買停止などで日付が欠けている銘柄も足の本数で揃うため、各列は
+    その銘柄の株価履歴そのものになり、移動平均などの窓は銘柄ごとに
+    計算した場合と同じ足を含む。履歴が短い銘柄の先頭はNaN（日付はNaT）。
+    """
+    
+    __slots__ = ('codes', 'index', 'dates', 'lengths', '_columns')
+    
+    def __init__(self, codes: List[str], dates: np.ndarray, columns: Dict[str, np.ndarray], lengths: np.ndarray):
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+        self.dates = dates
+        self.lengths = lengths
+        self._columns = columns
+    
+    @classmethod
+    def from_views(cls, views: Dict[str, Any]) -> "PricePanel":
+        """
+        銘柄コード → PriceView（またはDataFrame）からパネルを作る
+        
+        行の無い銘柄は含めない。価格はfloat64に揃える（float32のキャッシュも値は変わらない）。
+        """
+        items = [(code, prices) for code, prices in views.items() if prices is not None and len(prices) > 0]
+        codes = [code for code, _ in items]
+        lengths = np.array([len(prices) for _, prices in items], dtype=np.int64)
+        bars = int(lengths.max()) if len(items) else 0
+        
+        dates = np.full((bars, len(items)), np.datetime64('NaT', 'ns'), dtype='datetime64[ns]')
+        columns = {name: np.full((bars, len(items)), np.nan) for name in PANEL_COLUMNS}
+        for i, (code, prices) in enumerate(items):
+            start = bars - lengths[i]
+            dates[start:, i] = np.asarray(prices['Date'], dtype='datetime64[ns]')
+            for name in PANEL_COLUMNS:
+                if name in prices:
+                    columns[name][start:, i] = prices[name]
+        return cls(codes, dates, columns, lengths)
+    
+    @property
+    def bars(self) -> int:
+        """行数（最も長い銘柄の足の本数）"""
+        return self.dates.shape[0]
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    @classmethod
+    def concat(cls, panels: List["PricePanel"]) -> "PricePanel":
+        """
+        パネルを銘柄方向に並べて1つにする
+        
+        足の本数が違うパネルは、短い方の先頭をNaN（日付はNaT）で埋めて最新の足を揃える。
+        """
+        bars = max((panel.bars for panel in panels), default=0)
+        codes = [code for panel in panels for code in panel.codes]
+        dates = np.full((bars, len(codes)), np.datetime64('NaT', 'ns'), dtype='datetime64[ns]')
+        columns = {name: np.full((bars, len(codes)), np.nan) for name in PANEL_COLUMNS}
+        start = 0
+        for panel in panels:
+            stop = start + len(panel)
+            dates[bars - panel.bars:, start:stop] = panel.dates
+            for name in PANEL_COLUMNS:
+                columns[name][bars - panel.bars:, start:stop] = panel[name]
+            start = stop
+        lengths = np.concatenate([panel.lengths for panel in panels]) if panels else np.zeros(0, dtype=np.int64)
+        return cls(codes, dates, columns, lengths)
+    
+    def select(self, cols: List[int]) -> "PricePanel":
+        """指定した列（銘柄）だけのパネル（行数はそのまま）"""
+        columns = {name: values[:, cols] for name, values in self._columns.items()}
+        return PricePanel([self.codes[i] for i in cols], self.dates[:, cols], columns, self.lengths[cols])
+    
+    def column(self, code: str, prices=None) -> Optional[int]:
+        """
+        銘柄の列番号を返す（無ければNone）
+        
+        pricesを渡した場合は、最終日が一致し、パネルがprices以上の本数を持つときだけ
+        返す（複数の手法で共有する長い期間のパネルから短い期間の値も引ける。パネル
+        作成後に履歴が更新された銘柄は、古い指標を使わないようNoneにする）。
+        """
+        i = self.index.get(code)
+        if i is None or prices is None:
+            return i
+        if self.lengths[i] < len(prices) or self.dates[-1, i] != np.asarray(prices['Date'])[-1]:
+            return None
+        return i
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    指数移動平均（pandasのewm(span, adjust=False).mean()と同じ値）
+    
+    各列の先頭のNaNは読み飛ばし、最初の値から計算を始める。途中のNaNの足は
+    前の値を据え置き、pandas（ignore_na=False）と同じく前の値の重みだけを
+    NaNの本数分減衰させてから次の値と平均する。足の方向だけをループし、
+    銘柄方向はまとめて計算する。丸めまで一致させるため、重み・更新式は
+    pandasの実装と同じ順序で計算する。
+    """
+    com = (span - 1) / 2.0
+    alpha = 1.0 / (1.0 + com)
+    factor = 1.0 - alpha
+    out = np.empty(values.shape)
+    weighted = values[0].astype(np.float64)
+    old_wt = np.ones(weighted.shape)
+    out[0] = weighted
+    for i in range(1, len(values)):
+        cur = values[i]
+        started = ~np.isnan(weighted)
+        observed = ~np.isnan(cur)
+        # 前の値の重み（開始前は1、直前の値があれば1、NaNが続いた分だけ減衰）
+        old_wt = np.where(started, old_wt * factor, 1.0)
+        updated = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        # 前の値が無ければ現在値から開始、値が同じなら据え置き（定数列での誤差を避ける）
+        weighted = np.where(started, np.where(~observed | (weighted == cur), weighted, updated), cur)
+        old_wt = np.where(observed, 1.0, old_wt)
+        out[i] = weighted
+    return out
+
+
+def _rolling(values: np.ndarray, window: int, combine) -> Tuple[np.ndarray, int]:
+    """
+    各行で終わる直近window本をcombineで畳み込む（窓の本数に満たない行・NaNを含む窓はNaN）
+    
+    窓の中の位置ごとにずらした配列を順に畳み込むため、作業領域は
+    足 × 銘柄 の配列1つ分で済む。
+    """
+    out = np.full(values.shape, np.nan)
+    rows = len(values) - window + 1
+    if rows <= 0:
+        return out, rows
+    acc = values[:rows].astype(np.float64)
+    for k in range(1, window):
+        acc = combine(acc, values[k:k + rows])
+    out[window - 1:] = acc
+    return out, rows
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """単純移動平均（窓の本数に満たない行はNaN）"""
+    sums, _ = _rolling(values, window, np.add)
+    return sums / window
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """移動標準偏差（不偏、pandasのrolling().std()と丸め誤差の範囲で一致）"""
+    mean = rolling_mean(values, window)
+    out = np.full(values.shape, np.nan)
+    rows = len(values) - window + 1
+    if rows <= 0 or window < 2:
+        return out
+    # 平均からの偏差の2乗和（2パス）で計算し、大きな株価でも桁落ちしないようにする
+    center = mean[window - 1:]
+    ssq = np.zeros_like(center)
+    for k in range(window):
+        ssq += (values[k:k + rows] - center) ** 2
+    out[window - 1:] = np.sqrt(ssq / (window - 1))
+    return out
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """直近window本の最大値"""
+    return _rolling(values, window, np.maximum)[0]
+
+
+def rolling_min(values: np.ndarray, window: int) -> np.ndarray:
+    """直近window本の最小値"""
+    return _rolling(values, window, np.minimum)[0]
+
+
+def stochastic_k(high: np.ndarray, low: np.ndarray, close: np.ndarray, k_period: int = 14) -> np.ndarray:
+    """ストキャスティクスの%K（直近k_period本の高値・安値の中での終値の位置、%）"""
+    highest_high = rolling_max(high, k_period)
+    lowest_low = rolling_min(low, k_period)
+    # 高値と安値が同じ（値幅ゼロ）の足はinf/NaNになる（pandasで計算した場合と同じ）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ((close - lowest_low) / (highest_high - lowest_low)) * 100
+
+
+def stochastic(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    k_period: int = 14,
+    d_period: int = 3
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ストキャスティクスの%Kと%D（%Dは%Kのd_period本の移動平均）"""
+    stoch_k = stochastic_k(high, low, close, k_period)
+    return stoch_k, rolling_mean(stoch_k, d_period)
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """真の値幅（高値-安値、前日終値との差の大きい方。先頭の足は高値-安値）"""
+    prev_close = np.full_like(close, np.nan)
+    prev_close[1:] = close[:-1]
+    return np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """ATR（真の値幅の指数移動平均）"""
+    return ema(true_range(high, low, close), period)
+
+
+def window_high(high: np.ndarray, bars: int) -> np.ndarray:
+    """直近bars本の最高値（銘柄ごとの1次元配列、NaNは無視）"""
+    return np.fmax.reduce(high[-bars:], axis=0)
+
+
+def bars_since_high(high: np.ndarray, bars: int) -> np.ndarray:
+    """直近bars本の最高値を付けた足が何本前か（同値なら古い方、NaNは無視、銘柄ごとの1次元配列）"""
+    recent = high[-bars:]
+    return len(recent) - 1 - np.argmax(np.where(np.isnan(recent), -np.inf, recent), axis=0)
+
+
+# 指標名 → 計算関数（第1引数はIndicatorSet、残りは指標のパラメータ）
+# 他の指標から求めるもの（%Dなど）はIndicatorSet.series()経由で計算済みの値を再利用する
+INDICATORS: Dict[str, Callable[..., np.ndarray]] = {
+    "open": lambda ind: ind.panel['Open'],
+    "high": lambda ind: ind.panel['High'],
+    "low": lambda ind: ind.panel['Low'],
+    "close": lambda ind: ind.panel['Close'],
+    "volume": lambda ind: ind.panel['Volume'],
+    "ema": lambda ind, span: ema(ind.series("close"), span),
+    "sma": lambda ind, window: rolling_mean(ind.series("close"), window),
+    "std": lambda ind, window: rolling_std(ind.series("close"), window),
+    "stoch_k": lambda ind, k_period, d_period: stochastic_k(
+        ind.series("high"), ind.series("low"), ind.series("close"), k_period),
+    "stoch_d": lambda ind, k_period, d_period: rolling_mean(ind.series("stoch_k", k_period, d_period), d_period),
+    "atr": lambda ind, period: ema(true_range(ind.series("high"), ind.series("low"), ind.series("close")), period),
+    "window_high": lambda ind, bars: window_high(ind.series("high"), bars),
+    "bars_since_high": lambda ind, bars: bars_since_high(ind.series("high"), bars),
+}
+
+# compute_all()で事前計算する指標（スクリーニングで使う組み合わせ）
+DEFAULT_INDICATORS: List[Tuple] = [
+    ("ema", 10),
+    ("ema", 20),
+    ("ema", 50),
+    ("sma", 20),
+    ("std", 20),
+    ("stoch_k", 14, 3),
+    ("stoch_d", 14, 3),
+    ("atr", 14),
+]
+
+
+# パネルの列そのもの（メモ化の対象外）
+PRICE_INDICATORS = frozenset(name.lower() for name in PANEL_COLUMNS)
+
+
+class IndicatorMemo:
+    """
+    銘柄ごとの指標のメモ（銘柄コード, 最終足の日付, 指標名, パラメータ, 本数）→ 値
+    
+    1回の実行の中で、手法ごとのIndicatorSetや銘柄単位の計算、指標の値を返す
+    APIが同じ指標を計算し直さないようにする。足方向の指標（EMAなど）は履歴の
+    長さで値が変わるため、計算に使った本数と同じ本数の履歴にだけ使い回す。
+    窓の集計（最高値など、第1パラメータが窓の本数）は窓に入る本数が同じなら
+    同じ値なので、本数が違っても使い回す。
+    
+    件数がmax_entriesを超えたら、最も長く使われていないものから捨てる（LRU）。
+    """
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: 保持する件数の上限（銘柄 × 指標 × 本数ごとに1件）。Noneなら無制限
+        """
+        self._entries: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    @staticmethod
+    def _window(key: Tuple, length: int) -> Optional[int]:
+        """窓の集計として使い回せる場合の本数（窓に入る本数）。窓より短い履歴ならNone"""
+        if len(key) > 1 and isinstance(key[1], int) and length > key[1]:
+            return key[1]
+        return None
+    
+    def get(self, code: str, last_date: int, key: Tuple, length: int) -> Optional[np.ndarray]:
+        """
+        メモした値を返す（無い・使えない場合はNone）
+        
+        Args:
+            code: 銘柄コード
+            last_date: 最終足の日付（datetime64[ns]の整数値）
+            key: (指標名, パラメータ...)
+            length: 求める側の履歴の本数
+        
+        Returns:
+            足方向の指標は最新の足で終わる1次元配列、窓の集計は0次元配列
+        """
+        slot = (code, last_date) + key + (length,)
+        values = self._entries.get(slot)
+        window = self._window(key, length)
+        if values is None and window is not None:
+            slot = (code, last_date) + key + (window,)
+            values = self._entries.get(slot)
+            if values is not None and values.ndim != 0:
+                values = None  # 足方向の指標は本数が違えば使わない
+        if values is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(slot)
+        self.stats["hits"] += 1
+        return values
+    
+    def put(self, code: str, last_date: int, key: Tuple, length: int, values: np.ndarray) -> None:
+        """値をメモする（lengthは計算に使った履歴の本数）"""
+        window = self._window(key, length)
+        if values.ndim == 0 and window is not None:
+            length = window
+        slot = (code, last_date) + key + (length,)
+        self._entries[slot] = values
+        self._entries.move_to_end(slot)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """ヒット数・ミス数・破棄数・ヒット率・メモ件数"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups * 100, 1) if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+    
+    def log_stats(self) -> None:
+        """統計をログ出力"""
+        stats = self.get_stats()
+        logger.info(f"指標メモ: ヒット={stats['hits']}, ミス={stats['misses']}, "
+                    f"ヒット率={stats['hit_rate']}%, 件数={stats['entries']}, 破棄={stats['evictions']}")
+
+
+class IndicatorSet:
+    """
+    パネル全体の指標を保持し、銘柄の列番号で値を引く
+    
+    指標は (名前, パラメータ) ごとに1度だけ計算し、全銘柄分の配列を保持する。
+    compute_all()で事前に計算しておけば、銘柄ごとのスクリーニングは
+    value()で最新値を引くだけになる。memoを渡した場合は、他のIndicatorSetで
+    計算済みの銘柄の値を使い、残りの銘柄だけを計算する。
+    """
+    
+    def __init__(self, panel: PricePanel, memo: Optional[IndicatorMemo] = None):
+        self.panel = panel
+        self.memo = memo
+        self._values: Dict[Tuple, np.ndarray] = {}
+        self._recent: Dict[Tuple, np.ndarray] = {}
+        self._latest: Dict[Tuple, list] = {}
+        self.compute_seconds = 0.0
+    
+    def series(self, name: str, *params) -> np.ndarray:
+        """指標の全銘柄分の配列（足 × 銘柄、高値などの窓の集計は銘柄ごとの1次元）"""
+        key = (name,) + params
+        values = self._values.get(key)
+        if values is None:
+            if self.memo is None or name in PRICE_INDICATORS:
+                values = INDICATORS[name](self, *params)
+            else:
+                values = self._compute_with_memo(key)
+            self._values[key] = values
+        return values
+    
+    def _compute_with_memo(self, key: Tuple) -> np.ndarray:
+        """メモにある銘柄はその値を使い、残りの銘柄の列だけで計算してメモする"""
+        panel = self.panel
+        last_dates = panel.dates[-1].view(np.int64)
+        hits = {}
+        missing = []
+        for col, code in enumerate(panel.codes):
+            values = self.memo.get(code, int(last_dates[col]), key, int(panel.lengths[col]))
+            if values is None:
+                missing.append(col)
+            else:
+                hits[col] = values
+        
+        if not hits:
+            values = INDICATORS[key[0]](self, *key[1:])
+        else:
+            computed = IndicatorSet(panel.select(missing)).series(*key) if missing else None
+            if computed is not None:
+                per_code, dtype = computed.ndim == 1, computed.dtype
+            else:
+                sample = next(iter(hits.values()))
+                per_code, dtype = sample.ndim == 0, sample.dtype
+            if per_code:
+                values = np.empty(len(panel), dtype=dtype)
+                for col, hit in hits.items():
+                    values[col] = hit
+                if missing:
+                    values[missing] = computed
+            else:
+                values = np.full((panel.bars, len(panel)), np.nan)
+                for col, hit in hits.items():
+                    tail = hit[-min(len(hit), int(panel.lengths[col])):]
+                    values[panel.bars - len(tail):, col] = tail
+                if missing:
+                    values[:, missing] = computed
+        self._remember(key, values, missing if hits else range(len(panel)))
+        return values
+    
+    def _remember(self, key: Tuple, values: np.ndarray, cols) -> None:
+        """指定した列の値をメモする（足方向の指標は銘柄の履歴の分だけ）"""
+        if self.memo is None or key[0] in PRICE_INDICATORS:
+            return
+        panel = self.panel
+        last_dates = panel.dates[-1].view(np.int64)
+        for col in cols:
+            length = int(panel.lengths[col])
+            if values.ndim == 1:
+                column = values[col:col + 1].reshape(())
+            else:
+                # 全期間より短い配列は実際の本数でメモし、長い履歴の代わりに使われないようにする
+                column = values[-min(length, len(values)):, col]
+                length = len(column)
+            self.memo.put(panel.codes[col], int(last_dates[col]), key, length, column)
+    
+    def memoize(self, memo: IndicatorMemo) -> "IndicatorSet":
+        """以後の計算でmemoを使い、計算済みの全指標をメモする（プロセスプールで計算した場合など）"""
+        self.memo = memo
+        for key, values in self._values.items():
+            self._remember(key, values, range(len(self.panel)))
+        return self
+    
+    def __contains__(self, key: Tuple) -> bool:
+        """指標 (名前, パラメータ...) が計算済みか"""
+        return tuple(key) in self._values
+    
+    def preset(self, key: Tuple, values: np.ndarray) -> None:
+        """計算済みの指標を設定する（全期間の値。プロセスプールで計算した値など）"""
+        self._values[key] = values
+        self._latest.pop(key, None)
+        self._remember(key, values, range(len(self.panel)))
+    
+    def preset_recent(self, key: Tuple, values: np.ndarray) -> None:
+        """
+        最新の数本だけの指標を設定する（indicator_stateの増分状態から求めた値など）
+        
+        全期間の値ではないため、series()では返さずメモにも入れない。value()・latest()・
+        recent()は本数が足りる範囲でこの値を使い、足りなければ全期間を計算する。
+        """
+        self._recent[key] = values
+        self._latest.pop(key, None)
+    
+    def covers(self, key: Tuple, rows: int = 1) -> bool:
+        """指標の最新rows本の値を計算せずに引けるか（全期間またはpreset_recent()の値）"""
+        key = tuple(key)
+        if key in self._values:
+            return True
+        recent = self._recent.get(key)
+        return recent is not None and (recent.ndim == 1 or len(recent) >= rows)
+    
+    def recent(self, name: str, *params, rows: int = 1) -> np.ndarray:
+        """
+        指標の最新rows本以上の値（series()と同じ形で、足方向は短いことがある）
+        
+        全期間の値が無く、preset_recent()の値がrows本以上あればそれを返す。
+        それ以外はseries()で全期間を返す。
+        """
+        key = (name,) + params
+        if key not in self._values:
+            recent = self._recent.get(key)
+            if recent is not None and (recent.ndim == 1 or len(recent) >= rows):
+                return recent
+        return self.series(name, *params)
+    
+    @classmethod
+    def concat(cls, sets: List["IndicatorSet"]) -> "IndicatorSet":
+        """
+        銘柄のまとまりごとに計算したIndicatorSetを銘柄方向に並べて1つにする
+        
+        計算済みの指標（全期間の値・preset_recent()の値それぞれ）のうち、全ての
+        まとまりにあるものだけを引き継ぐ（足方向の配列は短い方の先頭をNaNで埋めて
+        最新の足を揃える）。
+        """
+        sets = [indicator_set for indicator_set in sets if len(indicator_set.panel) > 0]
+        if len(sets) == 1:
+            return sets[0]
+        merged = cls(PricePanel.concat([indicator_set.panel for indicator_set in sets]))
+        for attr in ("_values", "_recent"):
+            stores = [getattr(indicator_set, attr) for indicator_set in sets]
+            keys = set.intersection(*(set(store) for store in stores)) if stores else set()
+            for key in keys:
+                arrays = [store[key] for store in stores]
+                if arrays[0].ndim == 1:
+                    getattr(merged, attr)[key] = np.concatenate(arrays)
+                    continue
+                rows = max(len(array) for array in arrays)
+                values = np.full((rows, len(merged.panel)), np.nan)
+                start = 0
+                for array in arrays:
+                    values[rows - len(array):, start:start + array.shape[1]] = array
+                    start += array.shape[1]
+                getattr(merged, attr)[key] = values
+        merged.compute_seconds = sum(indicator_set.compute_seconds for indicator_set in sets)
+        return merged
+    
+    def value(self, col: int, name: str, *params, ago: int = 0):
+        """
+        指標の値を1つ返す
+        
+        Args:
+            col: 銘柄の列番号（PricePanel.column()）
+            name: 指標名（INDICATORSのキー）
+            *params: 指標のパラメータ（EMAの期間など）
+            ago: 何本前の値か（0なら最新の足）
+        """
+        values = self.recent(name, *params, rows=ago + 1)
+        if values.ndim == 1:
+            return values[col]
+        return values[-1 - ago, col]
+    
+    def latest(self, name: str, *params) -> list:
+        """
+        指標の最新の足の値を全銘柄分、Pythonの数値のリストで返す
+        
+        銘柄ごとのスクリーニングでは latest(...)[col] で値を引く。numpyのスカラーを
+        経由しないため1銘柄あたりの比較・演算が軽く、値はvalue()と同じ。
+        """
+        key = (name,) + params
+        values = self._latest.get(key)
+        if values is None:
+            values = self.recent(name, *params)
+            values = (values if values.ndim == 1 else values[-1]).tolist()
+            self._latest[key] = values
+        return values
+    
+    def compute_all(self, indicators: Optional[Iterable[Tuple]] = None) -> "IndicatorSet":
+        """
+        指標を全銘柄分まとめて計算する
+        
+        Args:
+            indicators: (名前, パラメータ...)のリスト。省略時はDEFAULT_INDICATORSと
+                パネル全体（最も長い銘柄の本数）の最高値・最高値からの経過本数。
+                preset_recent()で最新の値を設定済みの指標は計算しない
+        """
+        if indicators is None:
+            indicators = DEFAULT_INDICATORS + [
+                ("window_high", self.panel.bars),
+                ("bars_since_high", self.panel.bars),
+            ]
+        started = time.perf_counter()
+        for name, *params in indicators:
+            if not self.covers((name, *params)):
+                self.series(name, *params)
+        self.compute_seconds += time.perf_counter() - started
+        return self
+
+
+def compute_indicators(
+    views: Dict[str, Any],
+    indicators: Optional[Iterable[Tuple]] = None,
+    state_store=None,
+    memo: Optional[IndicatorMemo] = None
+) -> IndicatorSet:
+    """
+    銘柄コード → 株価（PriceView・DataFrame）から全銘柄の指標を一括計算する
+    
+    Args:
+        views: 銘柄コード → 株価
+        indicators: 計算する指標（IndicatorSet.compute_all()と同じ）
+        state_store: 指標の増分状態（indicator_state.IndicatorStateStore）。指定時は
+            状態が最新の銘柄の値を設定し、それ以外の指標だけをパネルで計算する
+        memo: 銘柄ごとの指標のメモ。計算済みの銘柄は計算し直さず、計算した値はメモする
+    
+    Returns:
+        計算済みのIndicatorSet
+    """
+    started = time.perf_counter()
+    panel = PricePanel.from_views(views)
+    build_seconds = time.perf_counter() - started
+    indicator_set = IndicatorSet(panel, memo)
+    applied = 0
+    if state_store is not None:
+        started = time.perf_counter()
+        applied = state_store.apply(indicator_set)
+        indicator_set.compute_seconds += time.perf_counter() - started
+    if len(panel) > 0:
+        indicator_set.compute_all(indicators)
+    logger.info(f"指標一括計算: {len(panel)}銘柄 × {panel.bars}本 "
+                f"(パネル作成{build_seconds * 1000:.0f}ms, 計算{indicator_set.compute_seconds * 1000:.0f}ms, "
+                f"増分状態{applied}銘柄)")
+    return indicator_set
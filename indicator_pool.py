@@ -0,0 +1,138 @@
+"""
+指標計算のプロセスプール
+株価の取得中に、取得済みの銘柄をまとめて別プロセスで指標計算する。
+パネルの配列と計算結果は共有メモリで受け渡し、DataFrameや配列を
+pickleして送らない。指標は銘柄ごとに独立しているため、銘柄単位で
+分割して計算した結果を並べれば全銘柄まとめて計算した場合と一致する。
+"""
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from indicator_engine import PANEL_COLUMNS, IndicatorSet, PricePanel
+
+logger = logging.getLogger(__name__)
+
+
+def _compute_chunk(
+    input_name: str,
+    output_name: str,
+    bars: int,
+    width: int,
+    layout: List[Tuple[Tuple, int, int]]
+) -> None:
+    """
+    ワーカープロセス側: 共有メモリのパネルから指標を計算し、結果を共有メモリに書き込む
+    
+    Args:
+        input_name: パネル（列 × 足 × 銘柄、float64）の共有メモリ名
+        output_name: 結果を書き込む共有メモリ名
+        bars, width: パネルの足の本数・銘柄数
+        layout: (指標のキー, 結果内の開始位置, 行数) のリスト。行数0は銘柄ごとの1次元
+    """
+    source = shared_memory.SharedMemory(name=input_name)
+    target = shared_memory.SharedMemory(name=output_name)
+    try:
+        stacked = np.ndarray((len(PANEL_COLUMNS), bars, width), dtype=np.float64, buffer=source.buf)
+        columns = {name: stacked[i] for i, name in enumerate(PANEL_COLUMNS)}
+        # 指標の計算に日付は使わないため、パネルの日付は空にしておく
+        dates = np.full((bars, width), np.datetime64('NaT', 'ns'), dtype='datetime64[ns]')
+        panel = PricePanel([str(i) for i in range(width)], dates, columns, np.zeros(width, dtype=np.int64))
+        indicator_set = IndicatorSet(panel)
+        results = np.ndarray((target.size // 8,), dtype=np.float64, buffer=target.buf)
+        for key, offset, rows in layout:
+            values = indicator_set.series(*key)
+            size = rows * width if rows else width
+            results[offset:offset + size] = np.asarray(values, dtype=np.float64).ravel()
+        del stacked, columns, panel, indicator_set, results
+    finally:
+        source.close()
+        target.close()
+
+
+class IndicatorPool:
+    """
+    銘柄のまとまりごとに指標をプロセスプールで計算する
+    
+    submit()は計算を投げてすぐ戻るため、イベントループは株価の取得を続けられる。
+    gather()で全てのまとまりの結果を1つのIndicatorSetにまとめる。ワーカー数の
+    既定値は実行環境のCPU数。
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: int = 500):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+    
+    def submit(self, views: Dict[str, Any], indicators: Iterable[Tuple]) -> "asyncio.Task":
+        """
+        銘柄のまとまりの指標計算をワーカーに投げる（すぐに戻る）
+        
+        パネルはこのプロセスで作って共有メモリに置き、結果用の共有メモリも
+        ここで確保する。戻り値のTaskはIndicatorSetを返す。
+        """
+        return asyncio.ensure_future(self._compute(PricePanel.from_views(views), list(indicators)))
+    
+    async def gather(self, tasks: List["asyncio.Task"]) -> IndicatorSet:
+        """submit()した全てのまとまりの結果を待ち、1つのIndicatorSetにまとめる"""
+        return IndicatorSet.concat(list(await asyncio.gather(*tasks)))
+    
+    async def _compute(self, panel: PricePanel, indicators: List[Tuple]) -> IndicatorSet:
+        indicator_set = IndicatorSet(panel)
+        if len(panel) == 0:
+            return indicator_set
+        
+        bars, width = panel.bars, len(panel)
+        # 2次元の指標は足 × 銘柄、窓の集計（最高値など）は銘柄ごとの1次元
+        layout = []
+        offset = 0
+        for key in indicators:
+            rows = 0 if key[0] in ("window_high", "bars_since_high") else bars
+            layout.append((tuple(key), offset, rows))
+            offset += (rows or 1) * width
+        
+        source = shared_memory.SharedMemory(create=True, size=len(PANEL_COLUMNS) * bars * width * 8)
+        target = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 8)
+        try:
+            stacked = np.ndarray((len(PANEL_COLUMNS), bars, width), dtype=np.float64, buffer=source.buf)
+            for i, name in enumerate(PANEL_COLUMNS):
+                stacked[i] = panel[name]
+            del stacked
+            
+            started = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _compute_chunk, source.name, target.name, bars, width, layout
+            )
+            indicator_set.compute_seconds = time.perf_counter() - started
+            
+            results = np.ndarray((offset,), dtype=np.float64, buffer=target.buf)
+            for key, start, rows in layout:
+                if rows:
+                    values = results[start:start + rows * width].reshape(rows, width).copy()
+                else:
+                    values = results[start:start + width].copy()
+                    if key[0] == "bars_since_high":
+                        values = values.astype(np.int64)
+                indicator_set.preset(key, values)
+            del results
+        finally:
+            for shm in (source, target):
+                shm.close()
+                shm.unlink()
+        return indicator_set
+    
+    def shutdown(self) -> None:
+        """ワーカープロセスを終了する"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,482 @@
+"""
+テクニカル指標の増分状態
+銘柄ごとにEMA・ボリンジャーバンド用の移動和・ストキャスティクスと高値の
+単調キューを永続キャッシュの隣に保存し、新しい足が追加されたときは
+1本あたりO(1)で更新する。全期間の再計算は、キャッシュの履歴が末尾への
+追記以外で書き換えられた銘柄（欠損補完・株式分割の調整など）だけで行う。
+
+窓の決まった指標（SMA・標準偏差・ストキャスティクス・最高値）はパネルで
+計算した値と一致する。EMA・ATRは状態を作った時点からの全履歴で平滑化する
+ため、パネルの窓（取得本数）だけで計算した値とは窓より前の足の寄与の分だけ
+ずれる。ずれは窓の先頭の値の重み(1 - α)^本数に比例するため、その重みが
+STATE_TOLERANCE以下の指標だけ状態の値を使い、それ以外はパネルで計算する。
+"""
+import math
+import os
+import pickle
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from indicator_engine import IndicatorSet, PricePanel
+
+logger = logging.getLogger(__name__)
+
+# 状態ファイルの置き場所（キャッシュディレクトリ直下の*.pklは銘柄のキャッシュとして扱われるためサブディレクトリに置く）
+STATE_DIR_NAME = "indicator_state"
+STATE_FILE_NAME = "states.pkl"
+# 状態の形式を変えたら上げる（不一致なら全銘柄を再計算）
+STATE_VERSION = 2
+
+# 状態として保持する指標（スクリーニングで使う組み合わせ）
+EMA_SPANS = (10, 20, 50)
+EMA_HISTORY = 20  # EMAは直近この本数分を保持（20本前のEMA50との比較に使う）
+BAND_WINDOW = 20
+STOCH_PERIODS = (14, 3)
+ATR_PERIOD = 14
+DEFAULT_HIGH_WINDOWS = (200, 245)
+# EMA・ATRを状態の値で置き換えてよい、窓より前の足の重みの上限
+# （EMAは直近EMA_HISTORY本も置き換えるため、EMA20は約110本、EMA50は約250本、ATR14は約65本以上の窓で使う）
+STATE_TOLERANCE = 1e-4
+
+
+def _alpha(span: int) -> float:
+    """EMAの平滑化係数（indicator_engine.ema()と同じ計算順序）"""
+    com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+
+_EMA_ALPHAS = {span: _alpha(span) for span in EMA_SPANS}
+_ATR_ALPHA = _alpha(ATR_PERIOD)
+
+
+def _ema_step(weighted: float, old_wt: float, cur: float, alpha: float) -> Tuple[float, float]:
+    """
+    EMAを1本更新する（indicator_engine.ema()の1行分と同じ値になる）
+    
+    Returns:
+        (更新後の値, 次の足での前の値の重み)。NaNの足では値を据え置き、重みだけを減衰させる
+    """
+    if math.isnan(weighted):
+        return cur, 1.0
+    old_wt *= 1.0 - alpha
+    if math.isnan(cur):
+        return weighted, old_wt
+    if weighted != cur:
+        weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+    return weighted, 1.0
+
+
+def _fmax(a: float, b: float) -> float:
+    """NaNを無視した最大値（np.fmaxと同じ）"""
+    if math.isnan(a):
+        return b
+    if math.isnan(b):
+        return a
+    return a if a >= b else b
+
+
+def _divide(a: float, b: float) -> float:
+    """numpyと同じくゼロ除算をinf/NaNにする割り算"""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a)
+    return a / b
+
+
+class IndicatorState:
+    """
+    1銘柄の指標の増分状態
+    
+    push()で足を古い順に1本ずつ与える。各値はindicator_engineで与えた足の
+    全期間を計算した場合の最新の足の値と一致する（移動和から求めるSMA・
+    標準偏差は丸め誤差の範囲で一致）。
+    """
+    
+    __slots__ = (
+        'bars', 'last_date', 'last_close', 'rewritten_at',
+        'ema', 'ema_weight', 'ema_history', 'atr', 'atr_weight', 'prev_close',
+        'band', 'band_ref', 'band_sum', 'band_sumsq', 'close_nan_at',
+        'high_max', 'low_min', 'hl_nan_at', 'stoch_k',
+        'highs',
+    )
+    
+    def __init__(self, high_windows: Tuple[int, ...] = DEFAULT_HIGH_WINDOWS, rewritten_at=None):
+        self.bars = 0
+        self.last_date: Optional[int] = None  # 最終足の日付（datetime64[ns]の整数値）
+        self.last_close = math.nan
+        self.rewritten_at = rewritten_at
+        self.ema = {span: math.nan for span in EMA_SPANS}
+        self.ema_weight = {span: 1.0 for span in EMA_SPANS}  # 前の値の重み（NaNの足が続くと減衰）
+        self.ema_history = {span: deque(maxlen=EMA_HISTORY) for span in EMA_SPANS}
+        self.atr = math.nan
+        self.atr_weight = 1.0
+        self.prev_close = math.nan
+        # ボリンジャーバンド: 直近の終値と、基準値からの差の和・2乗和
+        self.band = deque(maxlen=BAND_WINDOW)
+        self.band_ref = 0.0
+        self.band_sum = 0.0
+        self.band_sumsq = 0.0
+        self.close_nan_at = -1
+        # ストキャスティクス: (足の番号, 値)の単調キュー（先頭が窓内の最高値・最安値）
+        self.high_max = deque()
+        self.low_min = deque()
+        self.hl_nan_at = -1
+        self.stoch_k = deque(maxlen=STOCH_PERIODS[1])
+        # 長期の最高値: 窓の本数 → 単調キュー（同値は古い足を残す）
+        self.highs = {window: deque() for window in high_windows}
+    
+    def push(self, date: int, high: float, low: float, close: float) -> None:
+        """足を1本追加する"""
+        i = self.bars
+        self.bars += 1
+        
+        for span in EMA_SPANS:
+            self.ema[span], self.ema_weight[span] = _ema_step(
+                self.ema[span], self.ema_weight[span], close, _EMA_ALPHAS[span]
+            )
+            self.ema_history[span].append(self.ema[span])
+        
+        prev_close = self.prev_close
+        true_range = _fmax(_fmax(high - low, abs(high - prev_close)), abs(low - prev_close))
+        self.atr, self.atr_weight = _ema_step(self.atr, self.atr_weight, true_range, _ATR_ALPHA)
+        self.prev_close = close
+        
+        self._push_band(i, close)
+        self._push_stochastic(i, high, low, close)
+        
+        if not math.isnan(high):
+            for window, queue in self.highs.items():
+                while queue and queue[-1][1] < high:
+                    queue.pop()
+                queue.append((i, high))
+        for window, queue in self.highs.items():
+            while queue and queue[0][0] <= i - window:
+                queue.popleft()
+        
+        self.last_date = date
+        self.last_close = close
+    
+    def _push_band(self, i: int, close: float) -> None:
+        """移動和・2乗和を更新（窓が一巡するごとに足し直し、誤差を溜めない）"""
+        if math.isnan(close):
+            self.close_nan_at = i
+        full = len(self.band) == BAND_WINDOW
+        dropped = self.band[0] if full else 0.0
+        self.band.append(close)
+        clean = self.close_nan_at <= i - BAND_WINDOW
+        if i % BAND_WINDOW == 0 or (clean and math.isnan(self.band_sum)):
+            self.band_ref = self.band[0]
+            self.band_sum = math.fsum(v - self.band_ref for v in self.band)
+            self.band_sumsq = math.fsum((v - self.band_ref) ** 2 for v in self.band)
+            return
+        if full:
+            self.band_sum -= dropped - self.band_ref
+            self.band_sumsq -= (dropped - self.band_ref) ** 2
+        self.band_sum += close - self.band_ref
+        self.band_sumsq += (close - self.band_ref) ** 2
+    
+    def _push_stochastic(self, i: int, high: float, low: float, close: float) -> None:
+        """%K用の最高値・最安値の単調キューと%Kの履歴を更新"""
+        k_period = STOCH_PERIODS[0]
+        if math.isnan(high) or math.isnan(low):
+            self.hl_nan_at = i
+        if not math.isnan(high):
+            while self.high_max and self.high_max[-1][1] <= high:
+                self.high_max.pop()
+            self.high_max.append((i, high))
+        if not math.isnan(low):
+            while self.low_min and self.low_min[-1][1] >= low:
+                self.low_min.pop()
+            self.low_min.append((i, low))
+        while self.high_max and self.high_max[0][0] <= i - k_period:
+            self.high_max.popleft()
+        while self.low_min and self.low_min[0][0] <= i - k_period:
+            self.low_min.popleft()
+        
+        stoch_k = math.nan
+        if self.bars >= k_period and self.hl_nan_at <= i - k_period:
+            highest_high = self.high_max[0][1]
+            lowest_low = self.low_min[0][1]
+            stoch_k = _divide(close - lowest_low, highest_high - lowest_low) * 100
+        self.stoch_k.append(stoch_k)
+    
+    def _band_ready(self) -> bool:
+        return self.bars >= BAND_WINDOW and self.close_nan_at <= self.bars - 1 - BAND_WINDOW
+    
+    def sma(self) -> float:
+        """直近BAND_WINDOW本の単純移動平均"""
+        if not self._band_ready():
+            return math.nan
+        return self.band_ref + self.band_sum / BAND_WINDOW
+    
+    def std(self) -> float:
+        """直近BAND_WINDOW本の標準偏差（不偏）"""
+        if not self._band_ready():
+            return math.nan
+        variance = (self.band_sumsq - self.band_sum * self.band_sum / BAND_WINDOW) / (BAND_WINDOW - 1)
+        return math.sqrt(max(variance, 0.0))
+    
+    def stoch_d(self) -> float:
+        """%D（%Kの移動平均、indicator_engine.rolling_mean()と同じ順序で足す）"""
+        if len(self.stoch_k) < self.stoch_k.maxlen:
+            return math.nan
+        total = self.stoch_k[0]
+        for k in list(self.stoch_k)[1:]:
+            total = total + k
+        return total / self.stoch_k.maxlen
+    
+    def window_high(self, window: int) -> float:
+        """直近window本の最高値"""
+        queue = self.highs[window]
+        return queue[0][1] if queue else math.nan
+    
+    def bars_since_high(self, window: int) -> int:
+        """直近window本の最高値を付けた足が何本前か（高値が無ければwindow-1、indicator_engineと同じ）"""
+        queue = self.highs[window]
+        if not queue:
+            return min(window, self.bars) - 1
+        return self.bars - 1 - queue[0][0]
+
+
+def _price_arrays(prices, start: int = 0):
+    """株価（PriceView・DataFrame）のstart行目以降の日付（整数値）・高値・安値・終値の配列"""
+    dates = np.asarray(prices['Date'], dtype='datetime64[ns]').view(np.int64)
+    return (dates[start:],
+            np.asarray(prices['High'], dtype=np.float64)[start:],
+            np.asarray(prices['Low'], dtype=np.float64)[start:],
+            np.asarray(prices['Close'], dtype=np.float64)[start:])
+
+
+def _same_price(a: float, b: float) -> bool:
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def _within_tolerance(alpha: float, state_bars: np.ndarray, lengths: np.ndarray, rows: int) -> bool:
+    """
+    EMA系の指標の最新rows本を状態の値で置き換えてよいか
+    
+    状態がパネルの列と同じ足から始まっていれば値は一致する。それより前の足も
+    含んでいれば、置き換える最も古い足での窓の先頭の値の重み(1 - α)^(本数 - rows)
+    がSTATE_TOLERANCE以下のときだけ使う。
+    """
+    longer = state_bars > lengths
+    return not np.any(longer & ((1.0 - alpha) ** (lengths - rows).astype(np.float64) > STATE_TOLERANCE))
+
+
+class IndicatorStateStore:
+    """
+    全銘柄の指標の増分状態（永続キャッシュの隣に1ファイルで保存）
+    
+    update()で永続キャッシュのエントリと突き合わせて状態を最新にし、
+    apply()でIndicatorSetに最新の足の値を設定する。
+    """
+    
+    def __init__(self, cache_dir, high_windows: Tuple[int, ...] = DEFAULT_HIGH_WINDOWS):
+        self.path = Path(cache_dir).expanduser() / STATE_DIR_NAME / STATE_FILE_NAME
+        self.high_windows = tuple(high_windows)
+        self.states: Dict[str, IndicatorState] = {}
+        self.stats = {"unchanged": 0, "incremental": 0, "appended_bars": 0, "rebuilt": 0, "rebuilt_bars": 0,
+                      "applied": 0, "fallback": 0}
+        self._dirty = False
+        self._loaded = False
+    
+    def _spec(self) -> tuple:
+        """保持している指標の組み合わせ（保存時と異なれば状態を使わない）"""
+        return (EMA_SPANS, EMA_HISTORY, BAND_WINDOW, STOCH_PERIODS, ATR_PERIOD, self.high_windows)
+    
+    def load(self) -> int:
+        """
+        保存済みの状態を読み込む（形式・指標の組み合わせが異なる場合は破棄）
+        
+        Returns:
+            読み込んだ銘柄数
+        """
+        self._loaded = True
+        if not self.path.exists():
+            return 0
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"指標状態の読み込みエラー（全銘柄を再計算）: {e}")
+            return 0
+        if data.get('version') != STATE_VERSION or data.get('spec') != self._spec():
+            logger.info("指標状態の形式が異なるため全銘柄を再計算します")
+            return 0
+        self.states = data['states']
+        return len(self.states)
+    
+    def save(self) -> bool:
+        """変更があれば状態を保存（一時ファイルに書いてから置き換える）"""
+        if not self._dirty:
+            return True
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            data = {'version': STATE_VERSION, 'spec': self._spec(), 'states': self.states}
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
+        except Exception as e:
+            logger.warning(f"指標状態の保存エラー: {e}")
+            return False
+    
+    def update(self, code: str, prices, rewritten_at=None, history=None) -> IndicatorState:
+        """
+        銘柄の状態を最新の株価に合わせて更新する
+        
+        状態の最終足がpricesに含まれ、終値が一致し、キャッシュの書き換え記録
+        （メタ情報のrewritten_at）が状態を作った時点と同じなら、それ以降の足だけを
+        追加する。それ以外は全期間（history）から作り直す。
+        
+        Args:
+            code: 銘柄コード
+            prices: 直近の株価（PriceView・DataFrame、Date昇順）
+            rewritten_at: キャッシュのメタ情報のrewritten_at
+            history: 作り直すときに使う全期間の株価（DataFrame、またはそれを返す関数）。省略時はprices
+        """
+        if not self._loaded:
+            self.load()
+        state = self.states.get(code)
+        if state is not None and state.rewritten_at == rewritten_at and state.last_date is not None and len(prices) > 0:
+            dates = np.asarray(prices['Date'], dtype='datetime64[ns]').view(np.int64)
+            pos = int(np.searchsorted(dates, state.last_date))
+            if pos < len(dates) and dates[pos] == state.last_date \
+                    and _same_price(float(np.asarray(prices['Close'])[pos]), state.last_close):
+                if pos == len(dates) - 1:
+                    self.stats["unchanged"] += 1
+                    return state
+                bars = _price_arrays(prices, pos + 1)
+                self.stats["incremental"] += 1
+                self.stats["appended_bars"] += len(bars[0])
+                self._push_all(code, state, bars)
+                return state
+        
+        if history is None:
+            history = prices
+        elif callable(history):
+            history = history()
+        state = IndicatorState(self.high_windows, rewritten_at)
+        bars = _price_arrays(history)
+        self.stats["rebuilt"] += 1
+        self.stats["rebuilt_bars"] += len(bars[0])
+        self._push_all(code, state, bars)
+        return state
+    
+    def _push_all(self, code: str, state: IndicatorState, bars) -> None:
+        for values in zip(*(array.tolist() for array in bars)):
+            state.push(*values)
+        self.states[code] = state
+        self._dirty = True
+    
+    def _synced(self, code: str, panel: PricePanel, col: int) -> Optional[IndicatorState]:
+        """パネルの最新の足と状態の最終足が同じならその状態を返す"""
+        state = self.states.get(code)
+        if state is None or state.last_date is None:
+            return None
+        if int(panel.dates[-1, col].view(np.int64)) != state.last_date:
+            return None
+        if not _same_price(float(panel['Close'][-1, col]), state.last_close):
+            return None
+        return state
+    
+    def apply(self, indicator_set: IndicatorSet) -> int:
+        """
+        状態から求めた最新の足の指標をIndicatorSetに設定する
+        
+        状態が無い・最新でない銘柄は、その銘柄だけのパネルで従来どおり計算して埋める。
+        足方向の指標は最新の数本（EMAはEMA_HISTORY本、それ以外は1本）しか持たないため
+        IndicatorSet.preset_recent()で設定し、全期間の系列（series()）は別に計算させる。
+        窓の集計（最高値・最高値からの経過本数）は全期間の値と同じなのでpreset()で設定する。
+        EMA・ATRは窓より前の足の重みがSTATE_TOLERANCEを超えるなら、最高値は窓が取得本数より
+        長いなら設定せず、パネルで計算させる。
+        
+        Returns:
+            状態を使った銘柄数
+        """
+        panel = indicator_set.panel
+        if len(panel) == 0:
+            return 0
+        cols = []
+        states = []
+        missing = []
+        for col, code in enumerate(panel.codes):
+            state = self._synced(code, panel, col)
+            if state is None:
+                missing.append(col)
+            else:
+                cols.append(col)
+                states.append(state)
+        self.stats["applied"] += len(cols)
+        self.stats["fallback"] += len(missing)
+        if not cols:
+            return 0
+        
+        k_period, d_period = STOCH_PERIODS
+        ema_rows = min(EMA_HISTORY, panel.bars)
+        lengths = panel.lengths[cols]
+        state_bars = np.array([state.bars for state in states], dtype=np.int64)
+        values = {}
+        for span in EMA_SPANS:
+            if not _within_tolerance(_EMA_ALPHAS[span], state_bars, lengths, ema_rows):
+                continue
+            array = np.full((ema_rows, len(panel)), np.nan)
+            for col, state in zip(cols, states):
+                history = list(state.ema_history[span])[-ema_rows:]
+                array[ema_rows - len(history):, col] = history
+            values[("ema", span)] = array
+        latest = {
+            ("sma", BAND_WINDOW): IndicatorState.sma,
+            ("std", BAND_WINDOW): IndicatorState.std,
+            ("stoch_k", k_period, d_period): lambda state: state.stoch_k[-1],
+            ("stoch_d", k_period, d_period): IndicatorState.stoch_d,
+        }
+        if _within_tolerance(_ATR_ALPHA, state_bars, lengths, 1):
+            latest[("atr", ATR_PERIOD)] = lambda state: state.atr
+        for key, getter in latest.items():
+            array = np.full((1, len(panel)), np.nan)
+            array[0, cols] = [getter(state) for state in states]
+            values[key] = array
+        for window in self.high_windows:
+            if np.any((state_bars > lengths) & (lengths < window)):
+                continue  # 窓より短い列は、パネルでは取得した足の中での最高値になる
+            highs = np.full(len(panel), np.nan)
+            highs[cols] = [state.window_high(window) for state in states]
+            values[("window_high", window)] = highs
+            since = np.zeros(len(panel), dtype=np.int64)
+            since[cols] = [state.bars_since_high(window) for state in states]
+            values[("bars_since_high", window)] = since
+        
+        if missing:
+            # 状態の無い銘柄は計算済みの値（プロセスプールで計算した場合など）か、
+            # その列だけのパネルで計算した値を同じ形に切り出して埋める
+            fallback = IndicatorSet(panel.select(missing))
+            for key, array in values.items():
+                if key in indicator_set:
+                    computed = indicator_set.series(*key)[..., missing]
+                else:
+                    computed = fallback.series(*key)
+                if array.ndim == 1:
+                    array[missing] = computed
+                else:
+                    array[:, missing] = computed[-len(array):]
+        
+        for key, array in values.items():
+            if array.ndim == 1:
+                indicator_set.preset(key, array)
+            else:
+                indicator_set.preset_recent(key, array)
+        return len(cols)
+    
+    def log_stats(self) -> None:
+        """更新結果をログ出力"""
+        stats = self.stats
+        logger.info(f"指標状態: 増分更新{stats['incremental']}銘柄（{stats['appended_bars']}本）, "
+                    f"変更なし{stats['unchanged']}銘柄, 再計算{stats['rebuilt']}銘柄（{stats['rebuilt_bars']}本）, "
+                    f"適用{stats['applied']}銘柄, 状態なし{stats['fallback']}銘柄")
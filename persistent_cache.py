@@ -6,15 +6,219 @@ GitHub Actionsのキャッシュ機能と連携して、株価データを永続
 """
 
 import os
+import json
+import time
+import zlib
 import pickle
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
+from trading_day_helper import TRADING_CALENDAR_FILE
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # lz4は任意依存（未インストールならzlibを使う）
+    lz4_frame = None
+
 logger = logging.getLogger(__name__)
 
+# コンパクト形式で保存する列（スクリーニングで使う列のみ）
+CACHE_PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+CACHE_VOLUME_COLUMN = 'Volume'
+# 株式分割などの調整係数（取得データにのみ含まれ、保存時は調整済みの値に反映する）
+ADJUSTMENT_FACTOR_COLUMN = 'AdjustmentFactor'
+
+# キャッシュ形式の移行済みマーカー（*.pklのglobに掛からない名前にする）
+FORMAT_MARKER_NAME = "cache_format.json"
+CACHE_FORMAT = "compact"
+# 保存形式のバージョン（形式を変えたら上げ、cache_tools.py migrate で一括移行する）
+#   1: コンパクト形式（チェックサムなし）
+#   2: チェックサム・バージョン付きのコンパクト形式
+# 通常の読み込みは現行バージョンのみ受け付け、旧形式の解釈は移行・統合時だけ行う
+CACHE_SCHEMA_VERSION = 2
+
+# 読み込めない・検証に失敗したキャッシュの退避先（cache_dir配下のサブディレクトリ）と修復待ち一覧
+QUARANTINE_DIR_NAME = "quarantine"
+REPAIR_QUEUE_FILE = "repair_queue.json"
+# コンパクト形式の列ごとの型
+CACHE_COLUMN_DTYPES = dict(
+    [('Date', np.dtype(np.int32))]
+    + [(col, np.dtype(np.float32)) for col in CACHE_PRICE_COLUMNS]
+    + [(CACHE_VOLUME_COLUMN, np.dtype(np.int64))]
+)
+
+# 1銘柄あたりの保持本数の既定値（スクリーニングで使う最長の期間 = 52週高値の245本）。
+# daily_data_collection.PERSISTENT_CACHE_RETENTION_BARSの既定値と揃える
+DEFAULT_RETENTION_BARS = 245
+
+# 途中欠損の区間がこれより多い場合は、先頭～末尾の1区間にまとめて取得する
+MAX_GAP_SPANS = 5
+
+# J-Quantsの一括ダウンロード（CSV）の列名をV1形式に揃える（V1形式の列名はそのまま）
+BULK_COLUMN_MAPPING = {
+    "D": "Date",
+    "O": "Open",
+    "H": "High",
+    "L": "Low",
+    "C": "Close",
+    "V": "Volume",
+    "Vo": "Volume",
+    "AdjFactor": ADJUSTMENT_FACTOR_COLUMN
+}
+# 一括ファイルに必要な列（列名をV1形式に揃えた後）
+BULK_REQUIRED_COLUMNS = ['Code', 'Date'] + CACHE_PRICE_COLUMNS
+BULK_FILE_PATTERNS = ("*.csv", "*.csv.gz", "*.csv.bz2", "*.csv.xz", "*.csv.zip", "*.zip")
+
+
+def _encode_frame(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    DataFrameをコンパクトな列配列に変換する
+
+    日付は1970-01-01からの日数（int32）、四本値はfloat32、出来高はint64とし、
+    V2 APIの余分な列（売買代金・調整後値など）は保存しない。
+    """
+    dates = pd.to_datetime(df['Date']).values.astype('datetime64[D]').astype(np.int32)
+    columns = {'Date': dates}
+    for col in CACHE_PRICE_COLUMNS:
+        columns[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float32)
+    if CACHE_VOLUME_COLUMN in df.columns:
+        volume = pd.to_numeric(df[CACHE_VOLUME_COLUMN], errors='coerce').fillna(0)
+        columns[CACHE_VOLUME_COLUMN] = volume.to_numpy().astype(np.int64)
+    else:
+        columns[CACHE_VOLUME_COLUMN] = np.zeros(len(df), dtype=np.int64)
+    return columns
+
+
+def _decode_frame(columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """_encode_frame()の逆変換（Date列はdatetime64に戻す）"""
+    data = {'Date': columns['Date'].astype('datetime64[D]').astype('datetime64[ns]')}
+    for col in CACHE_PRICE_COLUMNS:
+        data[col] = columns[col]
+    data[CACHE_VOLUME_COLUMN] = columns[CACHE_VOLUME_COLUMN]
+    return pd.DataFrame(data)
+
+
+def _apply_adjustment_factors(df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[List[Tuple[str, float]]]]:
+    """
+    J-Quantsの調整係数（AdjustmentFactor）で取得データを最新基準に揃える
+
+    調整係数は権利落ち日の行に入り（例: 1:2の株式分割なら0.5）、それより前の
+    四本値に掛けると分割後の水準になる。出来高は逆数を掛ける。
+
+    Returns:
+        (調整済みDataFrame, 検出した調整イベント[(YYYYMMDD, 係数)])。
+        調整係数の列が無い場合はイベントをNoneとして元のDataFrameを返す
+    """
+    if ADJUSTMENT_FACTOR_COLUMN not in df.columns:
+        return df, None
+
+    df = df.assign(Date=pd.to_datetime(df['Date'])).sort_values('Date').reset_index(drop=True)
+    factors = pd.to_numeric(df[ADJUSTMENT_FACTOR_COLUMN], errors='coerce').fillna(1.0)
+    factors = factors.where(factors > 0, 1.0).to_numpy(dtype=np.float64)
+    event_mask = factors != 1.0
+    events = [
+        (date.strftime('%Y%m%d'), float(factor))
+        for date, factor in zip(df['Date'][event_mask], factors[event_mask])
+    ]
+    df = df.drop(columns=[ADJUSTMENT_FACTOR_COLUMN])
+    if not events:
+        return df, events
+
+    # 各行の倍率 = その行より後の調整係数の積
+    multipliers = np.append(np.cumprod(factors[::-1])[::-1][1:], 1.0)
+    return _rescale_frame(df, multipliers), events
+
+
+def _rescale_frame(df: pd.DataFrame, multipliers: np.ndarray) -> pd.DataFrame:
+    """四本値に倍率を掛け、出来高を倍率で割る"""
+    updates = {
+        col: pd.to_numeric(df[col], errors='coerce') * multipliers
+        for col in CACHE_PRICE_COLUMNS if col in df.columns
+    }
+    if CACHE_VOLUME_COLUMN in df.columns:
+        updates[CACHE_VOLUME_COLUMN] = (pd.to_numeric(df[CACHE_VOLUME_COLUMN], errors='coerce') / multipliers).round()
+    return df.assign(**updates)
+
+
+def _event_multipliers(dates: pd.Series, events: List[Tuple[str, float]]) -> np.ndarray:
+    """各日付より後に発生した調整イベントの係数の積を返す"""
+    multipliers = np.ones(len(dates))
+    date_values = pd.to_datetime(dates).to_numpy()
+    for event_date, factor in events:
+        multipliers[date_values < np.datetime64(pd.to_datetime(event_date, format='%Y%m%d'))] *= factor
+    return multipliers
+
+
+def _mark_rewritten(meta: dict) -> None:
+    """
+    末尾への追記以外で履歴が変わったことをメタ情報に記録する
+    
+    先頭・途中の補完、調整イベントによる過去分の調整、全期間の再取得、統合・
+    一括取り込みが対象。指標の増分状態はこの値が変わった銘柄だけを再計算する。
+    """
+    meta['rewritten_at'] = time.time_ns()
+
+
+def _schema_problem(columns, last_date: str) -> Optional[str]:
+    """コンパクト形式の列配列を検証し、問題があればその内容を返す（問題なければNone）"""
+    if not isinstance(columns, dict) or set(columns) != set(CACHE_COLUMN_DTYPES):
+        return f"列が不正です: {sorted(columns) if isinstance(columns, dict) else type(columns).__name__}"
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) != 1:
+        return f"列の長さが揃っていません: {sorted(lengths)}"
+    for col, dtype in CACHE_COLUMN_DTYPES.items():
+        if not isinstance(columns[col], np.ndarray) or columns[col].dtype != dtype:
+            return f"{col}列の型が不正です"
+    dates = columns['Date']
+    if len(dates) == 0:
+        return "行がありません"
+    if np.any(np.diff(dates) <= 0):
+        return "日付が昇順になっていません"
+    if np.datetime64(int(dates[-1]), 'D').astype(datetime).strftime('%Y%m%d') != last_date:
+        return "最終日が一致しません"
+    return None
+
+
+def _latency_summary(samples: List[float]) -> dict:
+    """処理時間（秒）の一覧から件数とパーセンタイル（ミリ秒）を求める"""
+    if not samples:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    values = np.asarray(samples) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": len(values),
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+
+def _compress(raw: bytes, compression: Optional[str]) -> bytes:
+    """圧縮方式に応じてバイト列を圧縮"""
+    if compression == 'lz4':
+        return lz4_frame.compress(raw)
+    if compression == 'zlib':
+        return zlib.compress(raw, 1)
+    return raw
+
+
+def _decompress(blob: bytes, compression: Optional[str]) -> bytes:
+    """圧縮方式に応じてバイト列を展開"""
+    if compression == 'lz4':
+        if lz4_frame is None:
+            raise RuntimeError("lz4で圧縮されたキャッシュですが、lz4がインストールされていません")
+        return lz4_frame.decompress(blob)
+    if compression == 'zlib':
+        return zlib.decompress(blob)
+    return blob
+
 
 class PersistentPriceCache:
     """
@@ -26,16 +230,117 @@ class PersistentPriceCache:
     キャッシュキーは銘柄コードのみとし、差分更新に対応します。
     """
     
-    def __init__(self, cache_dir: str = "~/.cache/stock_prices"):
+    def __init__(
+        self,
+        cache_dir: str = "~/.cache/stock_prices",
+        compression: Optional[str] = None,
+        retention_bars: Optional[int] = None,
+        archive_dir: Optional[str] = None,
+        adjustment_policy: str = "rescale"
+    ):
         """
         Args:
             cache_dir: キャッシュディレクトリのパス
+            compression: 保存時の圧縮方式（None / "zlib" / "lz4"）
+            retention_bars: 1銘柄あたりに保持する最大本数（取引日数）。Noneなら無制限
+            archive_dir: 保持期間を超えた古いデータの退避先（Noneなら破棄）
+            adjustment_policy: 差分に株式分割等を検出したときの対応
+                               （"rescale": キャッシュをローカルで調整 / "refetch": その銘柄だけ再取得）
         """
         self.cache_dir = Path(cache_dir).expanduser()
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
+        self.retention_bars = retention_bars
+        self.archive_dir = Path(archive_dir).expanduser() if archive_dir else None
+        if self.archive_dir is not None:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.retention_stats = {"trimmed_codes": 0, "trimmed_rows": 0, "archived_rows": 0, "archive_reads": 0}
+        
+        if adjustment_policy not in ("rescale", "refetch"):
+            raise ValueError(f"未対応の調整方針です: {adjustment_policy}")
+        self.adjustment_policy = adjustment_policy
+        self.adjustment_stats = {
+            "events": 0,
+            "rescaled_codes": 0,
+            "refetched_codes": 0,
+            "expiry_refetches": 0,
+            "expiry_skipped": 0
+        }
+        
+        if compression not in (None, 'zlib', 'lz4'):
+            raise ValueError(f"未対応の圧縮方式です: {compression}")
+        if compression == 'lz4' and lz4_frame is None:
+            logger.warning("lz4がインストールされていないため、zlib圧縮を使用します")
+            compression = 'zlib'
+        self.compression = compression
+        
         self.hits = 0
         self.misses = 0
+        # get_or_fetch_incremental()の結果内訳（どの方針がAPIコールを使っているかの把握用）
+        #   full_hit: API呼び出しなし / partial_hit: 差分を取得して返した / empty_delta: 差分が空
+        #   no_file: キャッシュなし / expired: 期限切れで全期間再取得 / adjustment_refetch: 調整イベントで再取得
+        #   head_short・gap_fill: 先頭不足・途中欠損の補完（上記と重複して数える）
+        self.request_stats = {
+            "requests": 0,
+            "full_hit": 0,
+            "partial_hit": 0,
+            "empty_delta": 0,
+            "no_file": 0,
+            "expired": 0,
+            "adjustment_refetch": 0,
+            "head_short": 0,
+            "gap_fill": 0
+        }
+        # 用途別のAPI呼び出し回数
+        self.api_calls = {"full": 0, "head": 0, "gap": 0, "delta": 0}
+        self.io_stats = {"files_read": 0, "bytes_read": 0, "files_written": 0, "bytes_written": 0}
+        # 処理時間の記録（秒）: load=ファイル読み込み+デコード, merge=取得データのマージ,
+        # save=エンコード+書き込み, fetch=API呼び出し
+        self._latencies: Dict[str, List[float]] = {"load": [], "merge": [], "save": [], "fetch": []}
+        
+        # 欠損検出用の取引カレンダー（set_trading_calendar()で設定）と欠損統計
+        self.trading_calendar: Optional[pd.DatetimeIndex] = None
+        self.gap_stats = {
+            "codes_checked": 0,
+            "codes_with_gaps": 0,
+            "gap_spans": 0,
+            "gap_days": 0,
+            "filled_days": 0,
+            "unfilled_days": 0,
+            "head_backfills": 0
+        }
+        
+        # 破損・検証エラーのキャッシュは隔離し、修復待ち一覧に載せる。
+        # 一覧はファイルに残すため、別プロセス（移行コマンド）で見つかった分も
+        # スクリーニング実行時に1回だけ再取得する。
+        self.quarantine_dir = self.cache_dir / QUARANTINE_DIR_NAME
+        self.repair_queue: Dict[str, str] = self._load_repair_queue()
+        self.corruption_stats = {
+            "unreadable": 0,
+            "checksum": 0,
+            "schema": 0,
+            "outdated": 0,
+            "quarantined": 0,
+            "repaired": 0,
+            "repair_failed": 0
+        }
+        # プリロードのスレッドからも統計を更新するためのロック
+        self._stats_lock = threading.Lock()
+        # 修復待ち一覧のファイル書き込みを順に行うロック（統計のロックの外で書く）
+        self._repair_queue_lock = threading.Lock()
+        
+        # このプロセスで読み書きしたエントリの履歴の書き換え記録（銘柄コード → meta['rewritten_at']）
+        self._rewritten_at: Dict[str, Any] = {}
+        
+        # preload()で一括読み込みしたエントリ（銘柄コード → {'df', 'last_date', 'meta'}）
+        self._preloaded: Dict[str, dict] = {}
+        self.preload_stats = {
+            "files": 0,
+            "loaded": 0,
+            "failed": 0,
+            "bytes_read": 0,
+            "seconds": 0.0
+        }
         
         logger.info(f"永続キャッシュ初期化: {self.cache_dir}")
     
@@ -61,33 +366,314 @@ class PersistentPriceCache:
         Returns:
             (DataFrame, 最終更新日YYYYMMDD)のタプル、失敗時はNone
         """
+        entry = self._load_cache_entry(cache_path)
+        if entry is None:
+            return None
+        return entry['df'], entry['last_date']
+    
+    def _load_cache_entry(self, cache_path: Path) -> Optional[dict]:
+        """
+        キャッシュエントリ（DataFrame・最終更新日・メタ情報）を読み込む
+        
+        preload()で読み込み済みの銘柄はディスクを読まずにメモリから返す。
+        
+        Args:
+            cache_path: キャッシュファイルのパス
+        
+        Returns:
+            {'df', 'last_date', 'meta'}の辞書、失敗時はNone
+        """
+        entry = self._preloaded.get(cache_path.stem)
+        if entry is None:
+            loaded = self._read_cache_file(cache_path)
+            if loaded is None:
+                return None
+            entry = loaded[0]
+        self._rewritten_at[cache_path.stem] = entry['meta'].get('rewritten_at')
+        return entry
+    
+    def rewritten_at(self, stock_code: str):
+        """
+        銘柄の履歴を末尾への追記以外で書き換えた記録（meta['rewritten_at']）を返す
+        
+        このプロセスで最後に読み書きしたエントリの値で、ディスクは読まない。
+        上位のキャッシュ（メモリキャッシュ・指標の増分状態）は、この値が変わったら
+        保持している過去の行を使わずに作り直す。
+        
+        Returns:
+            書き換えた時刻（time.time_ns()）。書き換えが無い・未読み込みならNone
+        """
+        return self._rewritten_at.get(stock_code)
+    
+    def get_entry(self, stock_code: str) -> Optional[dict]:
+        """
+        銘柄のキャッシュエントリ（保持している全期間）を返す
+        
+        プリロード済みならメモリ上のエントリをそのまま返すため、
+        DataFrame・メタ情報は変更しないこと。
+        
+        Returns:
+            {'df', 'last_date', 'meta'}の辞書、無ければNone
+        """
+        return self._load_cache_entry(self._get_cache_path(stock_code))
+    
+    def _read_cache_file(self, cache_path: Path, allow_legacy: bool = False) -> Optional[Tuple[dict, int]]:
+        """
+        キャッシュファイルを読み込んでデコードする（スレッドから呼んでも安全）
+        
+        Args:
+            cache_path: キャッシュファイルのパス
+            allow_legacy: 旧バージョンの形式も読み込む（移行・統合用）
+        
+        Returns:
+            ({'df', 'last_date', 'meta'}, 読み込んだバイト数)、失敗時はNone
+        """
         if not cache_path.exists():
             return None
         
+        started = time.perf_counter()
+        loaded = self._decode_cache_file(cache_path, allow_legacy)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._latencies["load"].append(elapsed)
+            if loaded is not None:
+                self.io_stats["files_read"] += 1
+                self.io_stats["bytes_read"] += loaded[1]
+        return loaded
+    
+    def _decode_cache_file(self, cache_path: Path, allow_legacy: bool = False) -> Optional[Tuple[dict, int]]:
+        """_read_cache_file()の本体（破損・検証エラーは隔離してNoneを返す）"""
+        
         try:
             with open(cache_path, 'rb') as f:
-                data = pickle.load(f)
-            
-            # 新形式: {'df': DataFrame, 'last_date': 'YYYYMMDD'}
-            if isinstance(data, dict) and 'df' in data and 'last_date' in data:
-                return data['df'], data['last_date']
-            
-            # 旧形式（互換性のため）: DataFrameのみ
-            if isinstance(data, pd.DataFrame):
-                # DataFrameから最終日付を取得
-                if 'Date' in data.columns and len(data) > 0:
-                    last_date = pd.to_datetime(data['Date'].iloc[-1]).strftime('%Y%m%d')
-                    return data, last_date
-                else:
-                    return None
-            
+                raw = f.read()
+            data = pickle.loads(raw)
+        except Exception as e:
+            self._mark_corrupt(cache_path, "unreadable", e)
+            return None
+        
+        # 現行形式: {'format', 'schema_version', 'last_date', 'compression', 'checksum', 'blob', 'meta'}
+        if not isinstance(data, dict) or data.get('schema_version') != CACHE_SCHEMA_VERSION:
+            if allow_legacy:
+                return self._decode_legacy(cache_path, data, len(raw))
+            # 移行前のファイルは壊れていないため隔離せず、再取得で上書きする
+            with self._stats_lock:
+                self.corruption_stats["outdated"] += 1
+            logger.warning(f"旧バージョンのキャッシュです [{cache_path.name}]"
+                           f"（python cache_tools.py migrate で移行してください）")
+            return None
+        
+        columns = self._decode_blob(cache_path, data, require_checksum=True)
+        if columns is None:
+            return None
+        entry = {
+            'df': _decode_frame(columns),
+            'last_date': data['last_date'],
+            'meta': data['meta']
+        }
+        return entry, len(raw)
+    
+    def _decode_blob(self, cache_path: Path, data: dict, require_checksum: bool) -> Optional[Dict[str, np.ndarray]]:
+        """
+        コンパクト形式の列配列を展開・検証する（失敗時はNone）
+        
+        require_checksumは現行バージョンの検証で、チェックサムとメタ情報を必須にする。
+        キーの欠けた・型の違うファイルもKeyError等で落とさず、schemaとして隔離する。
+        """
+        problem = None
+        if not isinstance(data.get('blob'), (bytes, bytearray)):
+            problem = "本体（blob）が不正です"
+        elif not isinstance(data.get('last_date'), str):
+            problem = "最終日（last_date）が不正です"
+        elif not isinstance(data.get('meta') if require_checksum else data.get('meta', {}), dict):
+            problem = "メタ情報が不正です"
+        if problem is not None:
+            self._mark_corrupt(cache_path, "schema", problem)
+            return None
+        if data.get('compression') == 'lz4' and lz4_frame is None:
+            # 環境の問題でファイルは壊れていないため隔離しない
+            logger.warning(f"lz4が無いためキャッシュを読み込めません [{cache_path.name}]")
+            return None
+        checksum = data.get('checksum')
+        if (checksum is not None or require_checksum) and zlib.crc32(data['blob']) != checksum:
+            self._mark_corrupt(cache_path, "checksum", "チェックサム不一致")
+            return None
+        try:
+            columns = pickle.loads(_decompress(data['blob'], data.get('compression')))
+        except Exception as e:
+            self._mark_corrupt(cache_path, "unreadable", e)
+            return None
+        problem = _schema_problem(columns, data['last_date'])
+        if problem is not None:
+            self._mark_corrupt(cache_path, "schema", problem)
             return None
+        return columns
+    
+    def _decode_legacy(self, cache_path: Path, data, size: int) -> Optional[Tuple[dict, int]]:
+        """
+        旧バージョンのキャッシュを現行の型（Date列はdatetime64）に揃えて読み込む
         
+        移行（migrate_cache_format）と統合（merge_from）専用。通常の読み込みでは使わない。
+        """
+        # スキーマバージョン1: チェックサムなしのコンパクト形式
+        if isinstance(data, dict) and data.get('format') == CACHE_FORMAT:
+            columns = self._decode_blob(cache_path, data, require_checksum=False)
+            if columns is None:
+                return None
+            return {'df': _decode_frame(columns), 'last_date': data['last_date'],
+                    'meta': data.get('meta', {})}, size
+        
+        # コンパクト形式以前: {'df': DataFrame, 'last_date': 'YYYYMMDD'} またはDataFrameのみ
+        if isinstance(data, dict) and 'df' in data and 'last_date' in data:
+            df = data['df']
+        elif isinstance(data, pd.DataFrame):
+            df = data
+        else:
+            self._mark_corrupt(cache_path, "schema", f"未知の形式です: {type(data).__name__}")
+            return None
+        if not isinstance(df, pd.DataFrame) or not {'Date', *CACHE_PRICE_COLUMNS} <= set(df.columns) or df.empty:
+            self._mark_corrupt(cache_path, "schema", "旧形式のDataFrameの列が不正です")
+            return None
+        try:
+            # 保存形式と同じ列・型に揃える（日付の昇順・重複なし）
+            df = df.assign(Date=pd.to_datetime(df['Date']))
+            df = df.drop_duplicates(subset=['Date'], keep='last').sort_values('Date').reset_index(drop=True)
+            df = _decode_frame(_encode_frame(df))
         except Exception as e:
-            logger.warning(f"キャッシュ読み込みエラー [{cache_path.name}]: {e}")
+            self._mark_corrupt(cache_path, "schema", e)
             return None
+        # 最終日はDataFrameの末尾から求め直す（旧形式の記録値は信用しない）
+        last_date = df['Date'].iloc[-1].strftime('%Y%m%d')
+        return {'df': df, 'last_date': last_date, 'meta': {}}, size
+    
+    def _mark_corrupt(self, cache_path: Path, reason: str, detail) -> None:
+        """
+        破損・検証エラーを記録し、キャッシュ本体のファイルなら隔離して修復待ちにする
+        
+        隔離したファイルは次回以降読み込まれないため、毎回同じ破損で
+        全期間再取得を繰り返すことがなくなる。
+        """
+        logger.warning(f"キャッシュ破損 [{cache_path.name}] ({reason}): {detail}")
+        with self._stats_lock:
+            self.corruption_stats[reason] += 1
+        # 統合元・アーカイブのファイルは動かさない
+        if cache_path.parent != self.cache_dir:
+            return
+        # ファイルの移動・一覧の保存は統計のロックの外で行う（他のスレッドの読み込みを止めない）
+        try:
+            self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(cache_path, self.quarantine_dir / cache_path.name)
+        except OSError as e:
+            logger.warning(f"キャッシュ隔離エラー [{cache_path.name}]: {e}")
+            return
+        with self._stats_lock:
+            self.corruption_stats["quarantined"] += 1
+            self._preloaded.pop(cache_path.stem, None)
+            self.repair_queue[cache_path.stem] = reason
+        self._save_repair_queue()
+    
+    def _load_repair_queue(self) -> Dict[str, str]:
+        """修復待ち一覧（銘柄コード → 破損理由）を読み込む"""
+        path = self.cache_dir / QUARANTINE_DIR_NAME / REPAIR_QUEUE_FILE
+        if not path.exists():
+            return {}
+        try:
+            return dict(json.loads(path.read_text()))
+        except Exception as e:
+            logger.warning(f"修復待ち一覧の読み込みエラー: {e}")
+            return {}
+    
+    def _save_repair_queue(self) -> None:
+        """
+        修復待ち一覧を保存（空ならファイルを消す）
+        
+        書き込みは_repair_queue_lockで順に行い、その中で一覧の写しを取るため、
+        複数のスレッドから呼ばれても最後に書いたものが最新の一覧になる。
+        """
+        path = self.quarantine_dir / REPAIR_QUEUE_FILE
+        with self._repair_queue_lock:
+            with self._stats_lock:
+                queue = dict(self.repair_queue)
+            try:
+                if queue:
+                    self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+                    path.write_text(json.dumps(queue, sort_keys=True))
+                elif path.exists():
+                    path.unlink()
+            except OSError as e:
+                logger.warning(f"修復待ち一覧の保存エラー: {e}")
+    
+    async def _repair(self, stock_code: str, start_date: str, end_date: str, fetch_func) -> Optional[pd.DataFrame]:
+        """隔離した銘柄を全期間再取得する（成否にかかわらず修復待ちから外し、再試行はしない）"""
+        with self._stats_lock:
+            reason = self.repair_queue.pop(stock_code)
+        self._save_repair_queue()
+        df = await self._full_refetch(stock_code, start_date, end_date, fetch_func)
+        repaired = df is not None and not df.empty
+        with self._stats_lock:
+            self.corruption_stats["repaired" if repaired else "repair_failed"] += 1
+        if not repaired:
+            logger.warning(f"キャッシュ修復失敗 [{stock_code}] ({reason})")
+        else:
+            logger.info(f"キャッシュ修復 [{stock_code}] ({reason}): {len(df)}行を再取得")
+        return df
     
-    def _save_cache_data(self, cache_path: Path, df: pd.DataFrame, last_date: str) -> bool:
+    def preload(self, stock_codes: Optional[Iterable[str]] = None, max_workers: int = 8) -> dict:
+        """
+        キャッシュファイルをスレッドプールで一括読み込みしてメモリに保持する
+        
+        スクリーニング中は1銘柄ずつディスク読み込み＋unpickleが発生し、
+        その間イベントループが止まっていた。開始前にまとめて読み込んでおくことで、
+        ディスク待ちを銘柄ごとのクリティカルパスから外す。
+        
+        Args:
+            stock_codes: 読み込む銘柄コード（Noneならキャッシュ全体）
+            max_workers: 読み込みスレッド数
+        
+        Returns:
+            プリロード統計（件数・読み込みバイト数・所要時間）
+        """
+        if stock_codes is None:
+            paths = sorted(self.cache_dir.glob("*.pkl"))
+        else:
+            paths = [self._get_cache_path(code) for code in dict.fromkeys(stock_codes)]
+            paths = [p for p in paths if p.exists()]
+        
+        start = time.perf_counter()
+        loaded = 0
+        failed = 0
+        bytes_read = 0
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for path, result in zip(paths, executor.map(self._read_cache_file, paths)):
+                if result is None:
+                    failed += 1
+                    continue
+                entry, nbytes = result
+                self._preloaded[path.stem] = entry
+                loaded += 1
+                bytes_read += nbytes
+        
+        elapsed = time.perf_counter() - start
+        self.preload_stats = {
+            "files": len(paths),
+            "loaded": loaded,
+            "failed": failed,
+            "bytes_read": bytes_read,
+            "seconds": round(elapsed, 3)
+        }
+        
+        logger.info(f"📦 永続キャッシュ プリロード完了: {loaded}/{len(paths)}件 "
+                    f"({bytes_read / (1024 * 1024):.2f}MB, {elapsed:.2f}秒, 失敗{failed}件)")
+        return self.preload_stats
+    
+    def _save_cache_data(
+        self,
+        cache_path: Path,
+        df: pd.DataFrame,
+        last_date: str,
+        meta: Optional[dict] = None
+    ) -> bool:
         """
         データと最終更新日をキャッシュファイルに保存
         
@@ -95,18 +681,45 @@ class PersistentPriceCache:
             cache_path: キャッシュファイルのパス
             df: 保存するDataFrame
             last_date: 最終更新日（YYYYMMDD）
+            meta: 差分更新用のメタ情報（取得済み範囲・欠損確認済み日付など）
         
         Returns:
             成功したらTrue
         """
+        started = time.perf_counter()
         try:
+            columns = _encode_frame(df)
+            blob = _compress(pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL), self.compression)
             data = {
-                'df': df,
-                'last_date': last_date
+                'format': CACHE_FORMAT,
+                'schema_version': CACHE_SCHEMA_VERSION,
+                'last_date': last_date,
+                'compression': self.compression,
+                'checksum': zlib.crc32(blob),
+                'blob': blob,
+                'meta': meta or {}
             }
             
-            with open(cache_path, 'wb') as f:
-                pickle.dump(data, f)
+            # 一時ファイルに書いてから置き換え、途中で中断しても壊れたファイルを残さない
+            payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, cache_path)
+            with self._stats_lock:
+                self._latencies["save"].append(time.perf_counter() - started)
+                self.io_stats["files_written"] += 1
+                self.io_stats["bytes_written"] += len(payload)
+            
+            if cache_path.parent == self.cache_dir:
+                self._rewritten_at[cache_path.stem] = (meta or {}).get('rewritten_at')
+            # プリロード済みの場合はメモリ上のエントリも最新に差し替える（アーカイブ層は対象外）
+            if cache_path.parent == self.cache_dir and cache_path.stem in self._preloaded:
+                self._preloaded[cache_path.stem] = {
+                    'df': _decode_frame(columns),
+                    'last_date': last_date,
+                    'meta': meta or {}
+                }
             
             logger.debug(f"キャッシュ保存: {cache_path.name} (最終日: {last_date})")
             return True
@@ -115,6 +728,487 @@ class PersistentPriceCache:
             logger.warning(f"キャッシュ保存エラー [{cache_path.name}]: {e}")
             return False
     
+    def migrate_cache_format(self, force: bool = False) -> dict:
+        """
+        既存のキャッシュファイルを現行のスキーマバージョンに一括変換する（初回のみ）
+        
+        旧バージョンのファイルは1度だけ読み直して現行形式で書き直すため、
+        通常の読み込みでは互換処理や型変換を行わずに済む。変換済みの
+        ディレクトリにはバージョン付きのマーカーファイルを置き、2回目以降は
+        ファイルを読まずに即終了する。アーカイブ層も同様に変換する。
+        
+        Args:
+            force: マーカーがあっても全ファイルを確認し直す
+        
+        Returns:
+            移行統計（対象件数・変換件数・失敗件数・変換前後のサイズ）
+        """
+        marker_path = self.cache_dir / FORMAT_MARKER_NAME
+        stats = {"files": 0, "converted": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+        
+        if marker_path.exists() and not force:
+            try:
+                marker = json.loads(marker_path.read_text())
+                if marker.get('schema_version') == CACHE_SCHEMA_VERSION:
+                    logger.info(f"キャッシュはスキーマバージョン{CACHE_SCHEMA_VERSION}に移行済みです（スキップ）")
+                    return stats
+            except Exception as e:
+                logger.warning(f"形式マーカー読み込みエラー: {e}")
+        
+        paths = sorted(self.cache_dir.glob("*.pkl"))
+        if self.archive_dir is not None:
+            paths += sorted(self.archive_dir.glob("*.pkl"))
+        for cache_path in paths:
+            stats["files"] += 1
+            size_before = cache_path.stat().st_size
+            try:
+                with open(cache_path, 'rb') as f:
+                    data = pickle.load(f)
+                if isinstance(data, dict) and data.get('schema_version') == CACHE_SCHEMA_VERSION:
+                    continue
+            except Exception as e:
+                self._mark_corrupt(cache_path, "unreadable", e)
+                stats["failed"] += 1
+                continue
+            
+            loaded = self._read_cache_file(cache_path, allow_legacy=True)
+            if loaded is None:
+                stats["failed"] += 1
+                continue
+            entry, _ = loaded
+            if self._save_cache_data(cache_path, entry['df'], entry['last_date'], entry['meta']):
+                stats["converted"] += 1
+                stats["bytes_before"] += size_before
+                stats["bytes_after"] += cache_path.stat().st_size
+            else:
+                stats["failed"] += 1
+        
+        marker_path.write_text(json.dumps({
+            'format': CACHE_FORMAT,
+            'schema_version': CACHE_SCHEMA_VERSION,
+            'compression': self.compression,
+            'migrated_at': datetime.now().isoformat()
+        }))
+        
+        logger.info(f"キャッシュ移行完了（スキーマバージョン{CACHE_SCHEMA_VERSION}）: "
+                    f"{stats['converted']}/{stats['files']}件変換 "
+                    f"({stats['bytes_before'] / (1024 * 1024):.2f}MB → "
+                    f"{stats['bytes_after'] / (1024 * 1024):.2f}MB, 失敗{stats['failed']}件)")
+        return stats
+    
+    def merge_from(self, source_dirs: Iterable[str]) -> dict:
+        """
+        他のキャッシュディレクトリの内容を銘柄ごとにこのキャッシュへ統合する
+        
+        各銘柄の行は日付の和集合とし、同じ日付は最終日（last_date）が新しい
+        エントリの値を優先する。古いエントリの行は、新しいエントリにだけ記録
+        されている調整イベントで調整してから合わせる。処理順は銘柄コードと
+        (最終日, 行数, パス)で決まるため、引数の順序によらず結果は同じになり、
+        同じ入力で再実行しても内容が変わらない銘柄は書き込まない。
+        
+        Args:
+            source_dirs: 統合元のキャッシュディレクトリ
+        
+        Returns:
+            統合統計（銘柄数・書き込み件数・変更なし件数・読み込み失敗件数・追加行数）
+        """
+        own_dir = self.cache_dir.resolve()
+        sources = sorted({
+            Path(d).expanduser().resolve() for d in source_dirs
+        } - {own_dir})
+        sources = [d for d in sources if d.is_dir()]
+        dirs = [own_dir] + sources
+        codes = sorted({path.stem for d in dirs for path in d.glob("*.pkl")})
+        stats = {"sources": len(sources), "codes": len(codes), "written": 0,
+                 "unchanged": 0, "failed": 0, "rows_added": 0}
+        
+        for code in codes:
+            entries = []
+            existing = None
+            for d in dirs:
+                path = d / f"{code}.pkl"
+                if not path.exists():
+                    continue
+                # 統合元は移行前のことがあるため旧バージョンも読む
+                loaded = self._read_cache_file(path, allow_legacy=True)
+                if loaded is None:
+                    stats["failed"] += 1
+                    continue
+                entries.append((path, loaded[0]))
+                if d == own_dir:
+                    existing = loaded[0]
+            if not entries:
+                continue
+            
+            try:
+                merged_df, meta = self._merge_entries(entries)
+            except Exception as e:
+                logger.warning(f"キャッシュ統合エラー [{code}]: {e}")
+                stats["failed"] += 1
+                continue
+            
+            if existing is not None:
+                # 保存形式（列・型）に揃えてから比較し、変化がなければ書き込まない
+                if (_decode_frame(_encode_frame(merged_df)).equals(existing['df'])
+                        and meta == existing['meta']):
+                    stats["unchanged"] += 1
+                    continue
+                stats["rows_added"] += max(len(merged_df) - len(existing['df']), 0)
+            else:
+                stats["rows_added"] += len(merged_df)
+            
+            _mark_rewritten(meta)
+            if self._save_entry(code, merged_df, meta):
+                stats["written"] += 1
+            else:
+                stats["failed"] += 1
+        
+        self._merge_trading_calendar(sources)
+        
+        logger.info(f"キャッシュ統合完了: {len(sources)}ディレクトリ, {stats['codes']}銘柄 "
+                    f"(書き込み{stats['written']}件, 変更なし{stats['unchanged']}件, "
+                    f"追加{stats['rows_added']}行, 失敗{stats['failed']}件)")
+        return stats
+    
+    def _merge_entries(self, entries: List[Tuple[Path, dict]]) -> Tuple[pd.DataFrame, dict]:
+        """同じ銘柄の複数エントリを1つにまとめる（古い順に重ね、新しい値を優先）"""
+        ordered = sorted(entries, key=lambda item: (item[1]['last_date'], len(item[1]['df']), str(item[0])))
+        
+        merged_df = None
+        events: List[Tuple[str, float]] = []
+        covered_from = []
+        known_missing = set()
+        tracked = True
+        rewritten_at = []
+        for _, entry in ordered:
+            df = entry['df']
+            meta = entry['meta']
+            entry_events = [tuple(e) for e in meta.get('adjustments', [])]
+            if merged_df is None:
+                merged_df = df.sort_values('Date').reset_index(drop=True)
+            else:
+                # 新しいエントリにだけある調整イベントで、それまでの行を調整
+                new_events = [e for e in entry_events if e not in events]
+                if new_events:
+                    merged_df = _rescale_frame(merged_df, _event_multipliers(merged_df['Date'], new_events))
+                merged_df = self._merge_frames(merged_df, df)
+            events = sorted(set(events) | set(entry_events))
+            if meta.get('covered_from'):
+                covered_from.append(meta['covered_from'])
+            known_missing.update(meta.get('known_missing', []))
+            tracked = tracked and bool(meta.get('adjustment_tracked'))
+            if 'rewritten_at' in meta:
+                rewritten_at.append(meta['rewritten_at'])
+        
+        meta = {}
+        if covered_from:
+            meta['covered_from'] = min(covered_from)
+        if known_missing:
+            present = set(merged_df['Date'].dt.strftime('%Y%m%d'))
+            earliest = merged_df['Date'].min().strftime('%Y%m%d')
+            missing = sorted(d for d in known_missing if d not in present and d >= earliest)
+            if missing:
+                meta['known_missing'] = missing
+        meta['adjustment_tracked'] = tracked
+        meta['adjustments'] = events
+        # 内容が変わらなければ既存のメタ情報と一致させ、書き込みを省けるようにする
+        if rewritten_at:
+            meta['rewritten_at'] = max(rewritten_at)
+        return merged_df, meta
+    
+    def _merge_trading_calendar(self, sources: List[Path]) -> None:
+        """統合元の取引カレンダーのうち、最も新しい（同じなら最も長い）ものを採用"""
+        best = None
+        for d in [self.cache_dir] + sources:
+            path = d / TRADING_CALENDAR_FILE
+            try:
+                calendar = json.loads(path.read_text())
+                key = (calendar['to'], -int(calendar['from']))
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.warning(f"取引カレンダー読み込みエラー [{path}]: {e}")
+                continue
+            if best is None or key > best[0]:
+                best = (key, path)
+        if best is not None and best[1].parent != self.cache_dir:
+            (self.cache_dir / TRADING_CALENDAR_FILE).write_text(best[1].read_text())
+    
+    def import_bulk(self, paths: Iterable[str]) -> dict:
+        """
+        J-Quantsの一括ダウンロードファイル（CSV・圧縮CSV）からキャッシュを作成する
+        
+        キャッシュが無い状態（新しいランナー・キャッシュ削除後）で全銘柄を
+        APIから取得すると時間切れになるため、手元の一括ファイルで初期化し、
+        最初のAPI実行を差分取得だけにする。全ファイルをまとめて読み込み、
+        検証・重複排除したうえで銘柄ごとに1回ずつ書き込む。
+        
+        Args:
+            paths: CSVファイル、またはCSVを含むディレクトリ
+        
+        Returns:
+            取り込み統計（ファイル数・読み込み行数・不正行・重複行・銘柄数・書き込み件数・
+            失敗件数（読めない・必要な列が無いファイルを含む））
+        """
+        files = []
+        for path in paths:
+            path = Path(path).expanduser()
+            if path.is_dir():
+                files.extend(sorted({f for pattern in BULK_FILE_PATTERNS for f in path.glob(pattern)}))
+            elif path.exists():
+                files.append(path)
+            else:
+                logger.warning(f"一括ファイルが見つかりません: {path}")
+        stats = {"files": len(files), "rows": 0, "invalid_rows": 0, "duplicate_rows": 0,
+                 "codes": 0, "written": 0, "failed": 0}
+        if not files:
+            return stats
+        
+        wanted = {"Code"} | set(BULK_COLUMN_MAPPING) | set(BULK_COLUMN_MAPPING.values())
+        frames = []
+        for path in files:
+            try:
+                frame = pd.read_csv(path, dtype={"Code": str}, usecols=lambda c: c in wanted)
+            except Exception as e:
+                logger.warning(f"一括ファイル読み込みエラー [{path.name}]: {e}")
+                stats["failed"] += 1
+                continue
+            frame = frame.rename(columns=BULK_COLUMN_MAPPING)
+            missing = [col for col in BULK_REQUIRED_COLUMNS if col not in frame.columns]
+            if missing:
+                # 列の足りないファイルだけを飛ばし、他のファイルの取り込みは続ける
+                logger.warning(f"一括ファイルに必要な列がありません [{path.name}]: {missing}")
+                stats["failed"] += 1
+                continue
+            frames.append(frame)
+        if not frames:
+            return stats
+        df = pd.concat(frames, ignore_index=True)
+        stats["rows"] = len(df)
+        
+        # 検証: 日付・銘柄コードが読めない行、価格が負・0の行、高値<安値の行を捨てる
+        # （休場などで四本値が空の行はAPIの取得結果と同じく残す）
+        df['Date'] = pd.to_datetime(df['Date'].astype(str).str.replace('-', '', regex=False),
+                                    format='%Y%m%d', errors='coerce')
+        df['Code'] = df['Code'].str.strip()
+        for col in CACHE_PRICE_COLUMNS + [CACHE_VOLUME_COLUMN, ADJUSTMENT_FACTOR_COLUMN]:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        prices = df[CACHE_PRICE_COLUMNS]
+        invalid = (df['Date'].isna() | df['Code'].isna() | (df['Code'] == '')
+                   | (prices <= 0).any(axis=1) | (df['High'] < df['Low']))
+        stats["invalid_rows"] = int(invalid.sum())
+        df = df[~invalid]
+        
+        # 重複排除: 同じ銘柄・日付は後に指定したファイルの行を優先
+        df = df.sort_values(['Code', 'Date'], kind='mergesort')
+        before = len(df)
+        df = df.drop_duplicates(subset=['Code', 'Date'], keep='last').reset_index(drop=True)
+        stats["duplicate_rows"] = before - len(df)
+        if df.empty:
+            return stats
+        
+        # 一括ファイルの期間の先頭より前はAPIにも無いものとして扱う
+        covered_from = df['Date'].min().strftime('%Y%m%d')
+        codes = df['Code'].to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1, [len(df)]))
+        stats["codes"] = len(bounds) - 1
+        
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            code = codes[lo]
+            rows = df.iloc[lo:hi].drop(columns=['Code']).reset_index(drop=True)
+            try:
+                entry = self._load_cache_entry(self._get_cache_path(code))
+                if entry is None:
+                    rows, events = _apply_adjustment_factors(rows)
+                    meta = {
+                        'covered_from': covered_from,
+                        'adjustment_tracked': events is not None,
+                        'adjustments': events or []
+                    }
+                    merged_df = rows
+                else:
+                    meta = dict(entry['meta'])
+                    merged_df, _ = self._absorb_fetched(entry['df'], rows, meta)
+                    meta['covered_from'] = min(meta.get('covered_from', covered_from), covered_from)
+                _mark_rewritten(meta)
+                if self._save_entry(code, merged_df, meta):
+                    stats["written"] += 1
+                else:
+                    stats["failed"] += 1
+            except Exception as e:
+                logger.warning(f"一括取り込みエラー [{code}]: {e}")
+                stats["failed"] += 1
+        
+        logger.info(f"一括取り込み完了: {stats['files']}ファイル, {stats['rows']}行 → {stats['codes']}銘柄 "
+                    f"(書き込み{stats['written']}件, 不正{stats['invalid_rows']}行, "
+                    f"重複{stats['duplicate_rows']}行, 失敗{stats['failed']}件)")
+        return stats
+    
+    def set_trading_calendar(self, trading_days: Iterable) -> None:
+        """
+        欠損検出に使う取引カレンダーを設定
+        
+        Args:
+            trading_days: 取引日のリスト（YYYYMMDD文字列またはdatetime）
+        """
+        trading_days = list(trading_days)
+        if trading_days and isinstance(trading_days[0], str):
+            days = pd.to_datetime(trading_days, format='%Y%m%d')
+        else:
+            days = pd.to_datetime(trading_days)
+        self.trading_calendar = pd.DatetimeIndex(days).normalize().unique().sort_values()
+        logger.debug(f"取引カレンダー設定: {len(self.trading_calendar)}日")
+    
+    def _find_gaps(self, df: pd.DataFrame, start_dt: pd.Timestamp, meta: dict) -> List[pd.DatetimeIndex]:
+        """
+        キャッシュ内部の欠損（取引日なのにデータが無い区間）を連続区間ごとに返す
+        
+        取得済みで「API側にもデータが無い」と確認できた日（売買停止など）は
+        meta['known_missing']に記録し、毎回再取得しないよう除外する。
+        
+        Args:
+            df: キャッシュ済みのDataFrame（Date列はdatetime）
+            start_dt: 要求開始日
+            meta: キャッシュのメタ情報
+        
+        Returns:
+            欠損日の連続区間（DatetimeIndex）のリスト
+        """
+        calendar = self.trading_calendar
+        cached_days = pd.DatetimeIndex(df['Date']).normalize()
+        lower = max(start_dt, cached_days.min())
+        upper = cached_days.max()
+        
+        expected = calendar[(calendar >= lower) & (calendar <= upper)]
+        missing = expected.difference(cached_days)
+        known_missing = meta.get('known_missing')
+        if known_missing:
+            missing = missing.difference(pd.to_datetime(known_missing, format='%Y%m%d'))
+        if len(missing) == 0:
+            return []
+        
+        # 取引カレンダー上で連続する欠損日をひとまとめにする
+        positions = calendar.get_indexer(missing)
+        breaks = np.where(np.diff(positions) != 1)[0] + 1
+        bounds = [0] + breaks.tolist() + [len(missing)]
+        spans = [missing[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+        
+        # 細切れの欠損が多い場合は1回の取得にまとめる（APIコール数を抑える）
+        if len(spans) > MAX_GAP_SPANS:
+            spans = [missing]
+        return spans
+    
+    async def _fetch_span(
+        self,
+        fetch_func,
+        stock_code: str,
+        from_date: str,
+        to_date: str,
+        kind: str
+    ) -> Optional[pd.DataFrame]:
+        """部分区間を取得（例外はログに残してNone扱い）。kindはAPI呼び出しの用途（head/gap/delta）"""
+        self.api_calls[kind] += 1
+        started = time.perf_counter()
+        try:
+            return await fetch_func(from_date, to_date)
+        except Exception as e:
+            logger.warning(f"部分取得エラー [{stock_code}] {from_date}~{to_date}: {e}")
+            return None
+        finally:
+            self._latencies["fetch"].append(time.perf_counter() - started)
+    
+    @staticmethod
+    def _new_events(fetched_df: Optional[pd.DataFrame], meta: dict) -> List[Tuple[str, float]]:
+        """取得データに含まれる調整イベントのうち、キャッシュに未記録のもの（キャッシュは変更しない）"""
+        if fetched_df is None or fetched_df.empty:
+            return []
+        _, events = _apply_adjustment_factors(fetched_df)
+        known_events = [tuple(e) for e in meta.get('adjustments', [])]
+        return [e for e in events or [] if e not in known_events]
+    
+    def _absorb_fetched(
+        self,
+        working_df: pd.DataFrame,
+        fetched_df: pd.DataFrame,
+        meta: dict
+    ) -> Tuple[pd.DataFrame, bool]:
+        """
+        取得データを調整済みにしてキャッシュへマージ
+        
+        取得データ内の調整イベントより前のキャッシュ行は同じ係数で調整し、
+        過去区間（先頭・途中の補完）の取得データはキャッシュ側で記録済みの
+        後続イベントの係数で調整する。meta['adjustments']を更新する。
+        
+        Returns:
+            (マージ後のDataFrame, 新しい調整イベントがあったか)
+        """
+        started = time.perf_counter()
+        try:
+            return self._absorb_fetched_timed(working_df, fetched_df, meta)
+        finally:
+            self._latencies["merge"].append(time.perf_counter() - started)
+    
+    def _absorb_fetched_timed(
+        self,
+        working_df: pd.DataFrame,
+        fetched_df: pd.DataFrame,
+        meta: dict
+    ) -> Tuple[pd.DataFrame, bool]:
+        """_absorb_fetched()の本体"""
+        fetched_df, events = _apply_adjustment_factors(fetched_df)
+        if events is None:
+            # 調整係数の列が無い（追跡できない）取得データ
+            meta['adjustment_tracked'] = False
+            return self._merge_frames(working_df, fetched_df), False
+        
+        known_events = [tuple(e) for e in meta.get('adjustments', [])]
+        new_events = [e for e in events if e not in known_events]
+        
+        # 取得データより後に記録済みのイベントがあれば、取得データ側を調整
+        if known_events:
+            fetched_df = _rescale_frame(fetched_df, _event_multipliers(fetched_df['Date'], known_events))
+        
+        # 新しいイベントより前のキャッシュ行を調整
+        if new_events:
+            _mark_rewritten(meta)
+            self.adjustment_stats['events'] += len(new_events)
+            self.adjustment_stats['rescaled_codes'] += 1
+            logger.info(f"調整イベント検出: {new_events} → キャッシュを調整")
+            working_df = _rescale_frame(working_df, _event_multipliers(working_df['Date'], new_events))
+            meta['adjustments'] = sorted(known_events + new_events)
+        
+        meta.setdefault('adjustment_tracked', True)
+        return self._merge_frames(working_df, fetched_df), bool(new_events)
+    
+    async def _full_refetch(
+        self,
+        stock_code: str,
+        start_date: str,
+        end_date: str,
+        fetch_func
+    ) -> Optional[pd.DataFrame]:
+        """要求期間を丸ごと取得し、キャッシュを置き換える"""
+        self.api_calls["full"] += 1
+        started = time.perf_counter()
+        try:
+            df = await fetch_func(start_date, end_date)
+        finally:
+            self._latencies["fetch"].append(time.perf_counter() - started)
+        if df is None or df.empty:
+            return df
+        
+        df, events = _apply_adjustment_factors(df)
+        df = df.assign(Date=pd.to_datetime(df['Date'])).sort_values('Date').reset_index(drop=True)
+        meta = {
+            'covered_from': start_date,
+            'adjustment_tracked': events is not None,
+            'adjustments': events or []
+        }
+        _mark_rewritten(meta)
+        self._save_entry(stock_code, df, meta)
+        return df
+    
     async def get_or_fetch_incremental(
         self,
         stock_code: str,
@@ -131,6 +1225,10 @@ class PersistentPriceCache:
         実行時間が4時間を超える原因になっていた。
         キャッシュの末尾から不足している日数分だけを取得するよう変更する。
 
+        末尾だけでなく、先頭の不足（要求開始日までキャッシュが無い）は
+        その区間だけを、途中の欠損（差分取得の失敗・部分レスポンス）は
+        取引カレンダーと突き合わせて欠けている区間だけを取得する。
+
         Args:
             stock_code: 銘柄コード
             start_date: 開始日（YYYYMMDD）
@@ -138,95 +1236,149 @@ class PersistentPriceCache:
             fetch_func: async def fetch_func(from_date: str, to_date: str) -> Optional[pd.DataFrame]
                         （session・codeは呼び出し側でクロージャに束縛して渡す）
             max_age_days: これより古いキャッシュは差分更新せず全期間再取得する
+                          （調整係数を追跡できているキャッシュには適用しない）
 
         Returns:
             要求期間のDataFrame、取得できなければNone
         """
         cache_path = self._get_cache_path(stock_code)
-        result = self._load_cache_data(cache_path)
+        entry = self._load_cache_entry(cache_path)
+        self.request_stats["requests"] += 1
 
         start_dt = pd.to_datetime(start_date, format='%Y%m%d')
         end_dt = pd.to_datetime(end_date, format='%Y%m%d')
 
-        if result is None:
+        if entry is None:
             # キャッシュなし → 全期間を取得するしかない
             self.misses += 1
-            df = await fetch_func(start_date, end_date)
-            if df is not None and not df.empty:
-                await self.set(stock_code, start_date, end_date, df)
-            return df
+            self.request_stats["no_file"] += 1
+            if stock_code in self.repair_queue:
+                return await self._repair(stock_code, start_date, end_date, fetch_func)
+            return await self._full_refetch(stock_code, start_date, end_date, fetch_func)
 
-        existing_df, last_date = result
+        existing_df, last_date = entry['df'], entry['last_date']
+        meta = dict(entry['meta'])
 
-        # あまりに古いキャッシュ（差分更新の意味が薄い）は全期間再取得
+        # あまりに古いキャッシュは全期間再取得する。ただし調整係数を追跡できている
+        # キャッシュは、差分に含まれる係数で過去分を調整できるため再取得しない
+        # （株式分割はすべて差分取得の期間内に現れる）。
         try:
             last_update = datetime.strptime(last_date, '%Y%m%d')
             age = datetime.now() - last_update
             if age.days > max_age_days:
-                logger.debug(f"キャッシュ期限切れ（差分更新せず全期間再取得）: {stock_code} ({age.days}日前)")
-                self.misses += 1
-                df = await fetch_func(start_date, end_date)
-                if df is not None and not df.empty:
-                    await self.set(stock_code, start_date, end_date, df)
-                return df
+                if meta.get('adjustment_tracked'):
+                    logger.debug(f"キャッシュは古いが調整係数を追跡済みのため差分更新: {stock_code} ({age.days}日前)")
+                    self.adjustment_stats['expiry_skipped'] += 1
+                else:
+                    logger.debug(f"キャッシュ期限切れ（差分更新せず全期間再取得）: {stock_code} ({age.days}日前)")
+                    self.misses += 1
+                    self.request_stats["expired"] += 1
+                    self.adjustment_stats['expiry_refetches'] += 1
+                    return await self._full_refetch(stock_code, start_date, end_date, fetch_func)
         except Exception as e:
             logger.warning(f"日付解析エラー [{stock_code}]: {e}")
 
-        existing_df = existing_df.copy()
-        existing_df['Date'] = pd.to_datetime(existing_df['Date'])
-        cache_latest_date = existing_df['Date'].max()
-        cache_earliest_date = existing_df['Date'].min()
+        # 読み込んだエントリはDate列がdatetime64に揃っているため、型変換せずにそのまま使う
+        working_df = existing_df
+        changed = False
 
-        # キャッシュの先頭が要求開始日をカバーしていない場合（例: 50日分しか
-        # 溜まっていないキャッシュに対して200日分を要求した場合）は、差分では
-        # 補えないため全期間を再取得する。末尾の新しさだけを見て「ヒット」と
-        # 誤判定し、実際には足りないデータを返してしまうバグを防ぐ。
-        if cache_earliest_date > start_dt:
+        # 先頭の不足: キャッシュの先頭が要求開始日をカバーしていない場合
+        # （例: 50日分しか溜まっていないキャッシュに対して200日分を要求した場合）は、
+        # 足りない先頭区間だけを取得する。上場が新しいなどでAPI側にもデータが
+        # 無かった場合は covered_from に記録し、次回以降は取得しない。
+        cache_earliest_date = working_df['Date'].min()
+        covered_from = meta.get('covered_from')
+        if cache_earliest_date > start_dt and not (covered_from and covered_from <= start_date):
+            head_end = (cache_earliest_date - timedelta(days=1)).strftime('%Y%m%d')
             logger.debug(f"キャッシュの過去データ不足 [{stock_code}]: "
                         f"キャッシュ開始={cache_earliest_date.date()}, 要求開始={start_dt.date()} "
-                        f"→ 全期間再取得")
-            self.misses += 1
-            df = await fetch_func(start_date, end_date)
-            if df is not None and not df.empty:
-                await self.set(stock_code, start_date, end_date, df)
-                return df
-            # 再取得に失敗した場合は、少なくとも既存キャッシュの範囲で返す
-            filtered = existing_df[(existing_df['Date'] >= start_dt) & (existing_df['Date'] <= end_dt)].copy()
-            return filtered if len(filtered) > 0 else None
+                        f"→ {start_date}~{head_end} のみ取得")
+            self.gap_stats['head_backfills'] += 1
+            self.request_stats["head_short"] += 1
+            head_df = await self._fetch_span(fetch_func, stock_code, start_date, head_end, "head")
+            if head_df is not None and not head_df.empty:
+                working_df, _ = self._absorb_fetched(working_df, head_df, meta)
+                _mark_rewritten(meta)
+            meta['covered_from'] = start_date
+            changed = True
+
+        # 保持期間で切り詰めた古い期間はアーカイブ層から補う（APIは呼ばない）
+        archived_head_df = None
+        if self.archive_dir is not None and working_df['Date'].min() > start_dt:
+            archived_head_df = self._read_archive(
+                stock_code, start_dt, working_df['Date'].min() - timedelta(days=1)
+            )
+
+        # 途中の欠損: 取引カレンダー上の取引日でデータが無い区間だけを取得
+        if self.trading_calendar is not None and len(working_df) > 0:
+            self.gap_stats['codes_checked'] += 1
+            spans = self._find_gaps(working_df, start_dt, meta)
+            if spans:
+                self.gap_stats['codes_with_gaps'] += 1
+                self.request_stats["gap_fill"] += 1
+                known_missing = set(meta.get('known_missing', []))
+                for span in spans:
+                    span_days = span.strftime('%Y%m%d')
+                    self.gap_stats['gap_spans'] += 1
+                    self.gap_stats['gap_days'] += len(span_days)
+                    logger.debug(f"途中欠損を補完 [{stock_code}]: {span_days[0]}~{span_days[-1]} ({len(span_days)}日)")
+                    span_df = await self._fetch_span(fetch_func, stock_code, span_days[0], span_days[-1], "gap")
+                    fetched_days = set()
+                    if span_df is not None and not span_df.empty:
+                        working_df, _ = self._absorb_fetched(working_df, span_df, meta)
+                        _mark_rewritten(meta)
+                        fetched_days = set(pd.to_datetime(span_df['Date']).dt.strftime('%Y%m%d'))
+                    still_missing = [d for d in span_days if d not in fetched_days]
+                    self.gap_stats['filled_days'] += len(span_days) - len(still_missing)
+                    self.gap_stats['unfilled_days'] += len(still_missing)
+                    known_missing.update(still_missing)
+                meta['known_missing'] = sorted(known_missing)
+                changed = True
+
+        cache_latest_date = working_df['Date'].max()
 
         if cache_latest_date >= end_dt:
-            # 既に十分新しい → API呼び出し不要
+            # 既に十分新しい → 末尾のAPI呼び出し不要
             self.hits += 1
-            filtered = existing_df[(existing_df['Date'] >= start_dt) & (existing_df['Date'] <= end_dt)].copy()
-            return filtered if len(filtered) > 0 else None
+            self.request_stats["full_hit"] += 1
+        else:
+            # 差分取得: キャッシュ最新日の翌日 ～ end_date のみ問い合わせる
+            delta_start_dt = cache_latest_date + timedelta(days=1)
+            delta_start_str = delta_start_dt.strftime('%Y%m%d')
 
-        # 差分取得: キャッシュ最新日の翌日 ～ end_date のみ問い合わせる
-        delta_start_dt = cache_latest_date + timedelta(days=1)
-        delta_start_str = delta_start_dt.strftime('%Y%m%d')
+            logger.debug(f"差分取得 [{stock_code}]: {delta_start_str}~{end_date} "
+                        f"（既存データは{cache_latest_date.date()}まで保有）")
 
-        logger.debug(f"差分取得 [{stock_code}]: {delta_start_str}~{end_date} "
-                    f"（既存データは{cache_latest_date.date()}まで保有）")
+            delta_df = await self._fetch_span(fetch_func, stock_code, delta_start_str, end_date, "delta")
 
-        try:
-            delta_df = await fetch_func(delta_start_str, end_date)
-        except Exception as e:
-            logger.warning(f"差分取得エラー [{stock_code}]: {e}")
-            delta_df = None
-
-        if delta_df is not None and not delta_df.empty:
-            await self.set(stock_code, delta_start_str, end_date, delta_df)
-            merged_result = self._load_cache_data(cache_path)
-            if merged_result is not None:
-                merged_df, _ = merged_result
-                merged_df = merged_df.copy()
-                merged_df['Date'] = pd.to_datetime(merged_df['Date'])
+            new_events = self._new_events(delta_df, meta) if self.adjustment_policy == "refetch" else []
+            if new_events:
+                # 株式分割等を検出 → キャッシュは調整せず、この銘柄だけ要求期間を取り直す（ミス扱い）
+                logger.info(f"調整イベント検出のため再取得: {stock_code} {new_events}")
+                self.adjustment_stats['events'] += len(new_events)
+                self.adjustment_stats['refetched_codes'] += 1
+                self.request_stats["adjustment_refetch"] += 1
+                self.misses += 1
+                return await self._full_refetch(stock_code, start_date, end_date, fetch_func)
+            if delta_df is not None and not delta_df.empty:
+                working_df, _ = self._absorb_fetched(working_df, delta_df, meta)
+                changed = True
                 self.hits += 1
-                filtered = merged_df[(merged_df['Date'] >= start_dt) & (merged_df['Date'] <= end_dt)].copy()
-                return filtered if len(filtered) > 0 else None
+                self.request_stats["partial_hit"] += 1
+            else:
+                # 差分取得が空（まだ新しい取引日のデータが無い等）→ 既存キャッシュの範囲で返す
+                self.misses += 1
+                self.request_stats["empty_delta"] += 1
+
+        if changed:
+            self._save_entry(stock_code, working_df, meta)
+
+        if archived_head_df is not None:
+            working_df = pd.concat([archived_head_df, working_df], ignore_index=True)
 
-        # 差分取得が空（まだ新しい取引日のデータが無い等）→ 既存キャッシュの範囲で返す
-        self.misses += 1
-        filtered = existing_df[(existing_df['Date'] >= start_dt) & (existing_df['Date'] <= end_dt)].copy()
+        # ブールインデックスで新しいDataFrameになるため.copy()は不要
+        # （呼び出し側のメモリキャッシュは読み取り専用ビューで参照する）
+        filtered = working_df[(working_df['Date'] >= start_dt) & (working_df['Date'] <= end_dt)]
         return filtered if len(filtered) > 0 else None
 
     async def get(
@@ -283,55 +1435,51 @@ class PersistentPriceCache:
             self.misses += 1
             return None
         
-        # 必要な期間のデータを抽出
+        # 必要な期間のデータを抽出（Date列は読み込み時にdatetime64に揃っている）
         try:
-            if 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'])
-                start_dt = pd.to_datetime(start_date, format='%Y%m%d')
-                end_dt = pd.to_datetime(end_date, format='%Y%m%d')
-                
-                # ★重要: キャッシュの最新日がend_dtと同日でない場合は無効
-                # 1日許容にしていた際、「キャッシュは1日古くてもヒット」かつ
-                # 「スクリーニング側も1日古くてOK」の両方が常に満たされてしまい、
-                # 実質“真の当日データ”に一度も更新されないまま毎日1日遅れの
-                # データを使い続けるという事故が起きたため、同日一致のみ許可に変更。
-                # これによりキャッシュは「同日内の使い回し」専用となり、日が変われば
-                # 必ず一度はAPIへ再取得を試みる（実際に古い場合はスクリーニング側の
-                # 1日許容チェックが吸収する）。
-                cache_latest_date = df['Date'].max()
-                date_gap = (end_dt - cache_latest_date).days
-                if date_gap > 0:
-                    logger.debug(f"キャッシュデータが古い: {stock_code} "
-                                f"(要求終了日: {end_dt.date()}, "
-                                f"キャッシュ最新日: {cache_latest_date.date()}, "
-                                f"差: {date_gap}日)")
-                    self.misses += 1
-                    return None
-                
-                filtered_df = df[(df['Date'] >= start_dt) & (df['Date'] <= end_dt)].copy()
-                
-                logger.debug(f"  第1フィルター: {len(filtered_df)}行 (start_dt <= Date <= end_dt)")
-                
-                if len(filtered_df) > 0:
-                    self.hits += 1
-                    logger.debug(f"  ✅ キャッシュヒット: {stock_code} ({len(filtered_df)}行)")
-                    return filtered_df
-                
-                # end_dt が最新データより新しい場合（土日・祝日対策）
-                # date_gap <= 5 が保証済みなので安全
-                filtered_df = df[df['Date'] >= start_dt].copy()
-                
-                logger.debug(f"  第2フィルター: {len(filtered_df)}行 (Date >= start_dt)")
-                
-                if len(filtered_df) > 0:
-                    self.hits += 1
-                    logger.debug(f"  ✅ キャッシュヒット（部分）: {stock_code} ({len(filtered_df)}行)")
-                    return filtered_df
-                else:
-                    logger.debug(f"  ❌ キャッシュに必要な期間のデータなし: {stock_code}")
-                    self.misses += 1
-                    return None
+            start_dt = pd.to_datetime(start_date, format='%Y%m%d')
+            end_dt = pd.to_datetime(end_date, format='%Y%m%d')
+            
+            # ★重要: キャッシュの最新日がend_dtと同日でない場合は無効
+            # 1日許容にしていた際、「キャッシュは1日古くてもヒット」かつ
+            # 「スクリーニング側も1日古くてOK」の両方が常に満たされてしまい、
+            # 実質“真の当日データ”に一度も更新されないまま毎日1日遅れの
+            # データを使い続けるという事故が起きたため、同日一致のみ許可に変更。
+            # これによりキャッシュは「同日内の使い回し」専用となり、日が変われば
+            # 必ず一度はAPIへ再取得を試みる（実際に古い場合はスクリーニング側の
+            # 1日許容チェックが吸収する）。
+            cache_latest_date = df['Date'].max()
+            date_gap = (end_dt - cache_latest_date).days
+            if date_gap > 0:
+                logger.debug(f"キャッシュデータが古い: {stock_code} "
+                            f"(要求終了日: {end_dt.date()}, "
+                            f"キャッシュ最新日: {cache_latest_date.date()}, "
+                            f"差: {date_gap}日)")
+                self.misses += 1
+                return None
+            
+            # ブールインデックスで新しいDataFrameになるため.copy()は不要（get_or_fetch_incremental()と同じ）
+            filtered_df = df[(df['Date'] >= start_dt) & (df['Date'] <= end_dt)]
+            
+            logger.debug(f"  第1フィルター: {len(filtered_df)}行 (start_dt <= Date <= end_dt)")
+            
+            if len(filtered_df) > 0:
+                self.hits += 1
+                logger.debug(f"  ✅ キャッシュヒット: {stock_code} ({len(filtered_df)}行)")
+                return filtered_df
+            
+            # end_dt が最新データより新しい場合（土日・祝日対策）
+            # date_gap <= 5 が保証済みなので安全
+            filtered_df = df[df['Date'] >= start_dt]
+            
+            logger.debug(f"  第2フィルター: {len(filtered_df)}行 (Date >= start_dt)")
+            
+            if len(filtered_df) > 0:
+                self.hits += 1
+                logger.debug(f"  ✅ キャッシュヒット（部分）: {stock_code} ({len(filtered_df)}行)")
+                return filtered_df
             else:
+                logger.debug(f"  ❌ キャッシュに必要な期間のデータなし: {stock_code}")
                 self.misses += 1
                 return None
         
@@ -364,30 +1512,52 @@ class PersistentPriceCache:
         if df is None or len(df) == 0:
             return False
         
+        return self._merge_and_save(stock_code, df)
+    
+    @staticmethod
+    def _merge_frames(existing_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        既存データと新しいデータを日付で重複排除してマージ（新しい方を優先）
+        
+        既存データはキャッシュから読み込んだ（Date列がdatetime64の）DataFrameとし、
+        型を揃えるのはAPIなどから受け取った新しいデータだけにする。
+        """
+        merged_df = pd.concat([
+            existing_df,
+            new_df.assign(Date=pd.to_datetime(new_df['Date']))
+        ]).drop_duplicates(subset=['Date'], keep='last')
+        return merged_df.sort_values('Date').reset_index(drop=True)
+    
+    def _merge_and_save(self, stock_code: str, df: pd.DataFrame, meta_updates: Optional[dict] = None) -> bool:
+        """
+        既存キャッシュとマージして保存
+        
+        Args:
+            stock_code: 銘柄コード
+            df: 保存するDataFrame
+            meta_updates: メタ情報の更新内容
+        
+        Returns:
+            成功したらTrue
+        """
         cache_path = self._get_cache_path(stock_code)
         
         # 既存のキャッシュを読み込む
-        result = self._load_cache_data(cache_path)
+        entry = self._load_cache_entry(cache_path)
+        meta = dict(entry['meta']) if entry is not None else {}
+        if meta_updates:
+            meta.update(meta_updates)
         
-        if result is not None:
-            existing_df, _ = result
+        if entry is not None:
+            existing_df = entry['df']
             
             # 既存データと新しいデータをマージ
             try:
-                # Date列を datetime 型に変換
-                existing_df['Date'] = pd.to_datetime(existing_df['Date'])
-                df['Date'] = pd.to_datetime(df['Date'])
-                
-                # 重複を削除してマージ
-                merged_df = pd.concat([existing_df, df]).drop_duplicates(subset=['Date'], keep='last')
-                merged_df = merged_df.sort_values('Date').reset_index(drop=True)
-                
-                # 最終日付を取得
-                last_date = merged_df['Date'].iloc[-1].strftime('%Y%m%d')
+                merged_df = self._merge_frames(existing_df, df)
                 
                 logger.debug(f"キャッシュマージ: {stock_code} (既存: {len(existing_df)}行, 新規: {len(df)}行, 合計: {len(merged_df)}行)")
                 
-                return self._save_cache_data(cache_path, merged_df, last_date)
+                return self._save_entry(stock_code, merged_df, meta)
             
             except Exception as e:
                 logger.warning(f"キャッシュマージエラー [{stock_code}]: {e}")
@@ -395,14 +1565,67 @@ class PersistentPriceCache:
         
         # 新規保存
         try:
-            df['Date'] = pd.to_datetime(df['Date'])
-            last_date = df['Date'].iloc[-1].strftime('%Y%m%d')
-            return self._save_cache_data(cache_path, df, last_date)
+            new_df = df.assign(Date=pd.to_datetime(df['Date'])).sort_values('Date').reset_index(drop=True)
+            return self._save_entry(stock_code, new_df, meta)
         
         except Exception as e:
             logger.warning(f"キャッシュ保存エラー [{stock_code}]: {e}")
             return False
     
+    def _save_entry(self, stock_code: str, df: pd.DataFrame, meta: dict) -> bool:
+        """マージ済みのDataFrameをメタ情報とともに保存（保持期間を超えた分は退避）"""
+        if self.retention_bars is not None and len(df) > self.retention_bars:
+            expired_df = df.iloc[:-self.retention_bars]
+            df = df.iloc[-self.retention_bars:].reset_index(drop=True)
+            self.retention_stats["trimmed_codes"] += 1
+            self.retention_stats["trimmed_rows"] += len(expired_df)
+            if self.archive_dir is None or not self._archive_rows(stock_code, expired_df):
+                # 切り詰めた期間は返せなくなるため、取得済みの範囲も保持した先頭の足からにする
+                # （それより前を要求されたら先頭の不足として取得し直す）
+                if meta.get('covered_from'):
+                    meta = dict(meta, covered_from=df['Date'].iloc[0].strftime('%Y%m%d'))
+        # 確認済み欠損日のうち、保持範囲より古いものは不要なので捨てる
+        if meta.get('known_missing') and len(df) > 0:
+            earliest = df['Date'].min().strftime('%Y%m%d')
+            meta = dict(meta, known_missing=[d for d in meta['known_missing'] if d >= earliest])
+        last_date = df['Date'].iloc[-1].strftime('%Y%m%d')
+        return self._save_cache_data(self._get_cache_path(stock_code), df, last_date, meta)
+    
+    def _get_archive_path(self, stock_code: str) -> Path:
+        """アーカイブファイルのパスを取得"""
+        return self.archive_dir / f"{stock_code}.pkl"
+    
+    def _archive_rows(self, stock_code: str, expired_df: pd.DataFrame) -> bool:
+        """保持期間を超えた行をアーカイブ層にマージして保存（保存できたらTrue）"""
+        archive_path = self._get_archive_path(stock_code)
+        loaded = self._read_cache_file(archive_path)
+        try:
+            if loaded is not None:
+                archived_df = self._merge_frames(loaded[0]['df'], expired_df)
+            else:
+                archived_df = expired_df.reset_index(drop=True)
+            last_date = archived_df['Date'].iloc[-1].strftime('%Y%m%d')
+            if self._save_cache_data(archive_path, archived_df, last_date):
+                self.retention_stats["archived_rows"] += len(expired_df)
+                return True
+        except Exception as e:
+            logger.warning(f"アーカイブ保存エラー [{stock_code}]: {e}")
+        return False
+    
+    def _read_archive(self, stock_code: str, start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> Optional[pd.DataFrame]:
+        """アーカイブ層から指定期間の行を読み込む（無ければNone）"""
+        if self.archive_dir is None:
+            return None
+        loaded = self._read_cache_file(self._get_archive_path(stock_code))
+        if loaded is None:
+            return None
+        archived_df = loaded[0]['df']
+        archived_df = archived_df[(archived_df['Date'] >= start_dt) & (archived_df['Date'] <= end_dt)]
+        if len(archived_df) == 0:
+            return None
+        self.retention_stats["archive_reads"] += 1
+        return archived_df
+    
     def get_stats(self) -> dict:
         """
         キャッシュ統計を取得
@@ -423,8 +1646,90 @@ class PersistentPriceCache:
             "size_mb": round(total_size_mb, 2),
             "hits": self.hits,
             "misses": self.misses,
-            "hit_rate": round(hit_rate, 2)
+            "hit_rate": round(hit_rate, 2),
+            "preload": dict(self.preload_stats),
+            "gaps": dict(self.gap_stats),
+            "retention": dict(self.retention_stats),
+            "adjustments": dict(self.adjustment_stats),
+            "corruption": dict(self.corruption_stats, repair_pending=len(self.repair_queue)),
+            "requests": dict(self.request_stats),
+            "api_calls": dict(self.api_calls),
+            "io": dict(self.io_stats),
+            "latency_ms": {kind: _latency_summary(samples) for kind, samples in self._latencies.items()}
+        }
+    
+    def write_stats(self, path, extra: Optional[dict] = None) -> Path:
+        """
+        get_stats()の内容をJSONファイルに書き出す
+        
+        Args:
+            path: 出力先のファイルパス
+            extra: 一緒に書き出す追加の統計（メモリキャッシュの統計など）
+        
+        Returns:
+            書き出したファイルのパス
+        """
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "generated_at": datetime.now().isoformat(),
+            "cache_dir": str(self.cache_dir),
+            "persistent": self.get_stats()
         }
+        if extra:
+            payload.update(extra)
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2, default=str))
+        logger.info(f"キャッシュ統計を書き出しました: {path}")
+        return path
+    
+    def log_stats(self):
+        """永続キャッシュ統計をログ出力"""
+        stats = self.get_stats()
+        preload = stats["preload"]
+        logger.info("\n永続キャッシュ統計:")
+        logger.info(f"  ファイル数: {stats['files']}件")
+        logger.info(f"  合計サイズ: {stats['size_mb']}MB")
+        logger.info(f"  ヒット数: {stats['hits']}回")
+        logger.info(f"  ミス数: {stats['misses']}回")
+        logger.info(f"  ヒット率: {stats['hit_rate']}%")
+        if preload["files"] > 0:
+            logger.info(f"  プリロード: {preload['loaded']}/{preload['files']}件 "
+                        f"({preload['bytes_read'] / (1024 * 1024):.2f}MB, {preload['seconds']}秒)")
+        gaps = stats["gaps"]
+        logger.info(f"  欠損検出: {gaps['codes_with_gaps']}/{gaps['codes_checked']}銘柄, "
+                    f"{gaps['gap_spans']}区間・{gaps['gap_days']}日 "
+                    f"(補完{gaps['filled_days']}日, データなし{gaps['unfilled_days']}日), "
+                    f"先頭補完{gaps['head_backfills']}件")
+        if self.retention_bars is not None:
+            retention = stats["retention"]
+            logger.info(f"  保持期間({self.retention_bars}本)超過: {retention['trimmed_codes']}件・"
+                        f"{retention['trimmed_rows']}行 (アーカイブ{retention['archived_rows']}行, "
+                        f"アーカイブ参照{retention['archive_reads']}回)")
+        adjustments = stats["adjustments"]
+        logger.info(f"  調整イベント: {adjustments['events']}件 "
+                    f"(ローカル調整{adjustments['rescaled_codes']}銘柄, 再取得{adjustments['refetched_codes']}銘柄), "
+                    f"期限切れ再取得{adjustments['expiry_refetches']}件 / 回避{adjustments['expiry_skipped']}件")
+        requests = stats["requests"]
+        logger.info(f"  取得内訳: {requests['requests']}件中 API不要{requests['full_hit']}, 差分あり{requests['partial_hit']}, "
+                    f"差分なし{requests['empty_delta']}, ファイルなし{requests['no_file']}, 期限切れ{requests['expired']}, "
+                    f"調整再取得{requests['adjustment_refetch']} (先頭不足{requests['head_short']}, 途中欠損{requests['gap_fill']})")
+        api_calls = stats["api_calls"]
+        logger.info(f"  APIコール: 全期間{api_calls['full']}, 先頭{api_calls['head']}, "
+                    f"途中{api_calls['gap']}, 差分{api_calls['delta']}")
+        io = stats["io"]
+        logger.info(f"  読み書き: 読込{io['files_read']}件・{io['bytes_read'] / (1024 * 1024):.2f}MB, "
+                    f"書込{io['files_written']}件・{io['bytes_written'] / (1024 * 1024):.2f}MB")
+        for kind, summary in stats["latency_ms"].items():
+            if summary["count"]:
+                logger.info(f"  {kind}時間(ms): p50={summary['p50']}, p90={summary['p90']}, "
+                            f"p99={summary['p99']}, 最大={summary['max']} ({summary['count']}回)")
+        corruption = stats["corruption"]
+        logger.info(f"  破損検出: 読み込み不可{corruption['unreadable']}件, チェックサム不一致{corruption['checksum']}件, "
+                    f"形式不正{corruption['schema']}件 (隔離{corruption['quarantined']}件, "
+                    f"修復{corruption['repaired']}件, 修復失敗{corruption['repair_failed']}件, "
+                    f"修復待ち{corruption['repair_pending']}件)")
+        if corruption['outdated']:
+            logger.info(f"  未移行: {corruption['outdated']}件（python cache_tools.py migrate で移行してください）")
     
     def clear_old_cache(self, max_age_days: int = 30):
         """
@@ -2,32 +2,233 @@
 株価データキャッシュモジュール
 複数のスクリーニング手法で同じ銘柄の株価データを共有し、API呼び出しを削減
 """
+import os
+import time
 import asyncio
-from datetime import datetime
-from typing import Dict, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 import logging
 
 logger = logging.getLogger(__name__)
 
+# メモリキャッシュの上限（MB）。0なら無制限
+DEFAULT_MAX_MB = int(os.getenv('PRICE_CACHE_MAX_MB', '256'))
+
+
+class PriceView:
+    """
+    キャッシュ済み株価の読み取り専用ビュー
+    
+    各列はキャッシュが保持する配列をコピーせずに切り出したndarrayで、
+    書き込み不可になっている。指標はこのビューに列を追加せず、
+    別の配列（pd.Series(view['Close'], copy=False).ewm(...)など）として計算する。
+    """
+    
+    __slots__ = ('_columns', '_length')
+    
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self._columns = columns
+        self._length = len(next(iter(columns.values()))) if columns else 0
+    
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, start: int = 0, stop: Optional[int] = None) -> "PriceView":
+        """DataFrameの行[start:stop]を列ごとのビューとして切り出す（データはコピーしない）"""
+        columns = {}
+        for name in data.columns:
+            view = data[name].to_numpy()[start:stop].view()
+            view.flags.writeable = False
+            columns[name] = view
+        return cls(columns)
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """書き込み可能なDataFrameとしてコピーを返す（ビューで足りない呼び出し元向け）"""
+        return pd.DataFrame({name: values.copy() for name, values in self._columns.items()})
+
 
 class PriceDataCache:
-    """株価データのキャッシュクラス（メモリベース）"""
+    """
+    株価データのキャッシュクラス（メモリベース）
+    
+    銘柄コードごとに「読み込んだ最も広い期間」を1件だけ保持する。
+    その期間に含まれる要求は行の切り出しで返し、はみ出す要求は
+    不足している先頭・末尾だけを取得して期間を広げる。
+    
+    合計サイズがmax_bytesを超えたら、最も長く使われていない銘柄から
+    破棄する（LRU）。pin()した銘柄は破棄しない。
     
-    def __init__(self):
-        self._cache: Dict[str, pd.DataFrame] = {}
-        self._lock = asyncio.Lock()
+    取得元（永続キャッシュ）が株式分割の調整などで過去の行を書き換えることが
+    あるため、取得時にversion_funcを渡すと、保存時と版が変わった銘柄の
+    保持期間を捨てて取り直す（古い先頭と調整後の末尾をつながない）。
+    
+    イベントループ上では await を含まない処理は割り込まれないため、
+    参照・保存はロックを取らない。ロックは取得（await fetch_func）を
+    伴う処理だけを銘柄ごとに直列化し、同じ銘柄の重複取得を防ぐ。
+    """
+    
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        Args:
+            max_bytes: 保持するDataFrameの合計サイズ上限（バイト）。Noneなら無制限
+        """
+        # 銘柄コード → (開始日YYYYMMDD, 終了日YYYYMMDD, DataFrame)（先頭ほど古い利用）
+        self._cache: "OrderedDict[str, Tuple[str, str, pd.DataFrame]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # 銘柄コード → 保存時の取得元の版（version_funcの値）
+        self._versions: Dict[str, Any] = {}
+        self._total_bytes = 0
+        self.max_bytes = max_bytes
+        self._pinned: Dict[str, int] = {}
+        # 銘柄コード → (ロック, 利用中のコルーチン数)。利用者がいなくなったら削除
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
         self._hit_count = 0
         self._miss_count = 0
+        self._extend_count = 0
+        self._eviction_count = 0
+        self._evicted_bytes = 0
+        self._invalidated_count = 0
+        self._coalesced_count = 0
+        self._lock_acquisitions = 0
+        self._lock_contended = 0
+        self._lock_wait_total = 0.0
+        self._lock_wait_max = 0.0
+        self._waiters = 0
+        self._max_waiters = 0
+    
+    @asynccontextmanager
+    async def _code_lock(self, code: str):
+        """銘柄ごとのロックを取得し、待ち時間と待ち数を記録する"""
+        lock, users = self._locks.get(code, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[code] = (lock, users + 1)
+        self._lock_acquisitions += 1
+        try:
+            if lock.locked():
+                self._lock_contended += 1
+                self._waiters += 1
+                self._max_waiters = max(self._max_waiters, self._waiters)
+                started = time.perf_counter()
+                try:
+                    await lock.acquire()
+                finally:
+                    self._waiters -= 1
+                waited = time.perf_counter() - started
+                self._lock_wait_total += waited
+                self._lock_wait_max = max(self._lock_wait_max, waited)
+            else:
+                await lock.acquire()
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            lock, users = self._locks[code]
+            if users <= 1:
+                del self._locks[code]
+            else:
+                self._locks[code] = (lock, users - 1)
+    
+    def _put(self, code: str, entry: Tuple[str, str, pd.DataFrame]):
+        """エントリを保存してサイズを更新し、上限を超えていれば古いものから破棄"""
+        size = int(entry[2].memory_usage(index=True, deep=True).sum())
+        self._total_bytes += size - self._sizes.get(code, 0)
+        self._sizes[code] = size
+        self._cache[code] = entry
+        self._cache.move_to_end(code)
+        self._evict()
+    
+    def _evict(self):
+        """合計サイズが上限以下になるまで、未使用期間の長い銘柄から破棄"""
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+        for code in list(self._cache.keys()):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if code in self._pinned:
+                continue
+            size = self._drop(code)
+            self._eviction_count += 1
+            self._evicted_bytes += size
+            logger.debug(f"キャッシュ破棄(LRU) [{code}] {size}バイト")
+    
+    def _drop(self, code: str) -> int:
+        """銘柄のエントリを削除し、解放したサイズを返す"""
+        del self._cache[code]
+        self._versions.pop(code, None)
+        size = self._sizes.pop(code)
+        self._total_bytes -= size
+        return size
+    
+    def invalidate(self, code: str) -> bool:
+        """銘柄の保持期間を捨てる（取得元の履歴が書き換えられた場合など）。捨てたらTrue"""
+        if code not in self._cache:
+            return False
+        self._drop(code)
+        self._invalidated_count += 1
+        logger.debug(f"キャッシュ破棄(取得元の書き換え) [{code}]")
+        return True
+    
+    def _check_version(self, code: str, version_func) -> None:
+        """保存時から取得元の版が変わっていれば保持期間を捨てる"""
+        if version_func is not None and code in self._cache and version_func(code) != self._versions.get(code):
+            self.invalidate(code)
     
-    def _generate_key(self, code: str, start_date: str, end_date: str) -> str:
-        """キャッシュキーを生成"""
-        return f"{code}_{start_date}_{end_date}"
+    def pin(self, codes: Iterable[str]):
+        """処理中の銘柄を破棄対象から外す（入れ子で呼んでもよい）"""
+        for code in codes:
+            self._pinned[code] = self._pinned.get(code, 0) + 1
+    
+    def unpin(self, codes: Iterable[str]):
+        """pin()を解除し、上限を超えていれば破棄を再開する"""
+        for code in codes:
+            count = self._pinned.get(code, 0) - 1
+            if count > 0:
+                self._pinned[code] = count
+            else:
+                self._pinned.pop(code, None)
+        self._evict()
+    
+    @contextmanager
+    def pinned(self, codes: Iterable[str]):
+        """with文の間だけ銘柄をpinする"""
+        codes = list(codes)
+        self.pin(codes)
+        try:
+            yield
+        finally:
+            self.unpin(codes)
+    
+    @staticmethod
+    def _bounds(data: pd.DataFrame, start_date: str, end_date: str) -> Tuple[int, int]:
+        """Date列（昇順）から指定期間に当たる行位置[lo, hi)を求める"""
+        dates = data['Date'].to_numpy()
+        lo = dates.searchsorted(pd.to_datetime(start_date, format='%Y%m%d').to_datetime64(), side='left')
+        hi = dates.searchsorted(pd.to_datetime(end_date, format='%Y%m%d').to_datetime64(), side='right')
+        return int(lo), int(hi)
     
     async def get(self, code: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
         """
         キャッシュから株価データを取得
         
+        保持している期間が要求期間を含んでいれば、その部分を切り出して返す。
+        
         Args:
             code: 銘柄コード
             start_date: 開始日（YYYYMMDD形式）
@@ -36,88 +237,251 @@ class PriceDataCache:
         Returns:
             キャッシュされたDataFrame、存在しない場合はNone
         """
-        key = self._generate_key(code, start_date, end_date)
-        
-        async with self._lock:
-            if key in self._cache:
-                self._hit_count += 1
-                logger.debug(f"キャッシュヒット [{code}] {start_date}~{end_date}")
-                return self._cache[key].copy()
-            else:
-                self._miss_count += 1
-                return None
+        located = self._locate(code, start_date, end_date)
+        if located is not None:
+            self._hit_count += 1
+            data, lo, hi = located
+            return data.iloc[lo:hi].copy()
+        else:
+            self._miss_count += 1
+            return None
+    
+    def _locate(self, code: str, start_date: str, end_date: str) -> Optional[Tuple[pd.DataFrame, int, int]]:
+        """保持期間が要求期間を含んでいれば (DataFrame, lo, hi) を返す（統計は更新しない）"""
+        entry = self._cache.get(code)
+        if entry is not None and entry[0] <= start_date and entry[1] >= end_date:
+            self._cache.move_to_end(code)
+            logger.debug(f"キャッシュヒット [{code}] {start_date}~{end_date} (保持: {entry[0]}~{entry[1]})")
+            return (entry[2],) + self._bounds(entry[2], start_date, end_date)
+        return None
+    
+    async def get_view(self, code: str, start_date: str, end_date: str) -> Optional[PriceView]:
+        """get()の読み取り専用版。コピーせずにPriceViewを返す"""
+        located = self._locate(code, start_date, end_date)
+        if located is None:
+            self._miss_count += 1
+            return None
+        self._hit_count += 1
+        return PriceView.from_frame(*located)
     
     async def set(self, code: str, start_date: str, end_date: str, data: pd.DataFrame):
         """
         株価データをキャッシュに保存
         
+        既存の期間と重なる・隣接する場合は和集合にまとめ、保持期間を広げる。
+        
         Args:
             code: 銘柄コード
             start_date: 開始日（YYYYMMDD形式）
             end_date: 終了日（YYYYMMDD形式）
             data: 株価データのDataFrame
         """
-        key = self._generate_key(code, start_date, end_date)
-        
-        async with self._lock:
-            self._cache[key] = data.copy()
-            logger.debug(f"キャッシュ保存 [{code}] {start_date}~{end_date}, {len(data)}行")
+        self._store(code, start_date, end_date, data)
+        logger.debug(f"キャッシュ保存 [{code}] {start_date}~{end_date}, {len(data)}行")
+    
+    def _store(self, code: str, start_date: str, end_date: str, data: pd.DataFrame):
+        """エントリを保存（既存期間とつながる場合はマージ）"""
+        data = data.assign(Date=pd.to_datetime(data['Date']))
+        entry = self._cache.get(code)
+        if entry is not None and self._is_connected(entry[0], entry[1], start_date, end_date):
+            self._put(code, (min(entry[0], start_date), max(entry[1], end_date), self._merge(entry[2], data)))
+        else:
+            self._put(code, (start_date, end_date, data.sort_values('Date').reset_index(drop=True)))
+    
+    @staticmethod
+    def _merge(existing: pd.DataFrame, data: pd.DataFrame) -> pd.DataFrame:
+        """日付で重複を除いて和集合にする（新しいdataの行を優先、Date昇順）"""
+        merged = pd.concat([existing, data]).drop_duplicates(subset=['Date'], keep='last')
+        return merged.sort_values('Date').reset_index(drop=True)
     
-    async def get_or_fetch(self, code: str, start_date: str, end_date: str, 
-                          fetch_func, *args, **kwargs) -> Optional[pd.DataFrame]:
+    @staticmethod
+    def _is_connected(start_a: str, end_a: str, start_b: str, end_b: str) -> bool:
+        """2つの期間が重なるか隣接しているか（隙間があるとマージできない）"""
+        day = timedelta(days=1)
+        a_start = datetime.strptime(start_a, '%Y%m%d')
+        a_end = datetime.strptime(end_a, '%Y%m%d')
+        b_start = datetime.strptime(start_b, '%Y%m%d')
+        b_end = datetime.strptime(end_b, '%Y%m%d')
+        return a_start <= b_end + day and b_start <= a_end + day
+    
+    async def get_or_fetch(self, code: str, start_date: str, end_date: str,
+                          fetch_func, version_func=None) -> Optional[pd.DataFrame]:
         """
-        キャッシュから取得、存在しない場合はAPIから取得してキャッシュ
+        キャッシュから取得、不足している期間だけを取得してキャッシュを広げる
         
         Args:
             code: 銘柄コード
             start_date: 開始日（YYYYMMDD形式）
             end_date: 終了日（YYYYMMDD形式）
-            fetch_func: データ取得関数（async）
-            *args, **kwargs: fetch_funcに渡す引数
+            fetch_func: async def fetch_func(from_date: str, to_date: str) -> Optional[pd.DataFrame]
+            version_func: def version_func(code: str) -> 取得元の履歴の版（過去の行を書き換えたら
+                          変わる値）。指定時は版が変わった銘柄の保持期間を捨てて取り直す
         
         Returns:
-            株価データのDataFrame
+            株価データのDataFrame（呼び出し元が自由に変更できるコピー）
+        """
+        located = await self._resolve(code, start_date, end_date, fetch_func, version_func)
+        if located is None:
+            return None
+        data, lo, hi = located
+        if lo is None:
+            return data
+        return data.iloc[lo:hi].copy()
+    
+    async def get_or_fetch_view(self, code: str, start_date: str, end_date: str,
+                                fetch_func, version_func=None) -> Optional[PriceView]:
+        """
+        get_or_fetch()の読み取り専用版
+        
+        キャッシュが保持する配列をコピーせずにPriceViewとして返す。
+        スクリーニングのように価格を読むだけの処理はこちらを使う。
+        """
+        located = await self._resolve(code, start_date, end_date, fetch_func, version_func)
+        if located is None:
+            return None
+        data, lo, hi = located
+        if data is None or data.empty:
+            return None
+        return PriceView.from_frame(data, lo or 0, hi)
+    
+    async def _resolve(self, code: str, start_date: str, end_date: str,
+                       fetch_func, version_func=None) -> Optional[Tuple[pd.DataFrame, Optional[int], Optional[int]]]:
         """
-        # キャッシュから取得を試みる
-        cached_data = await self.get(code, start_date, end_date)
-        if cached_data is not None:
-            return cached_data
+        要求期間のデータを (DataFrame, lo, hi) で返す
+        
+        lo/hiはDataFrame上の行位置。取得結果をそのまま返す場合はlo/hiがNoneになる。
+        """
+        # キャッシュから取得を試みる（ロック不要）
+        self._check_version(code, version_func)
+        located = self._locate(code, start_date, end_date)
+        if located is not None:
+            self._hit_count += 1
+            return located
+        
+        async with self._code_lock(code):
+            # 待っている間に同じ銘柄の取得が終わっていれば、その結果を使う
+            located = self._locate(code, start_date, end_date)
+            if located is not None:
+                self._hit_count += 1
+                self._coalesced_count += 1
+                return located
+            return await self._fetch_locked(code, start_date, end_date, fetch_func, version_func)
+    
+    async def _fetch_locked(self, code: str, start_date: str, end_date: str,
+                            fetch_func, version_func=None) -> Optional[Tuple[pd.DataFrame, Optional[int], Optional[int]]]:
+        """銘柄ロック取得済みの状態で、不足期間を取得してキャッシュに反映する"""
+        self._check_version(code, version_func)
+        entry = self._cache.get(code)
+        if entry is not None and self._is_connected(entry[0], entry[1], start_date, end_date):
+            # 保持期間の外側（先頭・末尾）だけを取得して期間を広げる（ミス扱いにしない）
+            self._extend_count += 1
+            day = timedelta(days=1)
+            ranges = []
+            if start_date < entry[0]:
+                head_end = (datetime.strptime(entry[0], '%Y%m%d') - day).strftime('%Y%m%d')
+                ranges.append((start_date, head_end, True))
+            if end_date > entry[1]:
+                tail_start = (datetime.strptime(entry[1], '%Y%m%d') + day).strftime('%Y%m%d')
+                ranges.append((tail_start, end_date, False))
+            fetched = []
+            for from_date, to_date, is_head in ranges:
+                data = await fetch_func(from_date, to_date)
+                if data is not None and not data.empty:
+                    self._store(code, from_date, to_date, data)
+                    fetched.append(data)
+                elif data is not None and is_head:
+                    # 先頭側で空なら上場前などで「データなし」として保持期間に含める。
+                    # 取得失敗（None）や末尾側の空（当日分が未公開など）は期間を広げず、次回取得し直す
+                    current = self._cache.get(code)
+                    if current is not None:
+                        self._cache[code] = (min(current[0], from_date), current[1], current[2])
+            if version_func is not None and version_func(code) != self._versions.get(code):
+                # 取得中に取得元が過去の行を書き換えた（差分の株式分割で調整した等）→ 保持していた
+                # 行は古いため、書き換え後の要求期間を取り直す（取得元は最新なのでAPIは呼ばれない）
+                if code in self._cache:
+                    self.invalidate(code)
+                return await self._fetch_and_store(code, start_date, end_date, fetch_func, version_func)
+            current = self._cache.get(code)
+            if current is None:
+                # 拡張中に破棄された（上限が小さすぎる）場合は、保持していた行と取得した行から
+                # 要求期間を作って返す（取り直さない）
+                data = entry[2]
+                for piece in fetched:
+                    data = self._merge(data, piece.assign(Date=pd.to_datetime(piece['Date'])))
+                lo, hi = self._bounds(data, start_date, end_date)
+                return (data, lo, hi) if hi > lo else None
+            logger.debug(f"キャッシュ期間拡張 [{code}] → {current[0]}~{current[1]}")
+            lo, hi = self._bounds(current[2], start_date, end_date)
+            return (current[2], lo, hi) if hi > lo else None
         
         # キャッシュになければAPIから取得
-        data = await fetch_func(*args, **kwargs)
+        self._miss_count += 1
+        return await self._fetch_and_store(code, start_date, end_date, fetch_func, version_func)
+    
+    async def _fetch_and_store(self, code: str, start_date: str, end_date: str,
+                               fetch_func, version_func=None) -> Optional[Tuple[pd.DataFrame, Optional[int], Optional[int]]]:
+        """要求期間を取得してキャッシュに保存する（取得元の版も記録する）"""
+        data = await fetch_func(start_date, end_date)
         
         # 取得したデータをキャッシュに保存
         if data is not None and not data.empty:
-            await self.set(code, start_date, end_date, data)
+            self._store(code, start_date, end_date, data)
+            if version_func is not None:
+                self._versions[code] = version_func(code)
         
-        return data
+        return None if data is None else (data, None, None)
     
-    def get_stats(self) -> Dict[str, int]:
+    def get_stats(self) -> Dict[str, Any]:
         """キャッシュ統計を取得"""
-        total = self._hit_count + self._miss_count
+        total = self._hit_count + self._miss_count + self._extend_count
         hit_rate = (self._hit_count / total * 100) if total > 0 else 0
         
         return {
             "cache_size": len(self._cache),
             "hit_count": self._hit_count,
             "miss_count": self._miss_count,
-            "hit_rate": round(hit_rate, 2)
+            "extend_count": self._extend_count,
+            "hit_rate": round(hit_rate, 2),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "pinned": len(self._pinned),
+            "eviction_count": self._eviction_count,
+            "evicted_bytes": self._evicted_bytes,
+            "invalidated_count": self._invalidated_count,
+            "coalesced_count": self._coalesced_count,
+            "lock_acquisitions": self._lock_acquisitions,
+            "lock_contended": self._lock_contended,
+            "lock_wait_total_ms": round(self._lock_wait_total * 1000, 2),
+            "lock_wait_max_ms": round(self._lock_wait_max * 1000, 2),
+            "waiters": self._waiters,
+            "max_waiters": self._max_waiters
         }
     
     def clear(self):
         """キャッシュをクリア"""
         self._cache.clear()
+        self._sizes.clear()
+        self._versions.clear()
+        self._total_bytes = 0
         logger.info("キャッシュをクリアしました")
     
     def log_stats(self):
         """キャッシュ統計をログ出力"""
         stats = self.get_stats()
+        limit = "" if stats['max_bytes'] is None else f"/{stats['max_bytes'] / (1024 * 1024):.0f}MB"
         logger.info(
             f"キャッシュ統計: "
             f"サイズ={stats['cache_size']}, "
             f"ヒット={stats['hit_count']}, "
             f"ミス={stats['miss_count']}, "
-            f"ヒット率={stats['hit_rate']}%"
+            f"期間拡張={stats['extend_count']}, "
+            f"ヒット率={stats['hit_rate']}%, "
+            f"使用量={stats['bytes'] / (1024 * 1024):.1f}MB{limit}, "
+            f"破棄={stats['eviction_count']}件({stats['evicted_bytes'] / (1024 * 1024):.1f}MB), "
+            f"書き換えによる破棄={stats['invalidated_count']}件, "
+            f"ロック待ち={stats['lock_contended']}/{stats['lock_acquisitions']}回"
+            f"(合計{stats['lock_wait_total_ms']:.0f}ms, 最大{stats['lock_wait_max_ms']:.0f}ms, "
+            f"最大待ち数={stats['max_waiters']}, 相乗り={stats['coalesced_count']})"
         )
 
 
@@ -129,5 +493,5 @@ def get_cache() -> PriceDataCache:
     """グローバルキャッシュインスタンスを取得"""
     global _global_cache
     if _global_cache is None:
-        _global_cache = PriceDataCache()
+        _global_cache = PriceDataCache(max_bytes=DEFAULT_MAX_MB * 1024 * 1024 or None)
     return _global_cache
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+テスト用の乱数の株価（各test_*.pyで共有）
+"""
+
+from typing import List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def make_prices(
+    seed: int,
+    bars: int = 245,
+    drift: float = 0.0,
+    volatility: Union[float, Sequence[float]] = 0.02,
+    missing: float = 0.0,
+    end: str = '2025-06-02'
+) -> pd.DataFrame:
+    """
+    乱数の四本値（Date昇順の営業日、四本値はfloat32）
+
+    Args:
+        seed: 乱数のシード
+        bars: 本数
+        drift: 1本あたりの平均騰落率
+        volatility: 1本あたりの騰落率の標準偏差（足ごとの配列も可）。始値・高値・安値の
+            終値からの離れ具合もこの半分の大きさにする
+        missing: 四本値を欠損（NaN）にする足の割合。最新の足は欠損にしない
+        end: 最新の足の日付
+    """
+    rng = np.random.default_rng(seed)
+    volatility = np.broadcast_to(np.asarray(volatility, dtype=np.float64), (bars,))
+    close = 1000 * np.cumprod(1 + drift + rng.normal(0, 1, bars) * volatility)
+    open_ = close * (1 + rng.normal(0, 0.5, bars) * volatility)
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.5, bars)) * volatility)
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.5, bars)) * volatility)
+    df = pd.DataFrame({
+        'Date': pd.bdate_range(end=end, periods=bars),
+        'Open': open_.astype(np.float32),
+        'High': high.astype(np.float32),
+        'Low': low.astype(np.float32),
+        'Close': close.astype(np.float32),
+        'Volume': rng.integers(1000, 10 ** 6, bars),
+    })
+    if missing:
+        rows = rng.random(bars) < missing
+        rows[-1] = False
+        df.loc[rows, PRICE_COLUMNS] = np.nan
+    return df
+
+
+def stack_column(frames: List[pd.DataFrame], column: str) -> np.ndarray:
+    """同じ本数の株価の1列を 足 × 銘柄 のfloat64配列に並べる"""
+    return np.column_stack([frame[column].to_numpy(dtype=np.float64) for frame in frames])
@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from daily_data_collection import (
     StockScreener, 
     sample_stocks_balanced,
+    format_condition_count,
     logger,
     CONCURRENT_REQUESTS,
     PULLBACK_EMA_FILTER,
@@ -59,6 +60,11 @@ async def main():
         screener.latest_trading_date = await screener.get_latest_trading_date()
         logger.info(f"📅 最新取引日（スクリーニング用）: {screener.latest_trading_date}")
         
+        # 永続キャッシュのプリロード（ディスク読み込みを銘柄ごとの処理から外す）
+        screener.preload_persistent_cache(stocks)
+        # 取引カレンダー（キャッシュ途中の欠損検出用）
+        await screener.load_trading_calendar()
+        
         logger.info(f"同時実行数: {CONCURRENT_REQUESTS}")
         logger.info(f"EMAフィルター: {PULLBACK_EMA_FILTER}")
         logger.info(f"ストキャスティクス: {'ON' if PULLBACK_STOCHASTIC_FILTER else 'OFF'}")
@@ -86,24 +92,16 @@ async def main():
             if stats['total'] > 0:
                 logger.info(f"✅ データ取得成功: {stats['has_data']:,}銘柄 ({stats['has_data']/stats['total']*100:.1f}%)")
             
-            logger.info(f"\n🔹 条件別通過状況:")
-            
-            if stats['has_data'] > 0:
-                logger.info(f"  1️⃣ 60日以内に52週高値更新: {stats['recent_high']:,}銘柄 ({stats['recent_high']/stats['has_data']*100:.2f}%)")
-            
-            if stats['recent_high'] > 0:
-                logger.info(f"  2️⃣ 30%以内の押し目: {stats['within_30pct']:,}銘柄 ({stats['within_30pct']/stats['recent_high']*100:.2f}%)")
+            logger.info(f"\n🔹 条件別通過状況（割合は各条件を評価した銘柄に対するもの）:")
+            logger.info(f"  1️⃣ 60日以内に52週高値更新: {format_condition_count(stats, 'recent_high')}")
+            logger.info(f"  2️⃣ 30%以内の押し目: {format_condition_count(stats, 'within_30pct')}")
             
             logger.info(f"\n🔹 EMAタッチ別統計:")
-            logger.info(f"  🔸 10EMAタッチ: {stats['ema10_touch']:,}銘柄")
-            logger.info(f"  🔸 20EMAタッチ: {stats['ema20_touch']:,}銘柄")
-            logger.info(f"  🔸 50EMAタッチ: {stats['ema50_touch']:,}銘柄")
-            
-            if stats['within_30pct'] > 0:
-                logger.info(f"  ✅ いずれかのEMAタッチ: {stats['any_ema_touch']:,}銘柄 ({stats['any_ema_touch']/stats['within_30pct']*100:.2f}%)")
-            
-            if stats['any_ema_touch'] > 0:
-                logger.info(f"  📈 EMA50上昇トレンド: {stats['ema50_rising']:,}銘柄 ({stats['ema50_rising']/stats['any_ema_touch']*100:.2f}%)")
+            logger.info(f"  🔸 10EMAタッチ: {format_condition_count(stats, 'ema10_touch')}")
+            logger.info(f"  🔸 20EMAタッチ: {format_condition_count(stats, 'ema20_touch')}")
+            logger.info(f"  🔸 50EMAタッチ: {format_condition_count(stats, 'ema50_touch')}")
+            logger.info(f"  ✅ いずれかのEMAタッチ: {format_condition_count(stats, 'any_ema_touch')}")
+            logger.info(f"  📈 EMA50上昇トレンド: {format_condition_count(stats, 'ema50_rising')}")
             
             logger.info(f"\n⭐ 全条件通過: {stats['passed_all']:,}銘柄")
             logger.info("="*60 + "\n")
@@ -177,13 +175,9 @@ async def main():
         screener.cache.log_stats()
         
         # 永続キャッシュ統計を出力
-        persistent_stats = screener.persistent_cache.get_stats()
-        logger.info("\n永続キャッシュ統計:")
-        logger.info(f"  ファイル数: {persistent_stats['files']}件")
-        logger.info(f"  合計サイズ: {persistent_stats['size_mb']}MB")
-        logger.info(f"  ヒット数: {persistent_stats['hits']}回")
-        logger.info(f"  ミス数: {persistent_stats['misses']}回")
-        logger.info(f"  ヒット率: {persistent_stats['hit_rate']}%")
+        screener.persistent_cache.log_stats()
+        screener.indicator_memo.log_stats()
+        screener.write_cache_stats("200day_pullback")
         logger.info("=" * 80)
         
         logger.info("✅ 200日新高値押し目スクリーニング完了")
@@ -192,6 +186,8 @@ async def main():
     except Exception as e:
         logger.error(f"❌ エラーが発生しました: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        screener.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
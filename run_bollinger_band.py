@@ -55,6 +55,11 @@ async def main():
         screener.latest_trading_date = await screener.get_latest_trading_date()
         logger.info(f"📅 最新取引日（スクリーニング用）: {screener.latest_trading_date}")
         
+        # 永続キャッシュのプリロード（ディスク読み込みを銘柄ごとの処理から外す）
+        screener.preload_persistent_cache(stocks)
+        # 取引カレンダー（キャッシュ途中の欠損検出用）
+        await screener.load_trading_calendar()
+        
         logger.info(f"同時実行数: {CONCURRENT_REQUESTS}")
         logger.info("=" * 80)
         
@@ -124,13 +129,9 @@ async def main():
         screener.cache.log_stats()
         
         # 永続キャッシュ統計を出力
-        persistent_stats = screener.persistent_cache.get_stats()
-        logger.info("\n永続キャッシュ統計:")
-        logger.info(f"  ファイル数: {persistent_stats['files']}件")
-        logger.info(f"  合計サイズ: {persistent_stats['size_mb']}MB")
-        logger.info(f"  ヒット数: {persistent_stats['hits']}回")
-        logger.info(f"  ミス数: {persistent_stats['misses']}回")
-        logger.info(f"  ヒット率: {persistent_stats['hit_rate']}%")
+        screener.persistent_cache.log_stats()
+        screener.indicator_memo.log_stats()
+        screener.write_cache_stats("bollinger_band")
         logger.info("=" * 80)
         
         logger.info("✅ ボリンジャーバンドスクリーニング完了")
@@ -139,6 +140,8 @@ async def main():
     except Exception as e:
         logger.error(f"❌ エラーが発生しました: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        screener.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
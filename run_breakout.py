@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from daily_data_collection import (
     StockScreener, 
     sample_stocks_balanced,
+    format_condition_count,
     logger,
     CONCURRENT_REQUESTS
 )
@@ -59,6 +60,11 @@ async def main():
         screener.latest_trading_date = await screener.get_latest_trading_date()
         logger.info(f"📅 最新取引日（スクリーニング用）: {screener.latest_trading_date}")
         
+        # 永続キャッシュのプリロード（ディスク読み込みを銘柄ごとの処理から外す）
+        screener.preload_persistent_cache(stocks)
+        # 取引カレンダー（キャッシュ途中の欠損検出用）
+        await screener.load_trading_calendar()
+        
         # ハンマースクリーニングのみ実行
         logger.info("=" * 80)
         logger.info("🎯 ハンマー（下髭）スクリーニング開始")
@@ -79,14 +85,15 @@ async def main():
             logger.info("📊 ハンマースクリーニング 詳細統計")
             logger.info("=" * 60)
             logger.info(f"  処理対象:             {s['total']:,}銘柄")
+            logger.info(f"  最新の足で事前に除外: {s.get('prefiltered', 0):,}銘柄（履歴は取得せず）")
             logger.info(f"  データ取得成功:       {s['has_data']:,}銘柄")
-            logger.info(f"  52週高値-20%以下通過: {s['passed_bottom_zone']:,}銘柄")
-            logger.info(f"  ストキャス%K≤20通過: {s['passed_stochastic']:,}銘柄")
-            logger.info(f"  50EMA乖離5%以上通過: {s['passed_ema_deviation']:,}銘柄")
-            logger.info(f"  下髭比率≥45%通過:    {s['passed_shadow_ratio']:,}銘柄")
-            logger.info(f"  下髭÷実体≥1.0倍通過: {s['passed_shadow_body']:,}銘柄")
-            logger.info(f"  終値位置上位30%通過:  {s['passed_close_position']:,}銘柄")
-            logger.info(f"  陽線通過:             {s['passed_bullish']:,}銘柄")
+            logger.info(f"  52週高値-20%以下通過: {format_condition_count(s, 'passed_bottom_zone')}")
+            logger.info(f"  ストキャス%K≤20通過: {format_condition_count(s, 'passed_stochastic')}")
+            logger.info(f"  50EMA乖離5%以上通過: {format_condition_count(s, 'passed_ema_deviation')}")
+            logger.info(f"  下髭比率≥45%通過:    {format_condition_count(s, 'passed_shadow_ratio')}")
+            logger.info(f"  下髭÷実体≥1.0倍通過: {format_condition_count(s, 'passed_shadow_body')}")
+            logger.info(f"  終値位置上位30%通過:  {format_condition_count(s, 'passed_close_position')}")
+            logger.info(f"  陽線通過:             {format_condition_count(s, 'passed_bullish')}")
             logger.info(f"  最終検出:             {s['final_detected']:,}銘柄")
             logger.info("=" * 60)
         
@@ -153,13 +160,9 @@ async def main():
         screener.cache.log_stats()
         
         # 永続キャッシュ統計を出力
-        persistent_stats = screener.persistent_cache.get_stats()
-        logger.info("\n永続キャッシュ統計:")
-        logger.info(f"  ファイル数: {persistent_stats['files']}件")
-        logger.info(f"  合計サイズ: {persistent_stats['size_mb']}MB")
-        logger.info(f"  ヒット数: {persistent_stats['hits']}回")
-        logger.info(f"  ミス数: {persistent_stats['misses']}回")
-        logger.info(f"  ヒット率: {persistent_stats['hit_rate']}%")
+        screener.persistent_cache.log_stats()
+        screener.indicator_memo.log_stats()
+        screener.write_cache_stats("breakout")
         logger.info("=" * 80)
         
         logger.info("✅ ハンマースクリーニング完了")
@@ -168,6 +171,8 @@ async def main():
     except Exception as e:
         logger.error(f"❌ エラーが発生しました: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        screener.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
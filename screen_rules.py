@@ -0,0 +1,559 @@
+"""
+スクリーニング条件の宣言的な定義
+条件は指標の式（Indicator("ema", 50) や close - low など）に名前を付けて並べるだけで、
+全銘柄分のIndicatorSetに対してまとめて評価し、銘柄ごとの真偽の配列（マスク）にする。
+銘柄ごとのコードを書かずに手法・閾値を追加・変更でき、条件ごとの通過数も自動で数える。
+
+条件は安く・よく絞り込めるものから順に、残っている銘柄だけについて評価する。
+通過率は前回までの実行で観測した値（PassRateStore）を使い、未計算の指標は
+その条件まで残った銘柄の分だけ計算する。
+"""
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+from indicator_engine import PRICE_INDICATORS, IndicatorSet
+
+logger = logging.getLogger(__name__)
+
+# Indicatorのパラメータに使うと、パネル全体の本数（各銘柄の履歴全体）に置き換わる
+HISTORY = "history"
+
+# 未計算の指標を計算する相対コスト（四本値・出来高は0、ここに無い指標は1）
+INDICATOR_COSTS = {
+    "ema": 4.0,
+    "sma": 2.0,
+    "std": 3.0,
+    "stoch_k": 4.0,
+    "stoch_d": 5.0,
+    "atr": 4.0,
+    "window_high": 1.0,
+    "bars_since_high": 1.0,
+}
+# 指標がそろっている条件の評価コスト（numpyの演算のみ）
+CONDITION_BASE_COST = 0.1
+# 通過率が未観測の条件の通過率
+DEFAULT_PASS_RATE = 0.5
+
+
+class Expr:
+    """
+    全銘柄分の値を返す式
+    
+    四則演算・比較・&（かつ）・|（または）・~（否定）で組み合わせられる。
+    評価は銘柄方向にまとめて行い、最新の足の値を銘柄ごとの1次元配列で返す。
+    比較はPythonと同じくNaNに対して常に偽になる。
+    """
+    
+    def evaluate(self, context: "RuleContext", cols: np.ndarray) -> np.ndarray:
+        """列番号colsの銘柄の値（context.evaluate()から呼ばれる）"""
+        raise NotImplementedError
+    
+    def leaves(self) -> List["Indicator"]:
+        """式が使う指標"""
+        return []
+    
+    def __add__(self, other):
+        return _Op(np.add, self, other)
+    
+    def __radd__(self, other):
+        return _Op(np.add, other, self)
+    
+    def __sub__(self, other):
+        return _Op(np.subtract, self, other)
+    
+    def __rsub__(self, other):
+        return _Op(np.subtract, other, self)
+    
+    def __mul__(self, other):
+        return _Op(np.multiply, self, other)
+    
+    def __rmul__(self, other):
+        return _Op(np.multiply, other, self)
+    
+    def __truediv__(self, other):
+        return _Op(np.true_divide, self, other)
+    
+    def __rtruediv__(self, other):
+        return _Op(np.true_divide, other, self)
+    
+    def __neg__(self):
+        return _Op(np.negative, self)
+    
+    def __abs__(self):
+        return _Op(np.absolute, self)
+    
+    def __lt__(self, other):
+        return _Op(np.less, self, other)
+    
+    def __le__(self, other):
+        return _Op(np.less_equal, self, other)
+    
+    def __gt__(self, other):
+        return _Op(np.greater, self, other)
+    
+    def __ge__(self, other):
+        return _Op(np.greater_equal, self, other)
+    
+    def __and__(self, other):
+        return _Op(np.logical_and, self, other)
+    
+    def __rand__(self, other):
+        return _Op(np.logical_and, other, self)
+    
+    def __or__(self, other):
+        return _Op(np.logical_or, self, other)
+    
+    def __ror__(self, other):
+        return _Op(np.logical_or, other, self)
+    
+    def __invert__(self):
+        return _Op(np.logical_not, self)
+
+
+class Indicator(Expr):
+    """
+    指標の最新の足の値（IndicatorSet.series()の名前・パラメータ）
+    
+    四本値・出来高は "open" / "high" / "low" / "close" / "volume"。
+    agoを指定すると何本前の値か（足方向の指標のみ）。
+    """
+    
+    def __init__(self, name: str, *params, ago: int = 0):
+        self.name = name
+        self.params = params
+        self.ago = ago
+    
+    def key(self, indicators: IndicatorSet) -> Tuple:
+        """IndicatorSet.series()のキー (名前, パラメータ...)"""
+        return (self.name,) + tuple(indicators.panel.bars if param == HISTORY else param for param in self.params)
+    
+    def evaluate(self, context: "RuleContext", cols: np.ndarray) -> np.ndarray:
+        return context.latest(self, cols)
+    
+    def leaves(self) -> List["Indicator"]:
+        return [self]
+    
+    def __repr__(self) -> str:
+        params = ", ".join(repr(param) for param in (self.name,) + self.params)
+        return f"Indicator({params}{f', ago={self.ago}' if self.ago else ''})"
+
+
+class Const(Expr):
+    """定数（式の中の数値・文字列は自動でConstになる）"""
+    
+    def __init__(self, value: Any):
+        self.value = value
+    
+    def evaluate(self, context: "RuleContext", cols: np.ndarray) -> Any:
+        return self.value
+    
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+
+class _Op(Expr):
+    """numpyの関数を引数の式に適用する"""
+    
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = tuple(arg if isinstance(arg, Expr) else Const(arg) for arg in args)
+    
+    def evaluate(self, context: "RuleContext", cols: np.ndarray) -> np.ndarray:
+        return self.func(*(context.evaluate(arg, cols) for arg in self.args))
+    
+    def leaves(self) -> List["Indicator"]:
+        return [leaf for arg in self.args for leaf in arg.leaves()]
+
+
+class _Labels(Expr):
+    """条件が真のラベルを区切り文字で連結した文字列"""
+    
+    def __init__(self, labels: Sequence[Tuple[str, Expr]], sep: str):
+        self.labels = list(labels)
+        self.sep = sep
+    
+    def evaluate(self, context: "RuleContext", cols: np.ndarray) -> np.ndarray:
+        masks = [(label, context.evaluate(cond, cols)) for label, cond in self.labels]
+        out = np.empty(len(cols), dtype=object)
+        for i in range(len(cols)):
+            out[i] = self.sep.join(label for label, mask in masks if mask[i])
+        return out
+    
+    def leaves(self) -> List["Indicator"]:
+        return [leaf for _, cond in self.labels for leaf in cond.leaves()]
+
+
+def where(cond, if_true, if_false) -> Expr:
+    """条件が真の銘柄はif_true、偽の銘柄はif_false"""
+    return _Op(np.where, cond, if_true, if_false)
+
+
+def minimum(a, b) -> Expr:
+    """銘柄ごとの小さい方"""
+    return _Op(np.minimum, a, b)
+
+
+def maximum(a, b) -> Expr:
+    """銘柄ごとの大きい方"""
+    return _Op(np.maximum, a, b)
+
+
+def isnan(expr) -> Expr:
+    """値がNaNか"""
+    return _Op(np.isnan, expr)
+
+
+def labels(pairs: Sequence[Tuple[str, Expr]], sep: str = ",") -> Expr:
+    """(ラベル, 条件) の並びから、条件が真のラベルを連結した文字列（"10EMA,20EMA"など）"""
+    return _Labels(pairs, sep)
+
+
+class Condition:
+    """
+    名前付きの条件
+    
+    Args:
+        name: 条件名（通過数の集計キー。手法の統計dictのキーと揃える）
+        expr: 真偽を返す式
+        counted: 通過数を統計に数えるか（NaNの除外など前提条件はFalse）
+        required: Falseなら絞り込みに使わず通過数だけ数える（EMAごとのタッチなど）
+    """
+    
+    def __init__(self, name: str, expr: Expr, counted: bool = True, required: bool = True):
+        self.name = name
+        self.expr = expr
+        self.counted = counted
+        self.required = required
+    
+    def __repr__(self) -> str:
+        return f"Condition({self.name!r})"
+
+
+# 出力項目の定義: 式、または (式, 丸める桁数)
+OutputSpec = Union[Expr, Tuple[Expr, int]]
+
+
+class ScreenRules:
+    """
+    手法の条件と出力項目の定義
+    
+    必須の条件は全て満たす必要があり、評価の順序は結果に影響しない。通過数だけ
+    数える条件（required=False）は、その次に並べた必須の条件と同じ銘柄について
+    評価する。出力項目は検出した銘柄の結果dictに入れる値で、丸めはPythonのround()で行う。
+    """
+    
+    def __init__(self, name: str, conditions: Sequence[Condition], outputs: Optional[Dict[str, OutputSpec]] = None):
+        self.name = name
+        self.conditions = list(conditions)
+        self.outputs = dict(outputs or {})
+    
+    def groups(self) -> List[List[int]]:
+        """評価の単位（通過数だけ数える条件 + 次の必須の条件）の条件番号のリスト"""
+        groups, pending = [], []
+        for i, condition in enumerate(self.conditions):
+            pending.append(i)
+            if condition.required:
+                groups.append(pending)
+                pending = []
+        if pending:
+            groups.append(pending)
+        return groups
+    
+    def latest_bar_rules(self) -> Optional["ScreenRules"]:
+        """
+        最新の足の四本値・出来高だけで決まる必須の条件（無ければNone）
+        
+        必須の条件は全て満たす必要があるため、これらを満たさない銘柄は残りの条件を
+        評価するまでもなく検出されない。株価の履歴を取得する前の絞り込みに使う。
+        """
+        conditions = []
+        for condition in self.conditions:
+            leaves = condition.expr.leaves()
+            if condition.required and leaves and all(leaf.name in PRICE_INDICATORS and leaf.ago == 0 for leaf in leaves):
+                conditions.append(Condition(condition.name, condition.expr, counted=condition.counted))
+        return ScreenRules(f"{self.name}:latest_bar", conditions) if conditions else None
+    
+    def evaluate(self, indicators: IndicatorSet, pass_rates: Optional[Dict[str, float]] = None,
+                 ordered: bool = True) -> "RuleResult":
+        """
+        全銘柄分の条件をまとめて評価する
+        
+        Args:
+            indicators: 全銘柄の指標
+            pass_rates: 条件名 → 前回までの通過率（PassRateStore.rates()）
+            ordered: Falseなら並べた順に評価する（コスト・通過率で並べ替えない）
+        """
+        return RuleResult(self, RuleContext(indicators), pass_rates, ordered)
+    
+    def __repr__(self) -> str:
+        return f"ScreenRules({self.name!r}, {[condition.name for condition in self.conditions]})"
+
+
+class RuleContext:
+    """
+    1つのIndicatorSetに対する式の評価結果
+    
+    式の値は銘柄ごとに1度だけ評価して全銘柄分の配列に書き込み、評価済みの
+    銘柄は使い回す。IndicatorSetで未計算の指標は、求められた銘柄だけの
+    パネルで計算する（IndicatorSetにメモがあれば計算済みの銘柄はそれを使う）。
+    """
+    
+    def __init__(self, indicators: IndicatorSet):
+        self.indicators = indicators
+        self.width = len(indicators.panel)
+        self.all_cols = np.arange(self.width)
+        # 式のid → (式, 全銘柄分の値, 評価済みの銘柄)。式も保持してidの再利用を防ぐ
+        self._values: Dict[int, Tuple[Expr, np.ndarray, np.ndarray]] = {}
+        self._subset: Optional[Tuple[np.ndarray, IndicatorSet]] = None
+        self.lazy_columns = 0
+    
+    def evaluate(self, expr: Expr, cols: Optional[np.ndarray] = None) -> Any:
+        """式の列番号colsの銘柄の値（省略時は全銘柄）"""
+        if isinstance(expr, Const):
+            return expr.value
+        if cols is None:
+            cols = self.all_cols
+        cached = self._values.get(id(expr))
+        missing = cols if cached is None else cols[~cached[2][cols]]
+        if len(missing):
+            # 条件を満たさない銘柄の0除算・NaNの比較は、マスクで除くため警告を出さない
+            with np.errstate(all='ignore'):
+                values = np.broadcast_to(np.asarray(expr.evaluate(self, missing)), (len(missing),))
+            if cached is None:
+                cached = (expr, np.empty(self.width, dtype=values.dtype), np.zeros(self.width, dtype=bool))
+                self._values[id(expr)] = cached
+            elif cached[1].dtype != values.dtype:
+                cached = (expr, cached[1].astype(np.result_type(cached[1], values)), cached[2])
+                self._values[id(expr)] = cached
+            cached[1][missing] = values
+            cached[2][missing] = True
+        return cached[1][cols]
+    
+    def available(self, indicator: Indicator, cols: np.ndarray) -> bool:
+        """指標の値をcolsの銘柄について計算せずに引けるか"""
+        key = indicator.key(self.indicators)
+        if key[0] in PRICE_INDICATORS or self.indicators.covers(key, indicator.ago + 1):
+            return True
+        cached = self._values.get(id(indicator))
+        return cached is not None and bool(cached[2][cols].all())
+    
+    def latest(self, indicator: Indicator, cols: np.ndarray) -> np.ndarray:
+        """指標の最新（agoを指定すれば何本前）の足の値"""
+        indicators = self.indicators
+        key = indicator.key(indicators)
+        rows = indicator.ago + 1
+        if key[0] in PRICE_INDICATORS or indicators.covers(key, rows) or len(cols) == self.width:
+            values = indicators.recent(*key, rows=rows)
+            return self._row(values, indicator.ago)[cols]
+        # 未計算の指標は、残っている銘柄だけのパネルで計算する
+        if self._subset is None or self._subset[0] is not cols:
+            self._subset = (cols, IndicatorSet(indicators.panel.select(cols), memo=indicators.memo))
+            self.lazy_columns += len(cols)
+        return self._row(self._subset[1].series(*key), indicator.ago)
+    
+    @staticmethod
+    def _row(values: np.ndarray, ago: int) -> np.ndarray:
+        if values.ndim == 1:
+            return values
+        if ago >= len(values):
+            return np.full(values.shape[1], np.nan)
+        return values[-1 - ago]
+
+
+class RuleResult:
+    """
+    全銘柄分の評価結果
+    
+    条件は (未計算の指標のコスト) / (1 - 通過率) の小さいものから順に、それまでの
+    条件を満たして残っている銘柄だけについて評価する（独立な条件の並びで評価の
+    手間の期待値が最小になる順）。通過率はpass_ratesの値、無ければDEFAULT_PASS_RATE。
+    
+    Attributes:
+        mask: 全ての必須条件を満たした銘柄
+        first_failed: 銘柄ごとに満たさなかった必須条件の番号（全て満たせば条件数）
+        order: 評価した順の条件番号
+        reached: 条件名 → その条件を評価した銘柄数
+        passed_counts: 条件名 → 評価した銘柄のうち通過した数
+        counts: 集計対象の条件（counted=True）の通過数
+    """
+    
+    def __init__(self, rules: ScreenRules, context: RuleContext,
+                 pass_rates: Optional[Dict[str, float]] = None, ordered: bool = True):
+        self.rules = rules
+        self.context = context
+        self.pass_rates = pass_rates or {}
+        conditions = rules.conditions
+        width = context.width
+        alive = context.all_cols
+        self.first_failed = np.full(width, len(conditions), dtype=np.int64)
+        self.masks = [np.zeros(width, dtype=bool) for _ in conditions]
+        self.order: List[int] = []
+        self.reached: Dict[str, int] = {}
+        self.passed_counts: Dict[str, int] = {}
+        
+        remaining = rules.groups()
+        while remaining:
+            group = min(remaining, key=lambda g: self._rank(g, alive)) if ordered else remaining[0]
+            remaining.remove(group)
+            for i in group:
+                condition = conditions[i]
+                passed = np.broadcast_to(np.asarray(context.evaluate(condition.expr, alive), dtype=bool), (len(alive),))
+                self.masks[i][alive[passed]] = True
+                self.order.append(i)
+                self.reached[condition.name] = len(alive)
+                self.passed_counts[condition.name] = int(np.count_nonzero(passed))
+                if condition.required:
+                    self.first_failed[alive[~passed]] = i
+                    alive = alive[passed]
+        
+        self.survivors = alive
+        self._position = {i: pos for pos, i in enumerate(self.order)}
+        self.mask = np.zeros(width, dtype=bool)
+        self.mask[alive] = True
+        self.counts = {
+            conditions[i].name: self.passed_counts[conditions[i].name]
+            for i in self.order if conditions[i].counted
+        }
+        self._outputs: Dict[str, Dict[int, Any]] = {}
+    
+    def _rank(self, group: List[int], alive: np.ndarray) -> float:
+        """評価の優先度（小さいほど先）"""
+        context = self.context
+        conditions = self.rules.conditions
+        cost = CONDITION_BASE_COST
+        seen = set()
+        for i in group:
+            for leaf in conditions[i].expr.leaves():
+                key = leaf.key(context.indicators)
+                if key in seen or context.available(leaf, alive):
+                    continue
+                seen.add(key)
+                cost += INDICATOR_COSTS.get(key[0], 1.0)
+        required = conditions[group[-1]]
+        rate = self.pass_rates.get(required.name, DEFAULT_PASS_RATE) if required.required else 1.0
+        return cost / max(1.0 - rate, 0.01)
+    
+    def passed(self, col: int) -> bool:
+        """銘柄が全ての必須条件を満たしたか"""
+        return bool(self.mask[col])
+    
+    def failed_condition(self, col: int) -> Optional[str]:
+        """銘柄が満たさなかった必須条件の名前（全て満たせばNone）"""
+        i = int(self.first_failed[col])
+        return self.rules.conditions[i].name if i < len(self.rules.conditions) else None
+    
+    def passed_conditions(self, col: int) -> List[str]:
+        """銘柄が評価で通過した（集計対象の）条件名"""
+        return [
+            condition.name
+            for condition, mask in zip(self.rules.conditions, self.masks)
+            if condition.counted and mask[col]
+        ]
+    
+    def evaluated_conditions(self, col: int) -> List[str]:
+        """
+        銘柄について評価した（集計対象の）条件名
+        
+        評価の順で、満たさなかった必須条件まで（全て満たせば全条件）。並べた順の
+        前の条件でも、後に評価されて銘柄が外れていれば含まない。
+        """
+        failed = int(self.first_failed[col])
+        last = self._position[failed] if failed < len(self.rules.conditions) else len(self.order)
+        conditions = self.rules.conditions
+        return [conditions[i].name for i in self.order[:last + 1] if conditions[i].counted]
+    
+    def value(self, expr: Expr, col: int) -> Any:
+        """式の銘柄の値（Pythonの数値）"""
+        values = self.context.evaluate(expr, np.array([col]))
+        if not isinstance(values, np.ndarray):
+            return values
+        return values[0].item() if values.dtype != object else values[0]
+    
+    def outputs(self, col: int) -> Dict[str, Any]:
+        """出力項目の銘柄の値（Pythonの数値・文字列、指定桁で丸めたもの）"""
+        result = {}
+        for field, spec in self.rules.outputs.items():
+            values = self._outputs.get(field)
+            if values is None:
+                # 出力項目は全ての条件を満たした銘柄の分だけまとめて評価する
+                expr = spec[0] if isinstance(spec, tuple) else spec
+                cols = self.survivors if self.mask[col] else np.array([col])
+                evaluated = np.broadcast_to(self.context.evaluate(expr, cols), (len(cols),)).tolist()
+                values = dict(zip(cols.tolist(), evaluated))
+                if self.mask[col]:
+                    self._outputs[field] = values
+            value = values[col]
+            result[field] = round(value, spec[1]) if isinstance(spec, tuple) else value
+        return result
+    
+    def log_counts(self) -> None:
+        """評価した順に、条件ごとの判定数と通過数をログ出力"""
+        steps = ", ".join(
+            f"{self.rules.conditions[i].name}={self.passed_counts[self.rules.conditions[i].name]}"
+            f"/{self.reached[self.rules.conditions[i].name]}"
+            for i in self.order
+        )
+        logger.info(f"条件評価 [{self.rules.name}] {self.context.width}銘柄: {steps}, "
+                    f"検出={len(self.survivors)} (指標の追加計算 延べ{self.context.lazy_columns}銘柄)")
+
+
+class PassRateStore:
+    """
+    条件ごとの通過率を実行をまたいで保存する（評価順の決定に使う）
+    
+    通過率は「その条件を評価した銘柄のうち通過した割合」で、実行ごとに
+    前回までの値と重みweightで混ぜる。ファイルは永続キャッシュの隣の
+    サブディレクトリに置く（キャッシュ直下は銘柄のファイル）。
+    """
+    
+    DIR_NAME = "screen_rules"
+    FILE_NAME = "pass_rates.json"
+    
+    def __init__(self, cache_dir: Union[str, Path], weight: float = 0.5):
+        self.path = Path(cache_dir).expanduser() / self.DIR_NAME / self.FILE_NAME
+        self.weight = weight
+        self._rates: Dict[str, Dict[str, float]] = {}
+        self.load()
+    
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._rates = {
+                name: {condition: float(rate) for condition, rate in rates.items()}
+                for name, rates in data.get("rates", {}).items()
+            }
+        except FileNotFoundError:
+            self._rates = {}
+        except Exception as e:
+            logger.warning(f"条件の通過率を読み込めませんでした（初期値で評価します）: {e}")
+            self._rates = {}
+    
+    def rates(self, rules_name: str) -> Dict[str, float]:
+        """手法の条件名 → 通過率"""
+        return self._rates.get(rules_name, {})
+    
+    def record(self, result: RuleResult) -> None:
+        """評価結果の通過率を反映する（判定した銘柄が無い条件はそのまま）"""
+        rates = self._rates.setdefault(result.rules.name, {})
+        for name, reached in result.reached.items():
+            if reached == 0:
+                continue
+            observed = result.passed_counts[name] / reached
+            previous = rates.get(name)
+            rates[name] = observed if previous is None else previous * (1 - self.weight) + observed * self.weight
+    
+    def save(self) -> None:
+        """アトミックに保存する（一時ファイルに書いてから置き換え）"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"rates": self._rates}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"条件の通過率を保存できませんでした: {e}")
@@ -2,11 +2,17 @@
 # -*- coding: utf-8 -*-
 """
 価格収縮（スクイーズ）検出ロジック
+
+判定はdetect_squeeze_panel()で全銘柄まとめて行う（daily_data_collection.pyの
+screen_stock_squeeze()は他の手法と共有する指標をそのまま渡す）。
+calculate_*()は1銘柄分の指標の推移を確認するためのpandas版。
 """
 
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from indicator_engine import PANEL_COLUMNS, IndicatorSet, PricePanel
 
 
 def calculate_bollinger_bands(prices: pd.Series, period: int = 20, std_dev: float = 2.0) -> Dict[str, pd.Series]:
@@ -106,6 +112,130 @@ def calculate_atr(high: pd.Series, low: pd.Series, close: pd.Series, period: int
     return atr
 
 
+def trailing_run_length(mask: np.ndarray) -> np.ndarray:
+    """
+    最後の足から遡って真が続く本数（足 × 銘柄の真偽の配列 → 銘柄ごとの1次元配列）
+    
+    足を逆順にして最初の偽の位置を求めるだけで、銘柄ごとのループは行わない。
+    """
+    if len(mask) == 0:
+        return np.zeros(mask.shape[1:], dtype=np.int64)
+    backwards = mask[::-1]
+    return np.where(backwards.all(axis=0), len(mask), np.argmin(backwards, axis=0))
+
+
+def detect_squeeze_panel(
+    indicators: IndicatorSet,
+    bb_period: int = 20,
+    bb_std_dev: float = 2.0,
+    ema_period: int = 50,
+    atr_period: int = 14,
+    lookback_period: int = 60,
+    bbw_threshold: float = 1.3,
+    deviation_threshold: float = 5.0,
+    atr_threshold: float = 1.3,
+    min_duration: int = 5,
+    max_duration: int = 29
+) -> Dict[str, np.ndarray]:
+    """
+    全銘柄の価格収縮（スクイーズ）をまとめて検出
+    
+    移動平均・標準偏差・EMA・ATRはIndicatorSetの値（他の手法と共有する計算済みの
+    値）を使い、BBW・乖離率は判定に使う直近の足の分だけ求める。継続日数は、
+    最新の足から遡って条件を満たし続けた本数を銘柄方向にまとめて数える。
+    
+    Args:
+        indicators: 全銘柄の指標
+        max_duration: 継続日数を数える最大の本数（最新の足を含む）
+        その他のパラメータ: detect_squeeze()と同じ
+    
+    Returns:
+        'detected'（検出した銘柄のマスク）と、検出結果の各値（'current_bbw'・
+        'bbw_min_60d'・'deviation_from_ema'・'current_atr'・'atr_min_60d'・
+        'duration_days'・'ema'）の銘柄ごとの配列
+    """
+    panel = indicators.panel
+    rows = max(lookback_period, max_duration)
+    close = indicators.series("close")[-rows:]
+    middle = indicators.series("sma", bb_period)[-rows:]
+    std = indicators.series("std", bb_period)[-rows:]
+    ema = indicators.series("ema", ema_period)[-rows:]
+    atr = indicators.series("atr", atr_period)[-rows:]
+    
+    # 値幅ゼロ・NaNの銘柄は比較が偽になり検出されないため、警告を出さない
+    with np.errstate(all='ignore'):
+        upper = middle + (std * bb_std_dev)
+        lower = middle - (std * bb_std_dev)
+        bbw = (upper - lower) / middle * 100
+        deviation = np.abs(close - ema) / ema * 100
+        
+        # 過去lookback_period日間の最小値（NaNは無視）
+        bbw_min = np.fmin.reduce(bbw[-lookback_period:], axis=0)
+        atr_min = np.fmin.reduce(atr[-lookback_period:], axis=0)
+        bbw_limit = bbw_min * bbw_threshold
+        atr_limit = atr_min * atr_threshold
+        
+        # 条件1〜3: BBWが狭い・株価がEMAに近い・ATRが低い
+        detected = (bbw[-1] <= bbw_limit) & (deviation[-1] <= deviation_threshold) & (atr[-1] <= atr_limit)
+        
+        # 継続日数: 最新の足から遡って条件を満たし続けた本数（乖離率は少し緩めに）
+        recent = slice(-max_duration, None)
+        within = ((bbw[recent] <= bbw_limit)
+                  & (deviation[recent] <= deviation_threshold * 1.4)
+                  & (atr[recent] <= atr_limit))
+    duration = trailing_run_length(within)
+    
+    # データ長・最小継続期間を満たす銘柄だけ検出
+    enough = panel.lengths >= max(bb_period, ema_period, atr_period, lookback_period) + min_duration
+    return {
+        'detected': detected & enough & (duration >= min_duration),
+        'current_bbw': bbw[-1],
+        'bbw_min_60d': bbw_min,
+        'deviation_from_ema': deviation[-1],
+        'current_atr': atr[-1],
+        'atr_min_60d': atr_min,
+        'duration_days': duration,
+        'ema': ema[-1],
+    }
+
+
+def squeeze_values(squeeze: Dict[str, np.ndarray], col: int) -> Dict:
+    """detect_squeeze_panel()の結果から1銘柄分の検出結果を取り出す（detect_squeeze()の戻り値と同じ形）"""
+    current_bbw = float(squeeze['current_bbw'][col])
+    bbw_min = float(squeeze['bbw_min_60d'][col])
+    current_atr = float(squeeze['current_atr'][col])
+    atr_min = float(squeeze['atr_min_60d'][col])
+    return {
+        'current_bbw': current_bbw,
+        'bbw_min_60d': bbw_min,
+        'bbw_ratio': current_bbw / bbw_min if bbw_min > 0 else None,
+        'deviation_from_ema': float(squeeze['deviation_from_ema'][col]),
+        'current_atr': current_atr,
+        'atr_min_60d': atr_min,
+        'atr_ratio': current_atr / atr_min if atr_min > 0 else None,
+        'duration_days': int(squeeze['duration_days'][col]),
+        'detected': True
+    }
+
+
+def build_panel(series: List[Tuple[Sequence, Sequence, Sequence]]) -> PricePanel:
+    """
+    (終値, 高値, 安値) の並びから、最新の足を揃えたパネルを作る（日付の無いデータ向け）
+    
+    列名は並びの位置（"0", "1", ...）、日付はNaTになる。
+    """
+    lengths = np.array([len(close) for close, _, _ in series], dtype=np.int64)
+    bars = int(lengths.max()) if len(series) else 0
+    columns = {name: np.full((bars, len(series)), np.nan) for name in PANEL_COLUMNS}
+    for i, (close, high, low) in enumerate(series):
+        start = bars - lengths[i]
+        columns['Close'][start:, i] = close
+        columns['High'][start:, i] = high
+        columns['Low'][start:, i] = low
+    dates = np.full((bars, len(series)), np.datetime64('NaT', 'ns'), dtype='datetime64[ns]')
+    return PricePanel([str(i) for i in range(len(series))], dates, columns, lengths)
+
+
 def detect_squeeze(
     prices: pd.Series,
     high: pd.Series,
@@ -123,6 +253,8 @@ def detect_squeeze(
     """
     価格収縮（スクイーズ）を検出
     
+    1銘柄だけのパネルでdetect_squeeze_panel()を呼ぶ。
+    
     Args:
         prices: 終値のSeries（過去100日分以上）
         high: 高値のSeries
@@ -140,64 +272,18 @@ def detect_squeeze(
     Returns:
         検出結果の辞書、または None
     """
-    # データ長チェック
-    if len(prices) < max(bb_period, ema_period, atr_period, lookback_period) + min_duration:
-        return None
-    
-    # 各指標を計算
-    bbw = calculate_bbw(prices, bb_period, bb_std_dev)
-    deviation = calculate_deviation_from_ema(prices, ema_period)
-    atr = calculate_atr(high, low, prices, atr_period)
-    
-    # 最新の値を取得
-    current_bbw = bbw.iloc[-1]
-    current_deviation = deviation.iloc[-1]
-    current_atr = atr.iloc[-1]
-    
-    # 過去lookback_period日間の最小値を計算
-    bbw_min = bbw.iloc[-lookback_period:].min()
-    atr_min = atr.iloc[-lookback_period:].min()
-    
-    # 条件1: BBWが狭い
-    bbw_condition = current_bbw <= bbw_min * bbw_threshold
-    
-    # 条件2: 株価がEMAに近い
-    deviation_condition = current_deviation <= deviation_threshold
-    
-    # 条件3: ATRが低い
-    atr_condition = current_atr <= atr_min * atr_threshold
-    
-    # すべての条件を満たすか確認
-    if not (bbw_condition and deviation_condition and atr_condition):
-        return None
-    
-    # 継続日数を計算
-    duration = 0
-    for i in range(1, min(len(prices), 30)):  # 最大30日まで遡る
-        idx = -i
-        if (bbw.iloc[idx] <= bbw_min * bbw_threshold and
-            deviation.iloc[idx] <= deviation_threshold * 1.4 and  # 少し緩めに
-            atr.iloc[idx] <= atr_min * atr_threshold):
-            duration += 1
-        else:
-            break
-    
-    # 最小継続期間を満たすか確認
-    if duration < min_duration:
+    panel = build_panel([(np.asarray(prices, dtype=np.float64),
+                          np.asarray(high, dtype=np.float64),
+                          np.asarray(low, dtype=np.float64))])
+    squeeze = detect_squeeze_panel(
+        IndicatorSet(panel),
+        bb_period, bb_std_dev, ema_period, atr_period,
+        lookback_period, bbw_threshold, deviation_threshold,
+        atr_threshold, min_duration
+    )
+    if not squeeze['detected'][0]:
         return None
-    
-    # 検出結果を返す
-    return {
-        'current_bbw': float(current_bbw),
-        'bbw_min_60d': float(bbw_min),
-        'bbw_ratio': float(current_bbw / bbw_min) if bbw_min > 0 else None,
-        'deviation_from_ema': float(current_deviation),
-        'current_atr': float(current_atr),
-        'atr_min_60d': float(atr_min),
-        'atr_ratio': float(current_atr / atr_min) if atr_min > 0 else None,
-        'duration_days': int(duration),
-        'detected': True
-    }
+    return squeeze_values(squeeze, 0)
 
 
 def screen_squeeze_stocks(
@@ -215,6 +301,8 @@ def screen_squeeze_stocks(
     """
     複数の銘柄に対してスクイーズ検出を実行
     
+    全銘柄を1つのパネルに並べ、detect_squeeze_panel()で1度にまとめて判定する。
+    
     Args:
         stock_data: 銘柄データのリスト
             各要素は以下のキーを持つ辞書:
@@ -229,33 +317,38 @@ def screen_squeeze_stocks(
     Returns:
         検出された銘柄のリスト
     """
-    detected_stocks = []
-    
+    stocks = []
+    series = []
     for stock in stock_data:
         try:
-            # DataFrameに変換
-            prices = pd.Series(stock['prices'])
-            high = pd.Series(stock['high'])
-            low = pd.Series(stock['low'])
-            
-            # スクイーズ検出
-            result = detect_squeeze(
-                prices, high, low,
-                bb_period, bb_std_dev, ema_period, atr_period,
-                lookback_period, bbw_threshold, deviation_threshold,
-                atr_threshold, min_duration
-            )
-            
-            if result:
-                detected_stocks.append({
-                    'code': stock['code'],
-                    'name': stock['name'],
-                    'market': stock['market'],
-                    **result
-                })
+            close = np.asarray(stock['prices'], dtype=np.float64)
+            high = np.asarray(stock['high'], dtype=np.float64)
+            low = np.asarray(stock['low'], dtype=np.float64)
+            if not (len(close) == len(high) == len(low)):
+                raise ValueError(f"終値・高値・安値の本数が一致しません ({len(close)}, {len(high)}, {len(low)})")
         except Exception as e:
             print(f"Error processing {stock.get('code', 'unknown')}: {e}")
             continue
+        stocks.append(stock)
+        series.append((close, high, low))
+    if not stocks:
+        return []
+    
+    squeeze = detect_squeeze_panel(
+        IndicatorSet(build_panel(series)),
+        bb_period, bb_std_dev, ema_period, atr_period,
+        lookback_period, bbw_threshold, deviation_threshold,
+        atr_threshold, min_duration
+    )
+    detected_stocks = [
+        {
+            'code': stock['code'],
+            'name': stock['name'],
+            'market': stock['market'],
+            **squeeze_values(squeeze, col)
+        }
+        for col, stock in enumerate(stocks) if squeeze['detected'][col]
+    ]
     
     # 継続日数でソート（降順）
     detected_stocks.sort(key=lambda x: x['duration_days'], reverse=True)
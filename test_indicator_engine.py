@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+indicator_engine・indicator_stateのEMA/ATRとpandasの一致テスト（欠損の足を含む）と、
+指標のメモ（IndicatorMemo）の使い回しのテスト
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from indicator_engine import ema, atr, IndicatorMemo, compute_indicators
+from indicator_state import IndicatorState, EMA_SPANS, ATR_PERIOD
+from price_fixtures import make_prices, stack_column
+
+
+def make_panel(bars=300, stocks=40):
+    """乱数の高値・安値・終値（足 × 銘柄、途中・先頭にNaNの足を含む）"""
+    frames = [make_prices(seed, bars, missing=0.08) for seed in range(stocks)]
+    high, low, close = (stack_column(frames, name) for name in ('High', 'Low', 'Close'))
+    for values in (close, high, low):
+        values[:25, :4] = np.nan  # 上場直後の欠損
+        values[100:120, 5] = np.nan  # 長い欠損
+    return high, low, close
+
+
+def pandas_atr(high, low, close, period):
+    """従来のpandasでのATR（squeeze_detectionの旧実装と同じ）"""
+    high, low, close = pd.Series(high), pd.Series(low), pd.Series(close)
+    tr = pd.concat([
+        high - low,
+        (high - close.shift()).abs(),
+        (low - close.shift()).abs(),
+    ], axis=1).max(axis=1)
+    return tr.ewm(span=period, adjust=False).mean().values
+
+
+def test_ema_matches_pandas_with_nan():
+    """EMAがpandasのewm(adjust=False)と一致（NaNの間は前の値の重みが減衰）"""
+    _, _, close = make_panel()
+    for span in EMA_SPANS + (ATR_PERIOD,):
+        expected = pd.DataFrame(close).ewm(span=span, adjust=False).mean().values
+        actual = ema(close, span)
+        assert np.array_equal(np.isnan(actual), np.isnan(expected))
+        assert np.nanmax(np.abs(actual - expected)) == 0, span
+
+
+def test_atr_matches_pandas_with_nan():
+    """ATRがpandasで計算した真の値幅のEMAと一致"""
+    high, low, close = make_panel()
+    actual = atr(high, low, close, ATR_PERIOD)
+    for col in range(close.shape[1]):
+        expected = pandas_atr(high[:, col], low[:, col], close[:, col], ATR_PERIOD)
+        np.testing.assert_allclose(actual[:, col], expected, rtol=1e-12, atol=0, equal_nan=True)
+
+
+def test_state_matches_engine_with_nan():
+    """1本ずつ追加した増分状態のEMA/ATRが全期間の計算と一致"""
+    high, low, close = make_panel(stocks=12)
+    dates = np.arange(len(close))
+    ema_values = {span: ema(close, span) for span in EMA_SPANS}
+    atr_values = atr(high, low, close, ATR_PERIOD)
+    for col in range(close.shape[1]):
+        state = IndicatorState()
+        for i in range(len(close)):
+            state.push(int(dates[i]), high[i, col], low[i, col], close[i, col])
+            for span in EMA_SPANS:
+                np.testing.assert_equal(state.ema[span], ema_values[span][i, col])
+            np.testing.assert_equal(state.atr, atr_values[i, col])
+
+
+def test_memo_reuses_only_same_length():
+    """足方向の指標は同じ本数の履歴にだけ使い回し、窓の集計は窓に入る本数が同じなら使い回す"""
+    frames = {str(1000 + seed): make_prices(seed, 245) for seed in range(8)}
+    memo = IndicatorMemo()
+    compute_indicators(frames, [("ema", 50), ("window_high", 20), ("window_high", 245)], memo=memo)
+    
+    short = {code: df.tail(200).reset_index(drop=True) for code, df in frames.items()}
+    with_memo = compute_indicators(short, [("ema", 50), ("window_high", 20), ("window_high", 245)], memo=memo)
+    fresh = compute_indicators(short, [("ema", 50), ("window_high", 20), ("window_high", 245)])
+    for key in (("ema", 50), ("window_high", 20), ("window_high", 245)):
+        np.testing.assert_array_equal(with_memo.series(*key), fresh.series(*key), err_msg=str(key))
+    # 20本の最高値だけがヒット（EMA50と245本の最高値は本数が違うので計算し直す）
+    assert memo.stats["hits"] == len(frames)
+    
+    again = compute_indicators(short, [("ema", 50)], memo=memo)
+    np.testing.assert_array_equal(again.series("ema", 50), fresh.series("ema", 50))
+    assert memo.stats["hits"] == 2 * len(frames)
+
+
+def test_memo_evicts_least_recently_used():
+    """件数の上限を超えたら最も長く使われていないものから捨てる"""
+    memo = IndicatorMemo(max_entries=2)
+    values = np.arange(3.0)
+    memo.put('1301', 0, ("ema", 10), 3, values)
+    memo.put('7203', 0, ("ema", 10), 3, values)
+    assert memo.get('1301', 0, ("ema", 10), 3) is values
+    memo.put('9984', 0, ("ema", 10), 3, values)
+    assert memo.get('7203', 0, ("ema", 10), 3) is None
+    assert memo.get('1301', 0, ("ema", 10), 3) is values
+    assert memo.get('9984', 0, ("ema", 10), 3) is values
+    assert memo.get_stats()["entries"] == 2
+    assert memo.stats["evictions"] == 1
+
+
+if __name__ == "__main__":
+    test_ema_matches_pandas_with_nan()
+    test_atr_matches_pandas_with_nan()
+    test_state_matches_engine_with_nan()
+    test_memo_reuses_only_same_length()
+    test_memo_evicts_least_recently_used()
+    print("OK")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+indicator_stateの増分更新と、全期間からの計算（indicator_engine）の一致テスト
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('JQUANTS_REFRESH_TOKEN', 'test')
+
+from daily_data_collection import (
+    HAMMER_RULES, BOLLINGER_RULES, PULLBACK_RULES,
+    HAMMER_LOOKBACK_BARS, BOLLINGER_LOOKBACK_BARS, PULLBACK_LOOKBACK_BARS,
+)
+from indicator_engine import compute_indicators
+from indicator_state import (
+    IndicatorStateStore, EMA_SPANS, EMA_HISTORY, BAND_WINDOW, STOCH_PERIODS, ATR_PERIOD,
+    DEFAULT_HIGH_WINDOWS, STATE_TOLERANCE,
+)
+from price_fixtures import make_prices
+
+K_PERIOD, D_PERIOD = STOCH_PERIODS
+EMA_KEYS = [("ema", span) for span in EMA_SPANS] + [("atr", ATR_PERIOD)]
+LATEST_KEYS = [
+    ("sma", BAND_WINDOW), ("std", BAND_WINDOW),
+    ("stoch_k", K_PERIOD, D_PERIOD), ("stoch_d", K_PERIOD, D_PERIOD),
+] + EMA_KEYS
+WINDOW_KEYS = [(name, window) for window in DEFAULT_HIGH_WINDOWS for name in ("window_high", "bars_since_high")]
+
+
+def state_values(state) -> dict:
+    """状態から求めた最新の足の値（キーはIndicatorSetと同じ）"""
+    values = {
+        ("sma", BAND_WINDOW): state.sma(),
+        ("std", BAND_WINDOW): state.std(),
+        ("stoch_k", K_PERIOD, D_PERIOD): state.stoch_k[-1],
+        ("stoch_d", K_PERIOD, D_PERIOD): state.stoch_d(),
+        ("atr", ATR_PERIOD): state.atr,
+    }
+    for span in EMA_SPANS:
+        values[("ema", span)] = state.ema[span]
+    for window in DEFAULT_HIGH_WINDOWS:
+        values[("window_high", window)] = state.window_high(window)
+        values[("bars_since_high", window)] = state.bars_since_high(window)
+    return values
+
+
+def test_incremental_update_matches_full_computation():
+    """途中までの状態に残りの足を追加した結果が、作り直した状態・全期間の計算と一致する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        incremental = IndicatorStateStore(tmpdir)
+        rebuilt = IndicatorStateStore(os.path.join(tmpdir, 'rebuilt'))
+        for seed in range(20):
+            code = str(1000 + seed)
+            df = make_prices(seed, 300, missing=0.03)
+            incremental.update(code, df.iloc[:200 + seed])
+            state = incremental.update(code, df)
+            expected = state_values(rebuilt.update(code, df))
+            actual = state_values(state)
+            for key in LATEST_KEYS + WINDOW_KEYS:
+                np.testing.assert_allclose(actual[key], expected[key], rtol=1e-12, equal_nan=True, err_msg=str(key))
+            for span in EMA_SPANS:
+                np.testing.assert_array_equal(list(state.ema_history[span]), list(rebuilt.states[code].ema_history[span]))
+            
+            indicators = compute_indicators({code: df})
+            for key in LATEST_KEYS + WINDOW_KEYS:
+                np.testing.assert_allclose(actual[key], indicators.latest(*key)[0], rtol=1e-9, equal_nan=True,
+                                           err_msg=str(key))
+            for span in EMA_SPANS:
+                np.testing.assert_array_equal(list(state.ema_history[span]),
+                                              indicators.series("ema", span)[-EMA_HISTORY:, 0])
+        assert incremental.stats["incremental"] == 20
+        assert incremental.stats["rebuilt"] == 20
+
+
+def test_apply_matches_computation_without_state():
+    """状態を使った一括計算の値が状態なしと一致し、全期間の系列は省略されない"""
+    views = {str(1000 + seed): make_prices(seed, 260 + seed % 7, missing=0.03) for seed in range(30)}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = IndicatorStateStore(tmpdir)
+        for i, (code, df) in enumerate(views.items()):
+            if i % 5 == 0:
+                continue  # 状態の無い銘柄
+            # 一部は古い状態のまま（最新の足と合わないのでパネルで計算される）
+            store.update(code, df.iloc[:-1] if i % 5 == 1 else df)
+        with_state = compute_indicators(views, state_store=store)
+        assert store.stats["applied"] == 18
+        assert store.stats["fallback"] == 12
+    without_state = compute_indicators(views)
+    
+    for key in LATEST_KEYS + WINDOW_KEYS:
+        np.testing.assert_allclose(with_state.latest(*key), without_state.latest(*key), rtol=1e-9,
+                                   equal_nan=True, err_msg=str(key))
+    for col in range(len(views)):
+        for span in EMA_SPANS:
+            for ago in (0, 1, EMA_HISTORY - 1):
+                np.testing.assert_allclose(with_state.value(col, "ema", span, ago=ago),
+                                           without_state.value(col, "ema", span, ago=ago), rtol=1e-12)
+    for key in LATEST_KEYS:
+        full = with_state.series(*key)
+        expected = without_state.series(*key)
+        assert full.shape == expected.shape, key
+        np.testing.assert_allclose(full, expected, rtol=1e-9, equal_nan=True, err_msg=str(key))
+
+
+def test_state_longer_than_window():
+    """
+    取得本数より長い履歴から作った状態でも、判定結果は状態なしと同じになる
+
+    EMA・ATRは窓より前の足の重みがSTATE_TOLERANCE以下の窓でだけ状態の値を使い、
+    その差は相対STATE_TOLERANCE以内。それ以外の指標はパネルの値と一致する。
+    """
+    history = {str(1000 + seed): make_prices(seed, 400, drift=(-0.002, 0.0, 0.002)[seed % 3])
+               for seed in range(200)}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = IndicatorStateStore(tmpdir)
+        for code, df in history.items():
+            store.update(code, df)
+        for bars, rules in ((HAMMER_LOOKBACK_BARS, HAMMER_RULES), (PULLBACK_LOOKBACK_BARS, PULLBACK_RULES),
+                            (BOLLINGER_LOOKBACK_BARS, BOLLINGER_RULES)):
+            views = {code: df.tail(bars).reset_index(drop=True) for code, df in history.items()}
+            with_state = compute_indicators(views, state_store=store)
+            without_state = compute_indicators(views)
+            
+            for key in LATEST_KEYS:
+                np.testing.assert_allclose(with_state.latest(*key), without_state.latest(*key),
+                                           rtol=STATE_TOLERANCE if key in EMA_KEYS else 1e-9,
+                                           equal_nan=True, err_msg=str((bars, key)))
+            for window in (bars, *DEFAULT_HIGH_WINDOWS):
+                for name in ("window_high", "bars_since_high"):
+                    np.testing.assert_array_equal(with_state.latest(name, window), without_state.latest(name, window),
+                                                  err_msg=str((bars, name, window)))
+            assert np.array_equal(rules.evaluate(with_state).mask, rules.evaluate(without_state).mask), rules.name
+        # 245本ならEMA20は状態の値、EMA50と20本のEMA10はパネルで計算した値と完全に一致する
+        hammer = {code: df.tail(HAMMER_LOOKBACK_BARS).reset_index(drop=True) for code, df in history.items()}
+        np.testing.assert_array_equal(compute_indicators(hammer, state_store=store).latest("ema", 20),
+                                      [state.ema[20] for state in store.states.values()])
+        np.testing.assert_array_equal(compute_indicators(hammer, state_store=store).latest("ema", 50),
+                                      compute_indicators(hammer).latest("ema", 50))
+        short = {code: df.tail(BOLLINGER_LOOKBACK_BARS).reset_index(drop=True) for code, df in history.items()}
+        np.testing.assert_array_equal(compute_indicators(short, state_store=store).latest("ema", 10),
+                                      compute_indicators(short).latest("ema", 10))
+
+
+if __name__ == "__main__":
+    test_incremental_update_matches_full_computation()
+    test_apply_matches_computation_without_state()
+    test_state_longer_than_window()
+    print("OK")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+persistent_cacheの保存形式（エンコード・デコード）・旧形式の移行・破損の隔離・保持期間・
+調整イベント・一括取り込み・キャッシュ統合（merge_from）のテスト
+"""
+
+import asyncio
+import os
+import pickle
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('JQUANTS_REFRESH_TOKEN', 'test')
+
+from persistent_cache import (
+    PersistentPriceCache, CACHE_FORMAT, DEFAULT_RETENTION_BARS, _encode_frame, _decode_frame
+)
+
+
+def api_frame() -> pd.DataFrame:
+    """APIの応答と同じ形の3日分（文字列の日付・余分な列・出来高の欠損を含む）"""
+    return pd.DataFrame({
+        'Date': ['2024-01-04', '2024-01-05', '2024-01-09'],
+        'Open': [1234.5678901, 1240.0, np.nan],
+        'High': [1250.1, 1251.0, 1260.0],
+        'Low': [1230.0, 1235.25, 1241.0],
+        'Close': [1245.123456789, 1250.0, 1255.5],
+        'Volume': [1200000.0, np.nan, 3000000000.0],
+        'TurnoverValue': [1.5e9, 2.5e9, 3.5e9],
+    })
+
+
+def test_encode_decode_round_trip():
+    """日付は日単位、四本値はfloat32、出来高はint64（欠損は0）で復元され、余分な列は保存しない"""
+    df = api_frame()
+    columns = _encode_frame(df)
+    assert columns['Date'].dtype == np.int32
+    assert columns['Date'].tolist() == [19726, 19727, 19731]  # 1970-01-01からの日数
+    
+    decoded = _decode_frame(columns)
+    assert list(decoded.columns) == ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+    assert decoded['Date'].dtype == 'datetime64[ns]'
+    assert decoded['Date'].tolist() == [pd.Timestamp('2024-01-04'), pd.Timestamp('2024-01-05'),
+                                        pd.Timestamp('2024-01-09')]
+    for col in ('Open', 'High', 'Low', 'Close'):
+        assert decoded[col].dtype == np.float32
+        np.testing.assert_array_equal(decoded[col].to_numpy(), np.array(df[col], dtype=np.float32))
+    assert decoded['Close'][0] == np.float32(1245.1234)  # float32に丸めて保存
+    assert np.isnan(decoded['Open'][2])
+    assert decoded['Volume'].dtype == np.int64
+    assert decoded['Volume'].tolist() == [1200000, 0, 3000000000]
+    # 保存形式に揃えた値はもう一度変換しても変わらない
+    assert _decode_frame(_encode_frame(decoded)).equals(decoded)
+
+
+def test_missing_volume_is_zero():
+    """出来高の列が無いデータは出来高0として保存する"""
+    decoded = _decode_frame(_encode_frame(api_frame().drop(columns=['Volume'])))
+    assert decoded['Volume'].tolist() == [0, 0, 0]
+
+
+def test_saved_entry_round_trip():
+    """どの圧縮方式でも、set()で保存したエントリが保存形式に揃えた値のまま読み戻せる"""
+    expected = _decode_frame(_encode_frame(api_frame()))
+    for compression in (None, 'zlib', 'lz4'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = PersistentPriceCache(tmpdir, compression=compression)
+            assert asyncio.run(cache.set('7203', '20240104', '20240109', api_frame()))
+            entry = PersistentPriceCache(tmpdir).get_entry('7203')
+            assert entry is not None, compression
+            assert entry['df'].equals(expected), compression
+            assert entry['last_date'] == '20240109'
+
+
+def rewrite_entry(cache: PersistentPriceCache, stock_code: str, edit) -> None:
+    """保存済みのファイルの中身（辞書）をedit()で書き換える"""
+    path = cache._get_cache_path(stock_code)
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    edit(data)
+    with open(path, 'wb') as f:
+        pickle.dump(data, f)
+
+
+def test_migrate_legacy_formats():
+    """旧形式は通常の読み込みでは使わず、移行で現行形式に書き直す（2回目はマーカーで飛ばす）"""
+    df = api_frame()
+    legacy = {
+        'frame': df,                                              # DataFrameのみ
+        'dict': {'df': df, 'last_date': '20240109'},              # {'df', 'last_date'}
+        'v1': {'format': CACHE_FORMAT, 'last_date': '20240109',   # チェックサムなしのコンパクト形式
+               'compression': None, 'blob': pickle.dumps(_encode_frame(df))},
+    }
+    expected = _decode_frame(_encode_frame(df))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PersistentPriceCache(tmpdir)
+        for code, data in legacy.items():
+            with open(cache._get_cache_path(code), 'wb') as f:
+                pickle.dump(data, f)
+            assert cache.get_entry(code) is None
+        assert cache.corruption_stats['outdated'] == len(legacy)
+        assert cache.repair_queue == {}
+        
+        stats = cache.migrate_cache_format()
+        assert (stats['files'], stats['converted'], stats['failed']) == (3, 3, 0)
+        migrated = PersistentPriceCache(tmpdir)
+        for code in legacy:
+            entry = migrated.get_entry(code)
+            assert entry['df'].equals(expected), code
+            assert entry['last_date'] == '20240109', code
+        assert migrated.migrate_cache_format()['files'] == 0
+
+
+def test_malformed_entries_are_quarantined():
+    """本体・メタ情報の欠けたファイルやチェックサム不一致は、例外にせず隔離して修復待ちにする"""
+    cases = {
+        'no_blob': ("schema", lambda data: data.pop('blob')),
+        'str_blob': ("schema", lambda data: data.update(blob='broken')),
+        'no_meta': ("schema", lambda data: data.pop('meta')),
+        'no_last_date': ("schema", lambda data: data.pop('last_date')),
+        'bad_checksum': ("checksum", lambda data: data.update(checksum=data['checksum'] + 1)),
+    }
+    for name, (reason, edit) in cases.items():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = PersistentPriceCache(tmpdir)
+            asyncio.run(cache.set('7203', '20240104', '20240109', api_frame()))
+            rewrite_entry(cache, '7203', edit)
+            
+            reader = PersistentPriceCache(tmpdir)
+            assert reader.get_entry('7203') is None, name
+            assert reader.corruption_stats[reason] == 1, name
+            assert reader.corruption_stats["quarantined"] == 1, name
+            assert reader.repair_queue == {'7203': reason}, name
+            assert not reader._get_cache_path('7203').exists(), name
+            assert (reader.quarantine_dir / '7203.pkl').exists(), name
+
+
+def test_repair_refetches_quarantined_code():
+    """隔離した銘柄は次の要求で全期間を取り直し、修復の成否を数えて修復待ちから外す"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PersistentPriceCache(tmpdir)
+        asyncio.run(cache.set('7203', '20240104', '20240109', api_frame()))
+        asyncio.run(cache.set('6758', '20240104', '20240109', api_frame()))
+        for code in ('7203', '6758'):
+            rewrite_entry(cache, code, lambda data: data.pop('blob'))
+            assert cache.get_entry(code) is None
+        assert set(PersistentPriceCache(tmpdir).repair_queue) == {'7203', '6758'}
+        
+        fetch = RecordingFetch(daily_frame(3))
+        df = asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240108', fetch))
+        assert df['Close'].tolist() == [1000.0, 1001.0, 1002.0]
+        assert fetch.calls == [('20240104', '20240108')]
+        
+        async def nothing(from_date, to_date):
+            return pd.DataFrame()
+        
+        assert asyncio.run(cache.get_or_fetch_incremental('6758', '20240104', '20240108', nothing)).empty
+        assert (cache.corruption_stats["repaired"], cache.corruption_stats["repair_failed"]) == (1, 1)
+        assert cache.repair_queue == {}
+        assert PersistentPriceCache(tmpdir).repair_queue == {}
+
+
+def daily_frame(days: int = 10) -> pd.DataFrame:
+    """2024-01-04から営業日days本分（終値は1000, 1001, ...）"""
+    close = 1000.0 + np.arange(days)
+    return pd.DataFrame({
+        'Date': pd.bdate_range('2024-01-04', periods=days).strftime('%Y-%m-%d'),
+        'Open': close, 'High': close + 5, 'Low': close - 5, 'Close': close,
+        'Volume': np.full(days, 1000.0),
+    })
+
+
+class RecordingFetch:
+    """daily_frame()の指定期間を返し、呼ばれた期間を記録する取得関数"""
+    
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.calls = []
+    
+    async def __call__(self, from_date: str, to_date: str) -> pd.DataFrame:
+        self.calls.append((from_date, to_date))
+        dates = pd.to_datetime(self.df['Date'])
+        return self.df[(dates >= pd.to_datetime(from_date)) & (dates <= pd.to_datetime(to_date))]
+
+
+def test_retention_moves_covered_range_forward():
+    """保持本数で切り詰めたら、それより前の要求は取得済み扱いにせず先頭を取得し直す"""
+    fetch = RecordingFetch(daily_frame(10))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PersistentPriceCache(tmpdir, retention_bars=5)
+        first = asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240117', fetch, max_age_days=100000))
+        assert len(first) == 10
+        entry = cache.get_entry('7203')
+        assert len(entry['df']) == 5
+        assert entry['meta']['covered_from'] == '20240111'  # 保持した先頭の足
+        
+        again = asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240117', fetch, max_age_days=100000))
+        assert fetch.calls[-1] == ('20240104', '20240110')  # 切り詰めた先頭だけを取得
+        assert again['Close'].tolist() == list(range(1000, 1010))
+
+
+def test_retention_with_archive_keeps_covered_range():
+    """退避先があれば切り詰めた期間はアーカイブから返し、APIは呼ばない"""
+    fetch = RecordingFetch(daily_frame(10))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PersistentPriceCache(os.path.join(tmpdir, 'cache'), retention_bars=5,
+                                     archive_dir=os.path.join(tmpdir, 'archive'))
+        asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240117', fetch, max_age_days=100000))
+        assert cache.get_entry('7203')['meta']['covered_from'] == '20240104'
+        calls = len(fetch.calls)
+        again = asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240117', fetch, max_age_days=100000))
+        assert len(fetch.calls) == calls
+        assert again['Close'].tolist() == list(range(1000, 1010))
+
+
+def split_frame() -> pd.DataFrame:
+    """12本のうち11本目が1:2の株式分割（調整前の値と調整係数）"""
+    df = daily_frame(12)
+    df['AdjustmentFactor'] = 1.0
+    df.loc[10, 'AdjustmentFactor'] = 0.5
+    df.loc[10:, ['Open', 'High', 'Low', 'Close']] /= 2
+    return df
+
+
+def test_split_policies():
+    """差分の株式分割は、rescaleならキャッシュを調整し、refetchなら調整せず取り直してミスに数える"""
+    for policy in ("rescale", "refetch"):
+        before = RecordingFetch(split_frame().iloc[:10].assign(AdjustmentFactor=1.0))
+        after = RecordingFetch(split_frame())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = PersistentPriceCache(tmpdir, adjustment_policy=policy)
+            asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240117', before,
+                                                       max_age_days=100000))
+            hits, misses = cache.hits, cache.misses
+            df = asyncio.run(cache.get_or_fetch_incremental('7203', '20240104', '20240119', after,
+                                                            max_age_days=100000))
+            assert df['Close'].tolist() == [(1000 + i) / 2 for i in range(12)], policy
+            stats = cache.adjustment_stats
+            assert stats['events'] == 1, policy
+            if policy == "rescale":
+                assert (stats['rescaled_codes'], stats['refetched_codes']) == (1, 0)
+                assert (cache.hits, cache.misses) == (hits + 1, misses)
+                assert after.calls == [('20240118', '20240119')]
+            else:
+                assert (stats['rescaled_codes'], stats['refetched_codes']) == (0, 1)
+                assert (cache.hits, cache.misses) == (hits, misses + 1)
+                assert after.calls == [('20240118', '20240119'), ('20240104', '20240119')]
+            assert cache.get_entry('7203')['meta']['adjustments'] == [('20240118', 0.5)]
+
+
+def test_import_bulk_skips_files_without_required_columns():
+    """銘柄コード・日付の列が無いファイルは飛ばし、他のファイルは取り込む"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        good = os.path.join(tmpdir, 'good.csv')
+        no_code = os.path.join(tmpdir, 'no_code.csv')
+        no_date = os.path.join(tmpdir, 'no_date.csv')
+        with open(good, 'w') as f:
+            f.write("Date,Code,O,H,L,C,Vo\n2024-01-04,72030,1000,1010,990,1005,1200\n"
+                    "2024-01-05,72030,1005,1020,1000,1015,1300\n")
+        with open(no_code, 'w') as f:
+            f.write("Date,O,H,L,C,Vo\n2024-01-04,1000,1010,990,1005,1200\n")
+        with open(no_date, 'w') as f:
+            f.write("Code,O,H,L,C,Vo\n99840,1000,1010,990,1005,1200\n")
+        cache = PersistentPriceCache(os.path.join(tmpdir, 'cache'))
+        stats = cache.import_bulk([good, no_code, no_date])
+        assert stats['files'] == 3
+        assert stats['failed'] == 2
+        assert (stats['codes'], stats['written']) == (1, 1)
+        entry = cache.get_entry('72030')
+        assert entry['df']['Close'].tolist() == [1005.0, 1015.0]
+        assert entry['df']['Volume'].tolist() == [1200, 1300]
+
+
+def test_merge_from_is_idempotent():
+    """統合は日付の和集合で重なりは新しいエントリを優先し、引数の順序によらず同じで、再実行しても書き込まない"""
+    older = daily_frame(10)                 # 2024-01-04〜01-17、終値1000〜1009
+    newer = daily_frame(15).iloc[5:].copy()  # 2024-01-11〜01-24
+    newer[['Open', 'High', 'Low', 'Close']] += 1000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sources = [os.path.join(tmpdir, name) for name in ('a', 'b')]
+        asyncio.run(PersistentPriceCache(sources[0]).set('7203', '', '', older))
+        asyncio.run(PersistentPriceCache(sources[0]).set('1301', '', '', older))  # aだけ
+        asyncio.run(PersistentPriceCache(sources[1]).set('7203', '', '', newer))
+        
+        targets = [os.path.join(tmpdir, name) for name in ('merged', 'reversed')]
+        stats = PersistentPriceCache(targets[0]).merge_from(sources)
+        assert (stats['codes'], stats['written'], stats['failed']) == (2, 2, 0)
+        PersistentPriceCache(targets[1]).merge_from(sources[::-1])
+        
+        merged = PersistentPriceCache(targets[0])
+        entry = merged.get_entry('7203')
+        assert entry['df']['Close'].tolist() == [1000.0 + i for i in range(5)] + [2005.0 + i for i in range(10)]
+        assert entry['last_date'] == '20240124'
+        assert merged.get_entry('1301')['df']['Close'].tolist() == [1000.0 + i for i in range(10)]
+        reversed_ = PersistentPriceCache(targets[1])
+        for code in ('7203', '1301'):
+            assert reversed_.get_entry(code)['df'].equals(merged.get_entry(code)['df'])
+        
+        stats = PersistentPriceCache(targets[0]).merge_from(sources)
+        assert (stats['written'], stats['unchanged'], stats['rows_added']) == (0, 2, 0)
+        again = PersistentPriceCache(targets[0]).get_entry('7203')
+        assert again['df'].equals(entry['df'])
+        assert again['meta'] == entry['meta']
+
+
+def test_default_retention_matches_screening():
+    """cache_tools.pyの既定の保持本数がスクリーニング実行時の既定値と同じ"""
+    import daily_data_collection
+    assert DEFAULT_RETENTION_BARS == max(daily_data_collection.HAMMER_LOOKBACK_BARS,
+                                         daily_data_collection.BOLLINGER_LOOKBACK_BARS,
+                                         daily_data_collection.PULLBACK_LOOKBACK_BARS)
+
+
+if __name__ == "__main__":
+    test_encode_decode_round_trip()
+    test_missing_volume_is_zero()
+    test_saved_entry_round_trip()
+    test_migrate_legacy_formats()
+    test_malformed_entries_are_quarantined()
+    test_repair_refetches_quarantined_code()
+    test_retention_moves_covered_range_forward()
+    test_retention_with_archive_keeps_covered_range()
+    test_split_policies()
+    test_import_bulk_skips_files_without_required_columns()
+    test_merge_from_is_idempotent()
+    test_default_retention_matches_screening()
+    print("OK")
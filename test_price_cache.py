@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+price_cacheのメモリキャッシュの期間拡張（取得元の書き換え・拡張中の破棄）のテスト
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from persistent_cache import PersistentPriceCache
+from price_cache import PriceDataCache
+
+
+def api_frame(days: int, split_at: int = None) -> pd.DataFrame:
+    """2024-01-04から営業日days本分の調整前の株価（終値は1000, 1001, ...、split_at本目で1:2の分割）"""
+    close = 1000.0 + np.arange(days)
+    factor = np.ones(days)
+    if split_at is not None:
+        close[split_at:] /= 2
+        factor[split_at] = 0.5
+    return pd.DataFrame({
+        'Date': pd.bdate_range('2024-01-04', periods=days).strftime('%Y-%m-%d'),
+        'Open': close, 'High': close + 5, 'Low': close - 5, 'Close': close,
+        'Volume': np.full(days, 1000.0),
+        'AdjustmentFactor': factor,
+    })
+
+
+class RecordingFetch:
+    """株価の指定期間を返し、呼ばれた期間を記録する取得関数"""
+    
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.calls = []
+    
+    async def __call__(self, from_date: str, to_date: str) -> pd.DataFrame:
+        self.calls.append((from_date, to_date))
+        dates = pd.to_datetime(self.df['Date'])
+        return self.df[(dates >= pd.to_datetime(from_date)) & (dates <= pd.to_datetime(to_date))]
+
+
+def test_rewritten_history_is_not_joined():
+    """末尾の差分で株式分割を調整したら、メモリキャッシュも調整後の全期間に作り直す"""
+    api = RecordingFetch(api_frame(10))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        persistent = PersistentPriceCache(tmpdir)
+        memory = PriceDataCache()
+        
+        def fetch(from_date, to_date):
+            return persistent.get_or_fetch_incremental('7203', from_date, to_date, api, max_age_days=100000)
+        
+        async def view(end_date):
+            return await memory.get_or_fetch_view('7203', '20240104', end_date, fetch,
+                                                  version_func=persistent.rewritten_at)
+        
+        before = asyncio.run(view('20240117'))
+        assert before['Close'].tolist() == [1000.0 + i for i in range(10)]
+        
+        api.df = api_frame(12, split_at=10)
+        after = asyncio.run(view('20240119'))
+        expected = [(1000.0 + i) / 2 for i in range(12)]
+        assert after['Close'].tolist() == expected
+        # 取り直しは永続キャッシュから返り、APIは末尾の差分だけ
+        assert api.calls[1:] == [('20240118', '20240119')]
+        assert memory.get_stats()['invalidated_count'] == 1
+        # 作り直した期間はそのまま切り出しで返る
+        again = asyncio.run(view('20240119'))
+        assert again['Close'].tolist() == expected
+        assert len(api.calls) == 2
+
+
+def test_eviction_during_extension_does_not_refetch():
+    """期間の拡張中に上限で破棄されても、取得済みの行から返し、要求期間を取り直さない"""
+    fetch = RecordingFetch(api_frame(12).drop(columns=['AdjustmentFactor']))
+    memory = PriceDataCache()
+    first = asyncio.run(memory.get_or_fetch('7203', '20240104', '20240117', fetch))
+    assert len(first) == 10
+    memory.max_bytes = memory.get_stats()['bytes']  # 広げたら上限を超える
+    
+    extended = asyncio.run(memory.get_or_fetch('7203', '20240110', '20240119', fetch))
+    assert fetch.calls == [('20240104', '20240117'), ('20240118', '20240119')]
+    assert memory.get_stats()['cache_size'] == 0
+    assert extended['Close'].tolist() == [1000.0 + i for i in range(4, 12)]
+    assert extended['Date'].iloc[0] == pd.Timestamp('2024-01-10')
+
+
+if __name__ == "__main__":
+    test_rewritten_history_is_not_joined()
+    test_eviction_during_extension_does_not_refetch()
+    print("OK")
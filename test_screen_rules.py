@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+screen_rulesの条件評価と、従来の銘柄ごとの判定（Pythonのfloatでの逐次判定）の一致テスト
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('JQUANTS_REFRESH_TOKEN', 'test')
+
+from daily_data_collection import (
+    HAMMER_RULES, BOLLINGER_RULES, PULLBACK_RULES,
+    PULLBACK_EMA_FILTER, PULLBACK_STOCHASTIC_FILTER,
+)
+from indicator_engine import IndicatorSet, compute_indicators
+from price_fixtures import make_prices
+
+
+def universe_prices(seed: int) -> pd.DataFrame:
+    """乱数の四本値（上昇・横ばい・下落を混ぜ、一部は最新の足を下髭・急騰の形にする）"""
+    df = make_prices(seed, drift=(-0.004, 0.0, 0.003)[seed % 3])
+    last = df.index[-1]
+    if seed % 5 == 0:
+        # 下髭の長い足
+        df.loc[last, 'Low'] = min(df.loc[last, 'Open'], df.loc[last, 'Close']) * 0.9
+        df.loc[last, 'Close'] = df.loc[last, 'High'] * 0.999
+    if seed % 7 == 0:
+        df.loc[last, 'Close'] *= 1.2
+        df.loc[last, 'High'] = max(df.loc[last, 'High'], df.loc[last, 'Close'])
+    return df
+
+
+def build_indicators(stocks: int = 600) -> IndicatorSet:
+    return compute_indicators({str(1000 + i): universe_prices(i) for i in range(stocks)})
+
+
+def last(indicators: IndicatorSet, name: str, col: int) -> float:
+    return float(indicators.series(name)[-1, col])
+
+
+def hammer_reference(indicators: IndicatorSet, col: int, counts: dict) -> bool:
+    """従来のscreen_stock_breakout()の判定"""
+    open_p, high_p, low_p, close_p = (last(indicators, name, col) for name in ("open", "high", "low", "close"))
+    ema50 = indicators.latest("ema", 50)[col]
+    if any(math.isnan(v) for v in (open_p, high_p, low_p, close_p, ema50)) or close_p <= 0:
+        return False
+    year_high = indicators.latest("window_high", indicators.panel.bars)[col]
+    if math.isnan(year_high) or year_high <= 0:
+        return False
+    if (year_high - close_p) / year_high * 100 < 20.0:
+        return False
+    counts["passed_bottom_zone"] += 1
+    stoch_k = indicators.latest("stoch_k", 14, 3)[col]
+    if math.isnan(stoch_k) or stoch_k > 20.0:
+        return False
+    counts["passed_stochastic"] += 1
+    ema_deviation_pct = (ema50 - close_p) / ema50 * 100 if ema50 > 0 else 0
+    if ema_deviation_pct < 5.0:
+        return False
+    counts["passed_ema_deviation"] += 1
+    total_range = high_p - low_p
+    body = abs(close_p - open_p)
+    lower_shadow = min(open_p, close_p) - low_p
+    if total_range <= 0:
+        return False
+    lower_shadow_ratio = lower_shadow / total_range * 100
+    shadow_to_body = lower_shadow / body if body > 0 else 999.9
+    if lower_shadow_ratio < 45.0:
+        return False
+    counts["passed_shadow_ratio"] += 1
+    if body > 0 and shadow_to_body < 1.0:
+        return False
+    counts["passed_shadow_body"] += 1
+    if (close_p - low_p) / total_range < 0.7:
+        return False
+    counts["passed_close_position"] += 1
+    if close_p < open_p and lower_shadow_ratio < 60.0:
+        return False
+    counts["passed_bullish"] += 1
+    return True
+
+
+def bollinger_reference(indicators: IndicatorSet, col: int, counts: dict) -> bool:
+    """従来のscreen_stock_bollinger_band()の判定"""
+    sma20 = indicators.latest("sma", 20)[col]
+    std20 = indicators.latest("std", 20)[col]
+    close = last(indicators, "close", col)
+    if close >= sma20 + std20 * 3 or close <= sma20 - std20 * 3:
+        counts["touched"] += 1
+        return True
+    return False
+
+
+def pullback_reference(indicators: IndicatorSet, col: int, counts: dict) -> bool:
+    """従来のscreen_stock_200day_pullback()の判定"""
+    ema_now = {span: indicators.latest("ema", span)[col] for span in (10, 20, 50)}
+    high_200d = indicators.latest("window_high", 200)[col]
+    current_price = last(indicators, "close", col)
+    if int(indicators.latest("bars_since_high", 200)[col]) > 60:
+        return False
+    counts["recent_high"] += 1
+    pullback_pct = (high_200d - current_price) / high_200d * 100
+    if not 5 <= pullback_pct <= 30:
+        return False
+    counts["within_30pct"] += 1
+    low_price, high_price = last(indicators, "low", col), last(indicators, "high", col)
+    touched = []
+    for span in (10, 20, 50):
+        if low_price <= ema_now[span] <= high_price and current_price >= ema_now[span]:
+            touched.append(f"{span}EMA")
+            counts[f"ema{span}_touch"] += 1
+    if not touched:
+        return False
+    counts["any_ema_touch"] += 1
+    if PULLBACK_EMA_FILTER != "all" and PULLBACK_EMA_FILTER[:-3].upper() + "EMA" not in touched:
+        return False
+    if PULLBACK_STOCHASTIC_FILTER and indicators.latest("stoch_k", 14, 3)[col] > 20:
+        return False
+    ema50_ago = indicators.value(col, "ema", 50, ago=19).item()
+    rise_pct = (ema_now[50] - ema50_ago) / ema50_ago * 100 if ema50_ago > 0 else 0
+    if rise_pct < 3.0:
+        return False
+    counts["ema50_rising"] += 1
+    return True
+
+
+CASES = [
+    (HAMMER_RULES, hammer_reference),
+    (BOLLINGER_RULES, bollinger_reference),
+    (PULLBACK_RULES, pullback_reference),
+]
+
+
+def reference(rules, check, indicators):
+    counts = {condition.name: 0 for condition in rules.conditions if condition.counted}
+    mask = np.array([check(indicators, col, counts) for col in range(len(indicators.panel))])
+    return mask, counts
+
+
+def test_rules_match_per_stock_logic():
+    """全銘柄まとめての評価（並べた順・並べ替えあり）が従来の判定と同じ銘柄を検出する"""
+    indicators = build_indicators()
+    for rules, check in CASES:
+        expected, expected_counts = reference(rules, check, indicators)
+        assert expected.any(), rules.name
+        for ordered in (False, True):
+            result = rules.evaluate(IndicatorSet(indicators.panel), ordered=ordered)
+            assert np.array_equal(result.mask, expected), (rules.name, ordered)
+        # 並べた順に評価すれば条件ごとの通過数も従来の段階的な集計と一致する
+        result = rules.evaluate(IndicatorSet(indicators.panel), ordered=False)
+        assert result.counts == expected_counts, rules.name
+
+
+def test_lazy_subset_matches_full_panel():
+    """残った銘柄だけで指標を計算する評価（遅延計算）が全銘柄分の事前計算と一致する"""
+    indicators = build_indicators(300)
+    for rules, _ in CASES:
+        full = rules.evaluate(indicators.compute_all())
+        lazy = rules.evaluate(IndicatorSet(indicators.panel))
+        assert np.array_equal(full.mask, lazy.mask), rules.name
+        for col in np.flatnonzero(full.mask):
+            assert full.outputs(col) == lazy.outputs(col), rules.name
+
+
+if __name__ == "__main__":
+    test_rules_match_per_stock_logic()
+    test_lazy_subset_matches_full_panel()
+    print("OK")
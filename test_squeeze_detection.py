@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+squeeze_detectionの全銘柄まとめての検出と、従来の銘柄ごとの検出（pandasでの逐次計算）の一致テスト
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from indicator_engine import IndicatorSet
+from price_fixtures import make_prices
+from squeeze_detection import build_panel, detect_squeeze, detect_squeeze_panel, squeeze_values
+
+
+def reference_squeeze(prices, high, low, bb_period=20, bb_std_dev=2.0, ema_period=50, atr_period=14,
+                      lookback_period=60, bbw_threshold=1.3, deviation_threshold=5.0, atr_threshold=1.3,
+                      min_duration=5):
+    """従来のdetect_squeeze()（pandasのrolling/ewmと、継続日数の逐次ループ）"""
+    prices, high, low = pd.Series(prices), pd.Series(high), pd.Series(low)
+    if len(prices) < max(bb_period, ema_period, atr_period, lookback_period) + min_duration:
+        return None
+    middle = prices.rolling(window=bb_period).mean()
+    std = prices.rolling(window=bb_period).std()
+    bbw = ((middle + std * bb_std_dev) - (middle - std * bb_std_dev)) / middle * 100
+    ema = prices.ewm(span=ema_period, adjust=False).mean()
+    deviation = abs(prices - ema) / ema * 100
+    tr = pd.concat([
+        high - low,
+        abs(high - prices.shift(1)),
+        abs(low - prices.shift(1)),
+    ], axis=1).max(axis=1)
+    atr = tr.ewm(span=atr_period, adjust=False).mean()
+    
+    current_bbw, current_deviation, current_atr = bbw.iloc[-1], deviation.iloc[-1], atr.iloc[-1]
+    bbw_min = bbw.iloc[-lookback_period:].min()
+    atr_min = atr.iloc[-lookback_period:].min()
+    if not (current_bbw <= bbw_min * bbw_threshold
+            and current_deviation <= deviation_threshold
+            and current_atr <= atr_min * atr_threshold):
+        return None
+    duration = 0
+    for i in range(1, min(len(prices), 30)):
+        idx = -i
+        if (bbw.iloc[idx] <= bbw_min * bbw_threshold and
+                deviation.iloc[idx] <= deviation_threshold * 1.4 and
+                atr.iloc[idx] <= atr_min * atr_threshold):
+            duration += 1
+        else:
+            break
+    if duration < min_duration:
+        return None
+    return {
+        'current_bbw': float(current_bbw),
+        'bbw_min_60d': float(bbw_min),
+        'bbw_ratio': float(current_bbw / bbw_min) if bbw_min > 0 else None,
+        'deviation_from_ema': float(current_deviation),
+        'current_atr': float(current_atr),
+        'atr_min_60d': float(atr_min),
+        'atr_ratio': float(current_atr / atr_min) if atr_min > 0 else None,
+        'duration_days': int(duration),
+        'detected': True
+    }
+
+
+def make_series(seed: int):
+    """乱数の(終値, 高値, 安値)。多くは末尾の値動きを徐々に小さくして収縮させる"""
+    rng = np.random.default_rng(seed)
+    bars = int(rng.integers(60, 200))
+    volatility = np.full(bars, 0.02)
+    if seed % 4:
+        tail = int(rng.integers(10, 40))
+        volatility[-tail:] = np.linspace(0.02, rng.uniform(0.001, 0.006), tail)
+    df = make_prices(seed, bars, volatility=volatility)
+    return tuple(df[name].to_numpy(dtype=np.float64) for name in ('Close', 'High', 'Low'))
+
+
+def assert_same_result(actual, expected, label):
+    assert (actual is None) == (expected is None), label
+    if expected is None:
+        return
+    assert actual['duration_days'] == expected['duration_days'], label
+    for key, value in expected.items():
+        if isinstance(value, float):
+            np.testing.assert_allclose(actual[key], value, rtol=1e-9, err_msg=f"{label} {key}")
+
+
+def test_detect_squeeze_matches_reference():
+    """1銘柄ずつの検出結果（検出の有無・継続日数・各値）が従来の実装と一致する"""
+    detected = 0
+    for seed in range(300):
+        close, high, low = make_series(seed)
+        expected = reference_squeeze(close, high, low)
+        assert_same_result(detect_squeeze(pd.Series(close), pd.Series(high), pd.Series(low)), expected, seed)
+        detected += expected is not None
+    assert 0 < detected < 300
+
+
+def test_panel_matches_reference():
+    """長さの異なる銘柄をまとめたパネルでの検出が、銘柄ごとの従来の検出と一致する"""
+    series = [make_series(seed) for seed in range(300)]
+    squeeze = detect_squeeze_panel(IndicatorSet(build_panel(series)))
+    for col, (close, high, low) in enumerate(series):
+        expected = reference_squeeze(close, high, low)
+        actual = squeeze_values(squeeze, col) if squeeze['detected'][col] else None
+        assert_same_result(actual, expected, col)
+
+
+if __name__ == "__main__":
+    test_detect_squeeze_matches_reference()
+    test_panel_matches_reference()
+    print("OK")
@@ -4,13 +4,96 @@
 安全な日付調整ロジックを提供します。
 """
 
+import json
+import math
 import logging
+from bisect import bisect_right
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Sequence
 import aiohttp
 import pytz
 
 logger = logging.getLogger(__name__)
 
+# 取引カレンダーのキャッシュファイル名（永続キャッシュと同じディレクトリに置く）
+TRADING_CALENDAR_FILE = "trading_calendar.json"
+
+# 取引カレンダーが無いときに本数→暦日数へ換算するための東証の年間営業日数と、
+# 年末年始・ゴールデンウィークなどの連休分の余裕（暦日）
+TRADING_DAYS_PER_YEAR = 245
+HOLIDAY_MARGIN_DAYS = 7
+
+
+def _is_trading_division(day: dict) -> bool:
+    """
+    取引カレンダーの休日区分から営業日かどうかを判定
+    
+    休日区分: 0=非営業日, 1=営業日, 2=東証半日立会日, 3=非営業日（祝日取引あり）
+    """
+    division = day.get("HolDiv") or day.get("HolidayDivision") or day.get("HD")
+    return division in ("1", "2")
+
+
+async def load_trading_calendar(
+    jq_client,
+    session: aiohttp.ClientSession,
+    from_date: datetime,
+    to_date: datetime,
+    cache_dir: str = "~/.cache/stock_prices"
+) -> List[str]:
+    """
+    期間内の取引日一覧を取得（ファイルキャッシュ付き）
+    
+    キャッシュ済みの範囲が要求期間を含んでいればAPIを呼ばない。
+    
+    Args:
+        jq_client: J-Quants クライアント
+        session: aiohttp セッション
+        from_date: 開始日
+        to_date: 終了日
+        cache_dir: カレンダーを保存するディレクトリ
+    
+    Returns:
+        取引日（YYYYMMDD）の昇順リスト、取得できなければ空リスト
+    """
+    from_str = from_date.strftime("%Y%m%d")
+    to_str = to_date.strftime("%Y%m%d")
+    cache_path = Path(cache_dir).expanduser() / TRADING_CALENDAR_FILE
+    
+    cached = None
+    if cache_path.exists():
+        try:
+            cached = json.loads(cache_path.read_text())
+            if cached["from"] <= from_str and cached["to"] >= to_str:
+                days = [d for d in cached["days"] if from_str <= d <= to_str]
+                logger.debug(f"取引カレンダー（キャッシュ）: {from_str}~{to_str} {len(days)}日")
+                return days
+        except Exception as e:
+            logger.warning(f"取引カレンダーキャッシュ読み込みエラー: {e}")
+            cached = None
+    
+    calendar = await jq_client.get_trading_calendar(session, from_str, to_str)
+    if not calendar:
+        logger.warning(f"取引カレンダーの取得に失敗しました: {from_str}~{to_str}")
+        if cached:
+            return [d for d in cached["days"] if from_str <= d <= to_str]
+        return []
+    
+    days = sorted(
+        day.get("Date", "").replace("-", "") or day.get("D", "")
+        for day in calendar if _is_trading_division(day)
+    )
+    
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps({"from": from_str, "to": to_str, "days": days}))
+    except Exception as e:
+        logger.warning(f"取引カレンダーキャッシュ保存エラー: {e}")
+    
+    logger.info(f"📅 取引カレンダー取得: {from_str}~{to_str} ({len(days)}営業日)")
+    return days
+
 
 async def get_latest_trading_day(jq_client, session: aiohttp.ClientSession, base_date: datetime = None) -> datetime:
     """
@@ -111,3 +194,39 @@ def get_date_range_for_screening(end_date: datetime, lookback_days: int) -> tupl
     logger.debug(f"日付範囲: {start_str} ～ {end_str} ({lookback_days}日間)")
     
     return start_str, end_str
+
+
+def get_date_range_for_trading_bars(
+    end_date: datetime,
+    bars: int,
+    trading_days: Optional[Sequence[str]] = None
+) -> tuple:
+    """
+    取引日の本数を指定してスクリーニング用の日付範囲を取得
+    
+    get_date_range_for_screening()は暦日で遡るため、祝日の多い時期ほど
+    取得できる本数が減る（200日指定で実際は約135本）。取引カレンダーから
+    end_dateを含めてちょうどbars本目の取引日を開始日にする。
+    カレンダーが無い・期間が足りない場合は暦日に換算して近似する。
+    
+    Args:
+        end_date: 終了日（取引日）
+        bars: 必要な取引日の本数
+        trading_days: 取引日（YYYYMMDD）の昇順リスト（load_trading_calendar()の戻り値）
+    
+    Returns:
+        (start_str, end_str) のタプル（YYYYMMDD形式）
+    """
+    end_str = end_date.strftime("%Y%m%d")
+    
+    if trading_days:
+        count = bisect_right(trading_days, end_str)
+        # カレンダーがend_dateまで届いていない場合は本数を数えられない
+        if count >= bars and (count < len(trading_days) or trading_days[-1] == end_str):
+            start_str = trading_days[count - bars]
+            logger.debug(f"日付範囲: {start_str} ～ {end_str} ({bars}営業日)")
+            return start_str, end_str
+        logger.debug(f"取引カレンダーで{bars}営業日を数えられないため暦日で近似します")
+    
+    approx_days = math.ceil(bars * 365 / TRADING_DAYS_PER_YEAR) + HOLIDAY_MARGIN_DAYS
+    return get_date_range_for_screening(end_date, approx_days)